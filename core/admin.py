@@ -1,16 +1,75 @@
 from django.contrib import admin
-from .models import Member, Book, Transaction
+from django.db import transaction
+from . import borrowing, covers, holds, loans
+from .models import ArchivedTransaction, Member, Book, Hold, Transaction
 
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = ('title', 'author', 'isbn', 'available_copies', 'total_copies')
     search_fields = ('title', 'isbn')
+    readonly_fields = ('cover_thumbnail',)
+
+    def save_model(self, request, obj, form, change):
+        if 'cover_image_url' in form.changed_data:
+            obj.cover_thumbnail = covers.stored_thumbnail(obj.cover_image_url)
+        if change:
+            loans.save_book(obj, form.initial['total_copies'])  # added copies go to the hold queue first
+        else:
+            super().save_model(request, obj, form, change)
 
 @admin.register(Member)
 class MemberAdmin(admin.ModelAdmin):
-    list_display = ('user', 'membership_id', 'phone_number')
+    list_display = ('user', 'membership_id', 'phone_number', 'active_loans', 'overdue_loans', 'outstanding_fines')
+    list_select_related = ('user',)
+    readonly_fields = Member.UPDATED_IN_PLACE
+    actions = ['settle_fines']
+
+    @admin.action(description="Record payment of all outstanding fines")
+    def settle_fines(self, request, queryset):
+        paid = [member for member in queryset.only('id', 'outstanding_fines')
+                if member.outstanding_fines > 0 and borrowing.pay_fines(member.pk, member.outstanding_fines)]
+        self.message_user(request, f"Recorded fine payments for {len(paid)} member(s).")
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('book', 'member', 'issue_date', 'status', 'fine_amount')
-    list_filter = ('status', 'issue_date')
\ No newline at end of file
+    list_filter = ('status', 'issue_date')
+    list_select_related = ('book', 'member__user')
+    raw_id_fields = ('book', 'member')
+
+    # Deleting an open loan takes it off the member's counters and the dashboard
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            loans.forget_loans(Transaction.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            loans.forget_loans(queryset)
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(ArchivedTransaction)
+class ArchivedTransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'book', 'member', 'issue_date', 'actual_return_date', 'fine_amount')
+    list_select_related = ('book', 'member__user')
+    raw_id_fields = ('book', 'member')
+
+@admin.register(Hold)
+class HoldAdmin(admin.ModelAdmin):
+    list_display = ('book', 'member', 'status', 'created_at', 'ready_until')
+    list_filter = ('status',)
+    list_select_related = ('book', 'member__user')
+    raw_id_fields = ('book', 'member')
+    # A Ready hold has a copy set aside; only core.holds may move it on
+    readonly_fields = ('status', 'ready_until')
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            holds.release_held_copies(Hold.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            holds.release_held_copies(queryset)
+            super().delete_queryset(request, queryset)
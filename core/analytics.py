@@ -0,0 +1,283 @@
+"""
+Precomputed popularity and recommendations.
+
+refresh() folds loans into two summary tables, incrementally: it reads the
+loans after the watermark in AnalyticsState, in id order from both the live
+and archive tables (archived loans keep their ids), and advances the
+watermark in the same transaction as the counts it wrote, so a crashed or
+interrupted run just resumes. Loans issued in the last SETTLE_SECONDS are
+left for the next run, so a loan whose transaction commits after a
+higher-numbered one isn't skipped.
+
+* BorrowCount: loans per book per calendar month and per ISO week, with the
+  book's genre alongside. "Most borrowed this month" and "trending in genre"
+  are each one range scan of an index ordered by count. Weekly rows older
+  than WEEKS_KEPT are dropped.
+* CoBorrow: for each book, the NEIGHBOURS books most often borrowed by the
+  same members. A loan pairs with the last HISTORY_LIMIT distinct books its
+  member borrowed before it. Only the top NEIGHBOURS per book are stored, so
+  a pair that falls out of the list starts again from zero if it comes back;
+  the scores are approximate. refresh(rebuild=True) recomputes everything
+  from the full history.
+
+The job keeps each member's recent books in memory while it runs and loads
+them from the loan tables only the first time a member shows up, so a
+rebuild over millions of loans reads each loan once.
+
+Settings: LIBMGS_ANALYTICS = {'BATCH_SIZE': 50000, 'NEIGHBOURS': 20, 'HISTORY_LIMIT': 20,
+'WEEKS_KEPT': 12, 'SETTLE_SECONDS': 60, 'CACHE_TTL': 300}.
+"""
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import AnalyticsState, ArchivedTransaction, BorrowCount, CoBorrow, Transaction
+
+STATE_PK = 1
+LOAN_COLUMNS = ('id', 'member_id', 'book_id', 'issue_date', 'book__genre')
+# Book fields the popularity lists render.
+BOOK_FIELDS = ('book__id', 'book__title', 'book__author', 'book__genre', 'book__available_copies')
+POPULAR_KEY = 'core:analytics:popular:{}:{}'
+MEMBER_SLICE = 1000
+
+DEFAULTS = {
+    'BATCH_SIZE': 50000,
+    'NEIGHBOURS': 20,
+    'HISTORY_LIMIT': 20,
+    'WEEKS_KEPT': 12,
+    'SETTLE_SECONDS': 60,
+    'CACHE_TTL': 300,
+}
+
+
+def analytics_settings():
+    return {**DEFAULTS, **getattr(settings, 'LIBMGS_ANALYTICS', {})}
+
+
+def month_bucket(day):
+    return day.replace(day=1)
+
+
+def week_bucket(day):
+    return day - timedelta(days=day.weekday())
+
+
+# --- BATCH JOB ---
+
+def _lock_state():
+    state = AnalyticsState.objects.select_for_update().filter(pk=STATE_PK).first()
+    if state is None:
+        AnalyticsState.objects.get_or_create(pk=STATE_PK)
+        state = AnalyticsState.objects.select_for_update().get(pk=STATE_PK)
+    return state
+
+
+def _next_loans(after, settled_before, batch_size):
+    """Up to `batch_size` loans with id > `after` from both tables, in id order, stopping at unsettled ones."""
+    live = Transaction.objects.filter(id__gt=after).order_by('id').values_list(*LOAN_COLUMNS)[:batch_size]
+    archived = ArchivedTransaction.objects.filter(id__gt=after).order_by('id').values_list(*LOAN_COLUMNS)[:batch_size]
+    rows = list(heapq.merge(archived, live))[:batch_size]
+    for i, row in enumerate(rows):
+        if row[3] >= settled_before:
+            return rows[:i]
+    return rows
+
+
+class _Histories:
+    """Each member's last `limit` distinct books, oldest first, as of the loans seen so far."""
+
+    def __init__(self, base, limit):
+        self.base = base  # loans up to this id are loaded from the tables on first use
+        self.upto = base  # and loans up to this one have been added as they were folded
+        self.limit = limit
+        self.books = {}
+
+    def load(self, member_ids):
+        missing = [pk for pk in set(member_ids) if pk not in self.books]
+        for pk in missing:
+            self.books[pk] = []
+        if not self.base:
+            return
+        for i in range(0, len(missing), MEMBER_SLICE):
+            members = missing[i:i + MEMBER_SLICE]
+            rows = heapq.merge(*(
+                model.objects.filter(member_id__in=members, id__lte=self.base)
+                .order_by('id').values_list('id', 'member_id', 'book_id').iterator(chunk_size=5000)
+                for model in (ArchivedTransaction, Transaction)
+            ))
+            for _, member_id, book_id in rows:
+                self.add(member_id, book_id)
+
+    def add(self, member_id, book_id):
+        """Record a loan; returns the member's earlier books, or None if this book is among them."""
+        books = self.books[member_id]
+        if book_id in books:
+            return None
+        earlier = list(books)
+        books.append(book_id)
+        if len(books) > self.limit:
+            del books[0]
+        return earlier
+
+
+def _upsert(model, rows, unique_fields, update_fields):
+    options = {'update_conflicts': True, 'update_fields': update_fields}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = unique_fields  # MySQL's ON DUPLICATE KEY UPDATE takes no target
+    model.objects.bulk_create(rows, batch_size=1000, **options)
+
+
+def _merge_counts(increments, genres):
+    """Add {(book_id, period, bucket): n} to BorrowCount."""
+    existing = {
+        (row.book_id, row.period, row.bucket): row
+        for row in BorrowCount.objects.filter(book_id__in={key[0] for key in increments})
+    }
+    rows = []
+    for key, n in increments.items():
+        row = existing.get(key)
+        book_id, period, bucket = key
+        rows.append(BorrowCount(book_id=book_id, period=period, bucket=bucket, genre=genres[book_id],
+                                count=n + (row.count if row else 0)))
+    _upsert(BorrowCount, rows, unique_fields=['book', 'period', 'bucket'], update_fields=['genre', 'count'])
+
+
+def _merge_pairs(pairs, neighbours):
+    """Add {(book_id, other_id): n} to CoBorrow and keep the top `neighbours` per book."""
+    scores = defaultdict(dict)
+    stored = {}
+    for pk, book_id, other_id, score in (CoBorrow.objects.filter(book_id__in={book for book, _ in pairs})
+                                         .values_list('id', 'book_id', 'other_id', 'score')):
+        scores[book_id][other_id] = score
+        stored[book_id, other_id] = pk
+    for (book_id, other_id), n in pairs.items():
+        scores[book_id][other_id] = scores[book_id].get(other_id, 0) + n
+
+    keep, drop = [], []
+    for book_id, others in scores.items():
+        ranked = sorted(others.items(), key=lambda item: (-item[1], item[0]))
+        for other_id, score in ranked[:neighbours]:
+            if (book_id, other_id) in pairs:
+                keep.append(CoBorrow(book_id=book_id, other_id=other_id, score=score))
+        drop.extend(stored[book_id, other_id] for other_id, _ in ranked[neighbours:]
+                    if (book_id, other_id) in stored)
+    if drop:
+        for i in range(0, len(drop), 1000):
+            CoBorrow.objects.filter(pk__in=drop[i:i + 1000]).delete()
+    _upsert(CoBorrow, keep, unique_fields=['book', 'other'], update_fields=['score'])
+
+
+def _fold(loans, histories, oldest_week):
+    """Turn a batch of loans into BorrowCount and CoBorrow increments."""
+    counts, pairs, genres = Counter(), Counter(), {}
+    histories.load(row[1] for row in loans)
+    for _, member_id, book_id, issue_date, genre in loans:
+        day = timezone.localdate(issue_date)
+        genres[book_id] = genre
+        counts[book_id, 'M', month_bucket(day)] += 1
+        week = week_bucket(day)
+        if week >= oldest_week:
+            counts[book_id, 'W', week] += 1
+        earlier = histories.add(member_id, book_id)
+        for other_id in earlier or ():
+            if other_id != book_id:
+                pairs[book_id, other_id] += 1
+                pairs[other_id, book_id] += 1
+    return counts, pairs, genres
+
+
+def reset():
+    """Empty the summary tables and rewind the watermark."""
+    with transaction.atomic():
+        _lock_state()
+        CoBorrow.objects.all().delete()
+        BorrowCount.objects.all().delete()
+        AnalyticsState.objects.filter(pk=STATE_PK).update(last_transaction_id=0)
+
+
+def refresh(batch_size=None, rebuild=False, limit=None, now=None, progress=None):
+    """
+    Fold every settled loan after the watermark into the summary tables,
+    `batch_size` loans per transaction (stopping after `limit` if given).
+    `progress(processed, watermark)` is called after each batch. Returns the
+    number of loans processed.
+    """
+    conf = analytics_settings()
+    batch_size = batch_size or conf['BATCH_SIZE']
+    now = now or timezone.now()
+    settled_before = now - timedelta(seconds=conf['SETTLE_SECONDS'])
+    oldest_week = week_bucket(timezone.localdate(now)) - timedelta(weeks=conf['WEEKS_KEPT'] - 1)
+    if rebuild:
+        reset()
+
+    histories = None
+    processed = 0
+    while limit is None or processed < limit:
+        with transaction.atomic():
+            state = _lock_state()
+            watermark = state.last_transaction_id
+            if histories is None or histories.upto != watermark:
+                # First batch, or another run moved the watermark: start the member state over.
+                histories = _Histories(watermark, conf['HISTORY_LIMIT'])
+            size = batch_size if limit is None else min(batch_size, limit - processed)
+            loans = _next_loans(watermark, settled_before, size)
+            if not loans:
+                break
+            counts, pairs, genres = _fold(loans, histories, oldest_week)
+            _merge_counts(counts, genres)
+            _merge_pairs(pairs, conf['NEIGHBOURS'])
+            state.last_transaction_id = loans[-1][0]
+            state.save(update_fields=['last_transaction_id', 'updated_at'])
+            histories.upto = state.last_transaction_id
+        processed += len(loans)
+        if progress:
+            progress(processed, state.last_transaction_id)
+
+    BorrowCount.objects.filter(period='W', bucket__lt=oldest_week).delete()
+    return processed
+
+
+# --- READS ---
+
+def most_borrowed(limit=10, period='M', day=None):
+    """BorrowCount rows (with their books) for the busiest books of the current month or week."""
+    day = day or timezone.localdate()
+    bucket = month_bucket(day) if period == 'M' else week_bucket(day)
+    return list(
+        BorrowCount.objects.filter(period=period, bucket=bucket)
+        .select_related('book').only('count', *BOOK_FIELDS).order_by('-count', 'book_id')[:limit]
+    )
+
+
+def trending_in_genre(genre, limit=10, day=None):
+    """This week's most borrowed books in `genre`."""
+    bucket = week_bucket(day or timezone.localdate())
+    return list(
+        BorrowCount.objects.filter(genre=genre, period='W', bucket=bucket)
+        .select_related('book').only('count', *BOOK_FIELDS).order_by('-count', 'book_id')[:limit]
+    )
+
+
+def also_borrowed(book_id, limit=8):
+    """CoBorrow rows (with the other books) for the books most often borrowed alongside `book_id`."""
+    return list(
+        CoBorrow.objects.filter(book_id=book_id)
+        .select_related('other').only('score', 'other__id', 'other__title', 'other__author', 'other__genre',
+                                      'other__available_copies')
+        .order_by('-score', 'other_id')[:limit]
+    )
+
+
+def popular_this_month(limit=6):
+    """most_borrowed() for the catalog front page, cached for CACHE_TTL seconds."""
+    key = POPULAR_KEY.format(month_bucket(timezone.localdate()).isoformat(), limit)
+    rows = cache.get(key)
+    if rows is None:
+        rows = most_borrowed(limit)
+        cache.set(key, rows, analytics_settings()['CACHE_TTL'])
+    return rows
@@ -0,0 +1,92 @@
+"""
+Loan history archival.
+
+Returned loans older than LIBMGS_ARCHIVE['AFTER_DAYS'] move from Transaction
+to the compact ArchivedTransaction table, so the indexes and scans behind
+the active-loan pages cover open loans and recent history only, however many
+years of history there are. archive_loans() takes the oldest returns off
+the (status, actual_return_date) index in batches; each batch copies and
+deletes up to `batch_size` rows in one short transaction, so desks issuing
+and returning meanwhile wait on at most one batch, and since moved rows
+leave the index every batch reads only the rows it moves.
+`manage.py archive_loans` pauses between batches so it can run during
+opening hours.
+
+Archived rows keep their original ids. Member history (merge_history) and
+the transaction export read both tables.
+
+Settings: LIBMGS_ARCHIVE = {'AFTER_DAYS': 365, 'BATCH_SIZE': 1000}.
+"""
+import heapq
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedTransaction, Transaction
+
+ARCHIVE_COLUMNS = (
+    'id', 'book_id', 'member_id', 'issue_date', 'expected_return_date', 'actual_return_date', 'fine_amount',
+)
+
+
+def archive_settings():
+    conf = getattr(settings, 'LIBMGS_ARCHIVE', {})
+    return conf.get('AFTER_DAYS', 365), conf.get('BATCH_SIZE', 1000)
+
+
+def _archived(row):
+    pk, book_id, member_id, issue_date, expected_return_date, actual_return_date, fine_amount = row
+    return ArchivedTransaction(
+        id=pk,
+        book_id=book_id,
+        member_id=member_id,
+        issue_date=issue_date,
+        expected_return_date=timezone.localdate(expected_return_date),
+        actual_return_date=timezone.localdate(actual_return_date),
+        fine_amount=fine_amount,
+    )
+
+
+def archive_batch(before, batch_size=1000):
+    """Move up to `batch_size` of the oldest loans returned before `before` into the archive."""
+    with transaction.atomic():
+        batch = list(
+            Transaction.objects.select_for_update()
+            .filter(status='Returned', actual_return_date__lt=before)
+            .order_by('actual_return_date')
+            .values_list(*ARCHIVE_COLUMNS)[:batch_size]
+        )
+        if batch:
+            ArchivedTransaction.objects.bulk_create([_archived(row) for row in batch])
+            Transaction.objects.filter(pk__in=[row[0] for row in batch]).delete()
+    return len(batch)
+
+
+def archive_loans(days=None, batch_size=None, pause=0.0, limit=None, now=None, progress=None):
+    """
+    Archive every loan returned more than `days` ago, sleeping `pause`
+    seconds between batches and stopping after `limit` rows if given.
+    `progress(moved)` is called after each batch. Returns the rows moved.
+    """
+    default_days, default_batch_size = archive_settings()
+    before = (now or timezone.now()) - timedelta(days=default_days if days is None else days)
+    batch_size = batch_size or default_batch_size
+    moved = 0
+    while limit is None or moved < limit:
+        count = archive_batch(before, batch_size if limit is None else min(batch_size, limit - moved))
+        if not count:
+            break
+        moved += count
+        if progress:
+            progress(moved)
+        if pause:
+            time.sleep(pause)
+    return moved
+
+
+def merge_history(loans, archived):
+    """Interleave a member's loans and archived loans (both newest first) into one list."""
+    return list(heapq.merge(loans, archived, key=lambda loan: loan.issue_date, reverse=True))
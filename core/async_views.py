@@ -0,0 +1,99 @@
+"""
+Native async versions of the read-heavy pages, served under ASGI (see
+libmgs/urls_async.py); the WSGI deployment keeps using core.views.
+
+Queries go through Django's async ORM. Template rendering, which can still
+touch the session or the lazy request.user, happens in one sync_to_async
+call at the end rather than on the event loop.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required, user_passes_test
+from django.shortcuts import redirect, render
+from django.utils import timezone
+
+from . import archive, catalog_cache, identity, search, stats
+from .models import Book, Transaction
+from .pagination import akeyset_paginate
+from .replicas import replica_reads
+from .views import ACTIVE_LOAN_FIELDS, CATALOG_FIELDS, member_holds, member_loans, render_catalog
+
+
+async def _render(request, template_name, context):
+    # The auth decorators already loaded the user asynchronously; hand the same
+    # object to the template so {{ user }} doesn't look it up a second time.
+    request.user = await request.auser()
+    return await sync_to_async(render)(request, template_name, context)
+
+
+async def _fetch(queryset):
+    return [obj async for obj in queryset]
+
+
+@replica_reads
+async def index(request):
+    """Homepage: Display a list of all available books with search."""
+    query = request.GET.get('q')
+    key = await catalog_cache.apage_key(request)
+    entry = await catalog_cache.aget_page(key)
+    if entry is not None:
+        page, books = entry
+    else:
+        if query:
+            # Building the ranked queryset looks up typo candidates, so it runs off the event loop.
+            ranked = await sync_to_async(search.ranked_queryset)(query)
+            page = await akeyset_paginate(request, ranked, ('-score', 'book_id'))
+            books = await search.abooks_for_ids([row['book_id'] for row in page], fields=CATALOG_FIELDS)
+        else:
+            page = await akeyset_paginate(request, Book.objects.only(*CATALOG_FIELDS), ('title', 'id'))
+            books = page.object_list
+        await catalog_cache.aset_page(key, page, books)
+    return await sync_to_async(render_catalog)(request, query, key, page, books, fresh=entry is None)
+
+
+@replica_reads
+@login_required
+async def member_dashboard(request):
+    """User dashboard showing their borrowed books."""
+    user = await request.auser()
+    member = await identity.amember_profile(user)
+    if member is None:
+        # Redirect staff to admin dashboard if they accidentally go here
+        if user.is_staff:
+            return redirect('admin_dashboard')
+        messages.error(request, "You do not have a member profile linked.")
+        return redirect('index')
+
+    loans, archived = member_loans(member)
+    transactions = archive.merge_history(await _fetch(loans), await _fetch(archived))
+    holds = await _fetch(member_holds(member))
+    return await _render(request, 'member_dashboard.html', {'transactions': transactions, 'holds': holds})
+
+
+@replica_reads
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+async def admin_dashboard(request):
+    """Central hub for Librarians to manage the system."""
+    # The summary numbers and the recent activity don't depend on each other: fetch them together.
+    data, recent = await asyncio.gather(
+        stats.aget_dashboard_stats(),
+        _fetch(Transaction.objects.with_related().order_by('-issue_date')[:5]),
+    )
+    return await _render(request, 'admin_dashboard.html', dict(data, recent_transactions=recent))
+
+
+@replica_reads
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+async def all_transactions(request):
+    """Admin view to see active loans."""
+    transactions = Transaction.objects.active().with_related().only(*ACTIVE_LOAN_FIELDS)
+    page = await akeyset_paginate(request, transactions, ('expected_return_date', 'id'), default_size=50)
+    return await _render(request, 'transactions/all_transactions.html', {
+        'transactions': page.object_list,
+        'page': page,
+        'now': timezone.now(),
+    })
@@ -0,0 +1,126 @@
+"""
+Copy availability by ISBN for the circulation desk and kiosks.
+
+Lookups go through a bounded, in-process LRU cache of
+isbn -> (book_id, available_copies, total_copies), with unknown ISBNs cached
+as misses too. Batched lookups fetch every missing ISBN in one query.
+
+Every write path (issue/return, batch circulation, book edits, bulk import)
+drops the affected entries immediately and again after commit; the next poll
+reloads them. Dropping instead of writing the new numbers in keeps a slower
+transaction's count from overwriting a newer one. The cache lives in each
+worker process, so another worker's writes become visible here within TTL
+seconds at most. Counts read from a replica are never cached: a lagging
+replica could put back a count a write has just evicted.
+
+Settings: LIBMGS_AVAILABILITY = {'MAX_ENTRIES': 50000, 'TTL': 10}.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from . import metrics, replicas
+from .models import Book
+
+MAX_BATCH_SIZE = 300
+
+
+def cache_settings():
+    conf = getattr(settings, 'LIBMGS_AVAILABILITY', {})
+    return conf.get('MAX_ENTRIES', 50000), conf.get('TTL', 10)
+
+
+class AvailabilityCache:
+    """Thread-safe LRU with per-entry expiry. Values are (book_id, available, total) or None."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries = OrderedDict()  # isbn -> (expires, value)
+            self._isbns_by_id = {}
+            self.evictions = 0
+
+    def get_many(self, isbns):
+        """Return ({isbn: value} for fresh entries, [isbns to load])."""
+        now = time.monotonic()
+        found, missing = {}, []
+        with self._lock:
+            for isbn in isbns:
+                entry = self._entries.get(isbn)
+                if entry is None or entry[0] < now:
+                    missing.append(isbn)
+                else:
+                    self._entries.move_to_end(isbn)
+                    found[isbn] = entry[1]
+        return found, missing
+
+    def set_many(self, values, evictions):
+        """
+        Store freshly loaded values, unless something was evicted since
+        `evictions` (self.evictions read before the load): the load may then
+        have raced with a write, and serving it once uncached is cheaper than
+        caching a stale count.
+        """
+        max_entries, ttl = cache_settings()
+        expires = time.monotonic() + ttl
+        with self._lock:
+            if self.evictions != evictions:
+                return
+            for isbn, value in values.items():
+                self._entries[isbn] = (expires, value)
+                self._entries.move_to_end(isbn)
+                if value is not None:
+                    self._isbns_by_id[value[0]] = isbn
+            while len(self._entries) > max_entries:
+                isbn, (_, value) = self._entries.popitem(last=False)
+                if value is not None:
+                    self._isbns_by_id.pop(value[0], None)
+
+    def evict(self, isbns=(), book_ids=()):
+        with self._lock:
+            self.evictions += 1
+            isbns = set(isbns)
+            for pk in book_ids:
+                isbn = self._isbns_by_id.pop(pk, None)
+                if isbn is not None:
+                    isbns.add(isbn)
+            for isbn in isbns:
+                entry = self._entries.pop(isbn, None)
+                if entry is not None and entry[1] is not None:
+                    self._isbns_by_id.pop(entry[1][0], None)
+
+
+cache = AvailabilityCache()
+
+
+def invalidate(isbns=(), book_ids=()):
+    """Drop cached availability for these books, now and once the transaction commits."""
+    isbns, book_ids = list(isbns), list(book_ids)
+    cache.evict(isbns, book_ids)
+    transaction.on_commit(lambda: cache.evict(isbns, book_ids))
+
+
+def lookup(isbns):
+    """{isbn: {'available_copies', 'total_copies'} or None} for a list of ISBNs."""
+    evictions = cache.evictions
+    found, missing = cache.get_many(isbns)
+    metrics.registry.increment('libmgs_cache_requests_total', (('cache', 'availability'), ('result', 'hit')), len(found))
+    metrics.registry.increment('libmgs_cache_requests_total', (('cache', 'availability'), ('result', 'miss')), len(missing))
+    if missing:
+        loaded = dict.fromkeys(missing)
+        rows = Book.objects.filter(isbn__in=missing).values_list('isbn', 'id', 'available_copies', 'total_copies')
+        for isbn, pk, available, total in rows:
+            loaded[isbn] = (pk, available, total)
+        if not replicas.served_by_replica():
+            cache.set_many(loaded, evictions)
+        found.update(loaded)
+    return {
+        isbn: None if found[isbn] is None else {'available_copies': found[isbn][1], 'total_copies': found[isbn][2]}
+        for isbn in isbns
+    }
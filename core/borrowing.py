@@ -0,0 +1,195 @@
+"""
+Per-member loan counters and borrowing limits.
+
+Member carries counters so the limits never have to read a member's loans:
+
+* active_loans: open loans.
+* overdue_loans: open loans that were past due when they were last counted
+  (overdue_counted_at). A loan becomes overdue with the clock, not with a
+  write, so each accrue_fines run recounts the members with overdue loans.
+  A return takes its loan off the count only if the loan was due before
+  the member's overdue_counted_at, so the count stays exact between runs.
+* outstanding_fines: fines charged on every loan (accrued so far on open
+  ones, final on returned and archived ones) less fines_paid.
+
+core.loans changes them with F() expressions in the UPDATE that already
+marks the member's loans as changed, so issue and return write the member
+row once, as before. An issue that would break a limit is refused by that
+UPDATE's WHERE clause, which also stops two desks from pushing a member
+past a limit together. An issue costs the same however long the member's
+history is. core.fines keeps outstanding_fines in step as fines accrue.
+
+reconcile() rebuilds the counters from the loan tables, one UPDATE per range
+of members (`manage.py reconcile_member_counters`), for after raw SQL, bulk
+loads or anything else that bypassed core.loans.
+
+Settings: LIBMGS_BORROWING = {'MAX_LOANS': 10, 'MAX_OVERDUE': 0, 'MAX_FINES': '10.00'};
+None turns a limit off. MAX_OVERDUE is how many overdue loans a member may
+have and still borrow.
+"""
+from decimal import Decimal
+from functools import reduce
+from operator import add
+
+from django.conf import settings
+from django.db.models import (
+    Case, Count, DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ArchivedTransaction, Member, Transaction
+
+DEFAULTS = {
+    'MAX_LOANS': 10,
+    'MAX_OVERDUE': 0,
+    'MAX_FINES': '10.00',
+}
+COUNTER_FIELDS = ('active_loans', 'overdue_loans', 'outstanding_fines')
+MONEY = DecimalField(max_digits=10, decimal_places=2)
+
+
+def borrowing_settings():
+    conf = {**DEFAULTS, **getattr(settings, 'LIBMGS_BORROWING', {})}
+    if conf['MAX_FINES'] is not None:
+        conf['MAX_FINES'] = Decimal(str(conf['MAX_FINES']))
+    return conf
+
+
+# --- LIMITS ---
+
+def within_limits():
+    """Filter for members allowed to borrow one more book."""
+    conf = borrowing_settings()
+    q = Q()
+    if conf['MAX_LOANS'] is not None:
+        q &= Q(active_loans__lt=conf['MAX_LOANS'])
+    if conf['MAX_OVERDUE'] is not None:
+        q &= Q(overdue_loans__lte=conf['MAX_OVERDUE'])
+    if conf['MAX_FINES'] is not None:
+        q &= Q(outstanding_fines__lte=conf['MAX_FINES'])
+    return q
+
+
+def limit_problem(member, adding=1):
+    """Why `member` (counters loaded) can't borrow `adding` more books, or None if they can."""
+    conf = borrowing_settings()
+    if conf['MAX_LOANS'] is not None and member.active_loans + adding > conf['MAX_LOANS']:
+        return f"Member already has {member.active_loans} book(s) on loan (limit {conf['MAX_LOANS']})."
+    if conf['MAX_OVERDUE'] is not None and member.overdue_loans > conf['MAX_OVERDUE']:
+        return f"Member has {member.overdue_loans} overdue loan(s); they must be returned first."
+    if conf['MAX_FINES'] is not None and member.outstanding_fines > conf['MAX_FINES']:
+        return f"Member owes {member.outstanding_fines} in fines (limit {conf['MAX_FINES']})."
+    return None
+
+
+# --- COUNTER UPDATES ---
+
+def issued(count):
+    return {'active_loans': F('active_loans') + count}
+
+
+def returned(loans):
+    """
+    Counter changes for one member returning `loans`: [(expected_return_date,
+    fine accrued so far, final fine)]. Counts stop at zero, so loans created
+    behind core.loans' back (drift until the next reconcile) can't block a return.
+    """
+    counted = [Case(When(overdue_counted_at__gt=due, then=Value(1)), default=Value(0), output_field=IntegerField())
+               for due, _, _ in loans]
+    change = sum((Decimal(str(fine)) - Decimal(str(accrued)) for _, accrued, fine in loans), Decimal('0.00'))
+    return {
+        'active_loans': Greatest(F('active_loans') - len(loans), 0),
+        'overdue_loans': Greatest(F('overdue_loans') - reduce(add, counted), 0),
+        'outstanding_fines': F('outstanding_fines') + change,
+    }
+
+
+def update_members(changes, **values):
+    """
+    Apply per-member counter changes ({member_id: {field: expression}}, as
+    from issued()/returned()) and `values` to those members in one UPDATE.
+    """
+    if not changes:
+        return
+    fields = {field for change in changes.values() for field in change}
+    for field in fields:
+        values[field] = Case(
+            *[When(pk=pk, then=change[field]) for pk, change in changes.items() if field in change],
+            default=F(field), output_field=Member._meta.get_field(field),
+        )
+    Member.objects.filter(pk__in=changes).update(**values)
+
+
+def fine_change(loans, amount):
+    """Per-member (OuterRef('pk')) total change from setting fine_amount = `amount` on `loans`."""
+    return Coalesce(Subquery(
+        loans.filter(member_id=OuterRef('pk')).order_by().values('member_id')
+        .annotate(change=Sum(Value(amount, output_field=MONEY) - F('fine_amount'), output_field=MONEY))
+        .values('change')
+    ), Value(Decimal('0.00')), output_field=MONEY)
+
+
+def _loan_count(queryset):
+    return Coalesce(Subquery(
+        queryset.filter(member_id=OuterRef('pk')).order_by().values('member_id')
+        .annotate(n=Count('id')).values('n')
+    ), 0)
+
+
+def _fine_total(model):
+    return Coalesce(Subquery(
+        model.objects.filter(member_id=OuterRef('pk')).order_by().values('member_id')
+        .annotate(total=Sum('fine_amount')).values('total')
+    ), Value(Decimal('0.00')), output_field=MONEY)
+
+
+def count_overdue(now=None):
+    """Recount overdue_loans for every member with an overdue loan (or a nonzero count)."""
+    now = now or timezone.now()
+    overdue = Transaction.objects.overdue(now)
+    return Member.objects.filter(Q(pk__in=overdue.values('member_id')) | Q(overdue_loans__gt=0)).update(
+        overdue_loans=_loan_count(overdue), overdue_counted_at=now,
+    )
+
+
+def pay_fines(member_id, amount):
+    """Record a payment towards a member's fines; False (and nothing recorded) if it's more than they owe."""
+    amount = Decimal(str(amount))
+    return bool(Member.objects.filter(pk=member_id, outstanding_fines__gte=amount).update(
+        outstanding_fines=F('outstanding_fines') - amount, fines_paid=F('fines_paid') + amount,
+    ))
+
+
+# --- RECONCILIATION ---
+
+def reconcile(batch_size=5000, save=True, now=None, progress=None):
+    """
+    Recompute every member's counters from the loan tables, `batch_size`
+    members per statement. Returns how many members' stored counters were
+    wrong; with save=False nothing is written. `progress(checked, drifted)`
+    is called after each batch.
+    """
+    now = now or timezone.now()
+    actual = {
+        'active_loans': _loan_count(Transaction.objects.active()),
+        'overdue_loans': _loan_count(Transaction.objects.overdue(now)),
+        'outstanding_fines': _fine_total(Transaction) + _fine_total(ArchivedTransaction) - F('fines_paid'),
+    }
+    checked = drifted = 0
+    last = 0
+    while True:
+        ids = list(Member.objects.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        members = Member.objects.filter(pk__gte=ids[0], pk__lte=ids[-1])
+        drifted += members.annotate(**{f'actual_{field}': value for field, value in actual.items()}).exclude(
+            **{field: F(f'actual_{field}') for field in COUNTER_FIELDS}
+        ).count()
+        if save:
+            members.update(**actual, overdue_counted_at=now)
+        checked += len(ids)
+        last = ids[-1]
+        if progress:
+            progress(checked, drifted)
+    return drifted
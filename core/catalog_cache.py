@@ -0,0 +1,224 @@
+"""
+Caching for the public catalog (the index view).
+
+Three layers, all in the default Django cache:
+
+* Page entries: the result of one catalog or search page (its books and
+  cursors), keyed by the query string and the catalog *listing version*.
+  The listing version changes only when the set or order of books can
+  change: a book is added or deleted, or its title/author/genre is edited.
+* Card fragments: the rendered HTML of one book's card, keyed by that
+  book's *card version*. Any change to the book, including issue/return
+  moving available_copies, bumps only that book's version.
+* Rendered pages: the whole HTML of a page as an anonymous visitor sees
+  it, keyed by the page key plus the card versions of the books on it.
+
+Versions are never deleted, only replaced, so stale entries simply stop
+being looked up and age out on their TTL. Writers bump versions
+immediately and again after commit, so a reader that re-cached the old
+row in between is not served for long. Versions are timestamps: an entry
+filled from a read replica less than the replica pin window after its
+version changed may hold rows from before the change, so it is kept only
+for that window (see core.replicas).
+
+Settings: LIBMGS_CATALOG_CACHE = {'ENABLED': True, 'TTL': 600}.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from . import metrics, replicas
+from .models import Book
+
+LISTING_VERSION_KEY = 'core:catalog:listing-v'
+CARD_VERSION_KEY = 'core:catalog:card-v:{}'
+PAGE_KEY = 'core:catalog:page:{}:{}'
+HTML_KEY = 'core:catalog:html:{}'
+CARD_KEY = 'core:catalog:card:{}:{}'
+CARD_TEMPLATE = 'catalog/book_card.html'
+
+# Fields a book card renders.
+CARD_FIELDS = ('id', 'title', 'author', 'genre', 'available_copies', 'cover_thumbnail')
+# Fields that decide which books a catalog/search page lists, and in what order.
+LISTING_FIELDS = ('title', 'author', 'genre')
+
+
+def cache_settings():
+    conf = getattr(settings, 'LIBMGS_CATALOG_CACHE', {})
+    return conf.get('ENABLED', True), conf.get('TTL', 600)
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _fill_ttl(versions=()):
+    """TTL for an entry built from rows just read at `versions` (see the module docstring)."""
+    ttl = cache_settings()[1]
+    if versions and replicas.reading_replica():
+        pin_seconds = replicas.replica_settings()[1]
+        if time.time_ns() - max(versions) < pin_seconds * 1_000_000_000:
+            return min(ttl, pin_seconds)
+    return ttl
+
+
+def _count(layer, hits, misses):
+    metrics.registry.increment('libmgs_cache_requests_total', (('cache', layer), ('result', 'hit')), hits)
+    metrics.registry.increment('libmgs_cache_requests_total', (('cache', layer), ('result', 'miss')), misses)
+
+
+# --- VERSIONS ---
+
+def listing_version():
+    version = cache.get(LISTING_VERSION_KEY)
+    if version is None:
+        cache.add(LISTING_VERSION_KEY, _new_version(), timeout=None)
+        version = cache.get(LISTING_VERSION_KEY)
+    return version
+
+
+async def alisting_version():
+    version = await cache.aget(LISTING_VERSION_KEY)
+    if version is None:
+        await cache.aadd(LISTING_VERSION_KEY, _new_version(), timeout=None)
+        version = await cache.aget(LISTING_VERSION_KEY)
+    return version
+
+
+def card_versions(book_ids):
+    """{book_id: version}, creating versions for books that have none yet."""
+    keys = {CARD_VERSION_KEY.format(pk): pk for pk in book_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    missing = {key: _new_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def invalidate_books(book_ids, listing=False):
+    """Drop the cached cards of `book_ids` (and every cached page if `listing`)."""
+    book_ids = list(book_ids)
+
+    def bump():
+        version = _new_version()
+        values = {CARD_VERSION_KEY.format(pk): version for pk in book_ids}
+        if listing:
+            values[LISTING_VERSION_KEY] = version
+        if values:
+            cache.set_many(values, timeout=None)
+
+    bump()
+    transaction.on_commit(bump)
+
+
+# --- PAGES ---
+
+def _query_digest(request):
+    query = '&'.join(f'{k}={v}' for k, v in sorted(request.GET.lists()))
+    return hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+
+
+def page_key(request):
+    """Cache key for the page a request asks for (None when caching is off)."""
+    if not cache_settings()[0]:
+        return None
+    return PAGE_KEY.format(listing_version(), _query_digest(request))
+
+
+def get_page(key):
+    """(page, books) for a page key, or None on a miss."""
+    if key is None:
+        return None
+    entry = cache.get(key)
+    _count('page', entry is not None, entry is None)
+    return entry
+
+
+def set_page(key, page, books):
+    if key is not None:
+        versions = [listing_version()] if replicas.reading_replica() else ()
+        cache.set(key, (page, list(books)), _fill_ttl(versions))
+
+
+# Async counterparts for the async index view.
+
+async def apage_key(request):
+    if not cache_settings()[0]:
+        return None
+    return PAGE_KEY.format(await alisting_version(), _query_digest(request))
+
+
+async def aget_page(key):
+    if key is None:
+        return None
+    entry = await cache.aget(key)
+    _count('page', entry is not None, entry is None)
+    return entry
+
+
+async def aset_page(key, page, books):
+    if key is not None:
+        versions = [await alisting_version()] if replicas.reading_replica() else ()
+        await cache.aset(key, (page, list(books)), _fill_ttl(versions))
+
+
+def html_key(request, key, versions):
+    """
+    Key for the rendered page, or None if this response can't be shared:
+    only anonymous visitors with no pending messages get the same HTML
+    (the logged-in navbar carries a CSRF token).
+    """
+    if key is None or request.user.is_authenticated or len(get_messages(request)):
+        return None
+    raw = f"{key}:{sorted(versions.items())}"
+    return HTML_KEY.format(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+
+
+def get_html(key):
+    if key is None:
+        return None
+    html = cache.get(key)
+    _count('html', html is not None, html is None)
+    return html
+
+
+def set_html(key, response, versions):
+    """Cache a rendered page built from cards at `versions` ({book_id: version})."""
+    if key is not None and response.status_code == 200:
+        versions = [listing_version(), *versions.values()] if replicas.reading_replica() else ()
+        cache.set(key, response.content, _fill_ttl(versions))
+
+
+# --- CARDS ---
+
+def render_cards(books, versions=None, fresh=False):
+    """
+    Rendered card HTML for `books`, in order. Cards come from the fragment
+    cache when their book's version is unchanged; the rest are rendered from
+    `books` if they were just loaded (`fresh`), otherwise re-read in one query.
+    """
+    if not cache_settings()[0]:
+        return [render_to_string(CARD_TEMPLATE, {'book': book}) for book in books]
+
+    if versions is None:
+        versions = card_versions([book.pk for book in books])
+    keys = {book.pk: CARD_KEY.format(book.pk, versions[book.pk]) for book in books}
+    cached = cache.get_many(keys.values())
+    missing = [book for book in books if keys[book.pk] not in cached]
+    _count('card', len(books) - len(missing), len(missing))
+
+    if missing:
+        if not fresh:
+            current = Book.objects.only(*CARD_FIELDS).in_bulk([book.pk for book in missing])
+            missing = [current[book.pk] for book in missing if book.pk in current]
+        rendered = {keys[book.pk]: render_to_string(CARD_TEMPLATE, {'book': book}) for book in missing}
+        cache.set_many(rendered, _fill_ttl([versions[book.pk] for book in missing]))
+        cached.update(rendered)
+    return [cached[keys[book.pk]] for book in books if keys[book.pk] in cached]
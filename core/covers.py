@@ -0,0 +1,261 @@
+"""
+Cover thumbnails.
+
+Catalog pages used to hotlink each book's cover_image_url at full size.
+build_thumbnails() fetches every cover URL once, shrinks it to a fixed-size
+JPEG and writes it to a content-addressed store under ROOT (named by the
+SHA-256 of the thumbnail, so identical covers share one file and a file
+never changes). Book.cover_thumbnail holds the digest, and the templates
+show /covers/<digest>.jpg with lazy loading. Books without one yet show the
+placeholder.
+
+Each URL is fetched once: CoverImage records its digest (or why it failed)
+and sizes, so another book with the same URL reuses it without a fetch, and
+failures aren't retried until asked (--retry-failed). BookForm and the
+catalog import clear a book's thumbnail only when its URL changes.
+
+Fetches and resizing run on a bounded thread pool; database writes stay on
+the calling thread. The fetcher is any callable taking a URL and returning
+bytes (FETCHER), so tests and offline loads can use LocalFetcher.
+
+Thumbnails are served by the cover_thumbnail view with a one-year immutable
+Cache-Control; a front-end server can serve ROOT at /covers/ directly with
+the same header instead. Resizing needs Pillow.
+
+Settings: LIBMGS_COVERS = {'ROOT': BASE_DIR / 'covers', 'SIZE': (240, 360), 'QUALITY': 80,
+'WORKERS': 8, 'TIMEOUT': 10, 'MAX_BYTES': 5 * 1024 * 1024, 'FETCHER': 'core.covers.fetch_url'}.
+"""
+import hashlib
+import io
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from . import catalog_cache
+from .models import Book, CoverImage
+from .pagination import DEFAULT_PAGE_SIZE
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # only needed to build thumbnails, not to serve them
+    Image = ImageOps = None
+
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+BATCH_SIZE = 200  # books looked at per round of fetches
+
+DEFAULTS = {
+    'ROOT': Path(settings.BASE_DIR) / 'covers',
+    'SIZE': (240, 360),
+    'QUALITY': 80,
+    'WORKERS': 8,
+    'TIMEOUT': 10,
+    'MAX_BYTES': 5 * 1024 * 1024,
+    'FETCHER': 'core.covers.fetch_url',
+}
+
+
+def cover_settings():
+    return {**DEFAULTS, **getattr(settings, 'LIBMGS_COVERS', {})}
+
+
+class CoverError(Exception):
+    """A cover couldn't be fetched or isn't a usable image."""
+
+
+# --- FETCHERS ---
+
+def fetch_url(url):
+    """Download a cover over HTTP(S), refusing anything larger than MAX_BYTES."""
+    conf = cover_settings()
+    request = urllib.request.Request(url, headers={'User-Agent': 'LibraryMGS cover fetcher'})
+    try:
+        with urllib.request.urlopen(request, timeout=conf['TIMEOUT']) as response:
+            data = response.read(conf['MAX_BYTES'] + 1)
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        raise CoverError(f"fetch failed: {e}")
+    if len(data) > conf['MAX_BYTES']:
+        raise CoverError(f"larger than {conf['MAX_BYTES']} bytes")
+    return data
+
+
+class LocalFetcher:
+    """Reads each URL's file name from a local directory instead of downloading it."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def __call__(self, url):
+        name = os.path.basename(unquote(urlparse(url).path))
+        try:
+            return (self.directory / name).read_bytes()
+        except OSError:
+            raise CoverError(f"no local file for {url}")
+
+
+def get_fetcher():
+    return import_string(cover_settings()['FETCHER'])
+
+
+# --- STORE ---
+
+def thumbnail_path(digest, root=None):
+    if not DIGEST_RE.match(digest):
+        raise ValueError(f"not a thumbnail digest: {digest!r}")
+    return Path(root or cover_settings()['ROOT']) / digest[:2] / f"{digest}.jpg"
+
+
+def make_thumbnail(data, size, quality):
+    """JPEG bytes of `data` scaled and centre-cropped to exactly `size`."""
+    if Image is None:
+        raise CoverError("Pillow is required to build thumbnails")
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.draft('RGB', size)  # JPEG: decode at a reduced scale when it's much larger
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        thumb = ImageOps.fit(image, size, Image.LANCZOS)
+        out = io.BytesIO()
+        thumb.save(out, 'JPEG', quality=quality, optimize=True, progressive=True)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise CoverError(f"not a usable image: {e}")
+    return out.getvalue()
+
+
+def store(thumbnail, root=None):
+    """Write thumbnail bytes under their digest (once) and return the digest."""
+    digest = hashlib.sha256(thumbnail).hexdigest()
+    path = thumbnail_path(digest, root)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(thumbnail)
+        os.replace(tmp, path)
+    return digest
+
+
+def stored_thumbnail(url):
+    """Digest of an existing thumbnail for `url`, or '' if it still has to be built."""
+    if not url:
+        return ''
+    return CoverImage.objects.filter(source_url=url).values_list('digest', flat=True).first() or ''
+
+
+# --- BUILD ---
+
+def _process(url, fetcher, conf):
+    """Fetch and shrink one URL; runs on the pool, without touching the database."""
+    try:
+        data = fetcher(url)
+        thumbnail = make_thumbnail(data, tuple(conf['SIZE']), conf['QUALITY'])
+        digest = store(thumbnail, conf['ROOT'])
+    except CoverError as e:
+        return CoverImage(source_url=url, error=str(e)[:255])
+    return CoverImage(source_url=url, digest=digest, source_bytes=len(data), thumbnail_bytes=len(thumbnail))
+
+
+def _save_results(results):
+    options = {'update_conflicts': True, 'update_fields': ['digest', 'source_bytes', 'thumbnail_bytes', 'error',
+                                                           'fetched_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        options['unique_fields'] = ['source_url']  # MySQL's ON DUPLICATE KEY UPDATE takes no target
+    CoverImage.objects.bulk_create(results, **options)
+
+
+class BuildResult:
+    def __init__(self):
+        self.books = 0  # books given a thumbnail
+        self.fetched = 0  # URLs fetched and shrunk
+        self.reused = 0  # books whose URL already had a thumbnail
+        self.failed = []  # (url, error)
+
+
+def build_thumbnails(workers=None, fetcher=None, retry_failed=False, limit=None, progress=None):
+    """
+    Give every book with a cover URL and no thumbnail one, fetching each URL
+    at most once (failed URLs only with `retry_failed`). Stops after `limit`
+    books if given. `progress(result)` is called after each batch.
+    """
+    conf = cover_settings()
+    fetcher = fetcher or get_fetcher()
+    result = BuildResult()
+    after = 0
+    with ThreadPoolExecutor(workers or conf['WORKERS']) as pool:
+        while limit is None or result.books < limit:
+            size = BATCH_SIZE if limit is None else min(BATCH_SIZE, limit - result.books)
+            pending = list(
+                Book.objects.filter(pk__gt=after, cover_thumbnail='').exclude(cover_image_url__isnull=True)
+                .exclude(cover_image_url='').order_by('pk').values_list('pk', 'cover_image_url')[:size]
+            )
+            if not pending:
+                break
+            after = pending[-1][0]
+            books = defaultdict(list)
+            for pk, url in pending:
+                books[url].append(pk)
+
+            known = {row.source_url: row for row in CoverImage.objects.filter(source_url__in=books)}
+            fetch = [url for url in books if url not in known or (retry_failed and known[url].error)]
+            fetched = set(fetch)
+            results = list(pool.map(lambda url: _process(url, fetcher, conf), fetch))
+            if results:
+                _save_results(results)
+            result.fetched += len(results)
+            for row in results:
+                known[row.source_url] = row
+                if row.error:
+                    result.failed.append((row.source_url, row.error))
+
+            done = []
+            for url, ids in books.items():
+                row = known.get(url)
+                if row is None or not row.digest:
+                    continue
+                # Only books still showing this URL: an edit meanwhile cleared the thumbnail for a new one.
+                updated = Book.objects.filter(pk__in=ids, cover_image_url=url, cover_thumbnail='').update(
+                    cover_thumbnail=row.digest)
+                if url not in fetched:
+                    result.reused += updated
+                result.books += updated
+                done.extend(ids)
+            # update() skips the signals that refresh cached catalog cards.
+            catalog_cache.invalidate_books(done, listing=False)
+            if progress:
+                progress(result)
+    return result
+
+
+# --- REPORT ---
+
+def page_savings(page_size=DEFAULT_PAGE_SIZE):
+    """
+    Per catalog page (title order, `page_size` books): yields (page number,
+    covers, full-size bytes, thumbnail bytes) for the covers now served as
+    thumbnails.
+    """
+    sizes = dict(
+        (row[0], row[1:]) for row in
+        CoverImage.objects.exclude(digest='').values_list('source_url', 'source_bytes', 'thumbnail_bytes')
+    )
+    rows = Book.objects.order_by('title', 'id').values_list('cover_image_url', 'cover_thumbnail')
+    page = books = covers = full = thumbs = 0
+    for url, digest in rows.iterator(chunk_size=2000):
+        books += 1
+        if digest and url in sizes:
+            covers += 1
+            full += sizes[url][0]
+            thumbs += sizes[url][1]
+        if books == page_size:
+            page += 1
+            yield page, covers, full, thumbs
+            books = covers = full = thumbs = 0
+    if books:
+        yield page + 1, covers, full, thumbs
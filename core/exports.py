@@ -0,0 +1,189 @@
+"""
+Streaming exports of the loan history and the catalog.
+
+Rows are read as values_list tuples in primary-key keyset batches, so memory
+stays flat however many rows there are, on MySQL too (its driver buffers a
+whole result set even under .iterator()). Output is produced incrementally as
+CSV or a JSON array, optionally gzipped on the fly. The loan history covers
+archived loans too (core.archive), streamed before the live table.
+"""
+import csv
+import datetime
+import itertools
+import json
+import zlib
+from decimal import Decimal
+
+from django.db.models import Value
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import ArchivedTransaction, Book, Transaction
+
+BATCH_SIZE = 2000
+# Flush encoded output in pieces of roughly this size.
+FLUSH_BYTES = 64 * 1024
+
+TRANSACTION_FIELDS = [
+    ('id', 'id'),
+    ('book_isbn', 'book__isbn'),
+    ('book_title', 'book__title'),
+    ('membership_id', 'member__membership_id'),
+    ('username', 'member__user__username'),
+    ('issue_date', 'issue_date'),
+    ('expected_return_date', 'expected_return_date'),
+    ('actual_return_date', 'actual_return_date'),
+    ('status', 'status'),
+    ('fine_amount', 'fine_amount'),
+]
+BOOK_FIELDS = [
+    ('id', 'id'),
+    ('isbn', 'isbn'),
+    ('title', 'title'),
+    ('author', 'author'),
+    ('genre', 'genre'),
+    ('total_copies', 'total_copies'),
+    ('available_copies', 'available_copies'),
+    ('cover_image_url', 'cover_image_url'),
+]
+KINDS = ('transactions', 'books')
+FORMATS = ('csv', 'json')
+STATUSES = [value for value, _ in Transaction.STATUS_CHOICES]
+
+
+def parse_filters(date_from=None, date_to=None, status=None):
+    """Validate export filters; raises ValueError with a readable message."""
+    filters = {}
+    for name, value in (('from', date_from), ('to', date_to)):
+        if value:
+            parsed = parse_date(value) if isinstance(value, str) else value
+            if parsed is None:
+                raise ValueError(f"'{name}' must be a date like 2024-01-31.")
+            filters[name] = parsed
+    if status:
+        if status not in STATUSES:
+            raise ValueError(f"'status' must be one of {', '.join(STATUSES)}.")
+        filters['status'] = status
+    return filters
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _issued_between(qs, filters):
+    # Whole-day bounds as datetime ranges (an issue_date__date lookup can't use an index)
+    if 'from' in filters:
+        qs = qs.filter(issue_date__gte=_start_of(filters['from']))
+    if 'to' in filters:
+        qs = qs.filter(issue_date__lt=_start_of(filters['to'] + datetime.timedelta(days=1)))
+    return qs
+
+
+def transactions_queryset(filters):
+    qs = _issued_between(Transaction.objects.all(), filters)
+    if 'status' in filters:
+        qs = qs.filter(status=filters['status'])
+    return qs
+
+
+def archived_queryset(filters):
+    """Archived loans matching `filters`, with the constant status the export lists; None if excluded."""
+    if filters.get('status', 'Returned') != 'Returned':
+        return None
+    return _issued_between(ArchivedTransaction.objects.annotate(status=Value('Returned')), filters)
+
+
+def iter_rows(queryset, fields, batch_size=None):
+    """Yield value tuples for `fields`, fetched in id-ordered keyset batches."""
+    batch_size = batch_size or BATCH_SIZE
+    lookups = [lookup for _, lookup in fields]
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*lookups)[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last_id = batch[-1][0]
+
+
+def _plain(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object whose write() just returns the value (for csv.writer)."""
+    def write(self, value):
+        return value
+
+
+def _csv_chunks(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([_plain(v) for v in row])
+
+
+def _json_chunks(header, rows):
+    yield '['
+    first = True
+    for row in rows:
+        item = json.dumps(dict(zip(header, (_plain(v) for v in row))), separators=(',', ':'))
+        yield item if first else ',\n' + item
+        first = False
+    yield ']\n'
+
+
+def _buffered(chunks):
+    """Join small text chunks into ~FLUSH_BYTES byte strings. The first chunk goes out at once."""
+    buffer, size = [], 0
+    for i, chunk in enumerate(chunks):
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES or i == 0:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for i, chunk in enumerate(chunks):
+        data = compressor.compress(chunk)
+        if i == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(kind, fmt='csv', filters=None, compress=False, using=None):
+    """
+    Iterator of bytes for a 'transactions' or 'books' export, read from the
+    `using` database (rows are read while the response streams, after
+    request-scoped routing has ended).
+    """
+    if kind == 'transactions':
+        fields, filters = TRANSACTION_FIELDS, filters or {}
+        archived = archived_queryset(filters)
+        rows = iter_rows(transactions_queryset(filters).using(using), fields)
+        if archived is not None:
+            rows = itertools.chain(iter_rows(archived.using(using), fields), rows)
+    else:
+        fields = BOOK_FIELDS
+        rows = iter_rows(Book.objects.using(using), fields)
+    header = [name for name, _ in fields]
+    encoder = _json_chunks if fmt == 'json' else _csv_chunks
+    chunks = _buffered(encoder(header, rows))
+    return _gzipped(chunks) if compress else chunks
+
+
+def filename(kind, fmt, compress):
+    stamp = datetime.date.today().isoformat()
+    return f"{kind}-{stamp}.{fmt}" + ('.gz' if compress else '')
@@ -0,0 +1,109 @@
+"""
+Overdue fine policy and accrual engine.
+
+Fines depend only on how many whole days a loan is overdue, so every open
+loan due within the same 24h window owes the same amount. accrue_fines()
+exploits that: it issues one UPDATE per overdue-day bucket (a range on the
+(status, expected_return_date) index) plus one for everything at the cap.
+No rows are loaded into Python, so memory stays flat with millions of loans,
+and rows whose stored fine is already right are not rewritten. The members
+whose fines change are updated in the same pass: Member.loans_changed_at, so
+the member loan API serves the new amounts, and the outstanding_fines
+counter the borrowing limits read. Each run also recounts overdue loans
+(core.borrowing).
+
+The policy is read from settings.LIBMGS_FINES:
+
+    LIBMGS_FINES = {'RATE': '1.00', 'GRACE_DAYS': 0, 'CAP': None}
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+from . import borrowing, stats
+from .models import Member, Transaction
+
+# Largest value Transaction.fine_amount (max_digits=6, decimal_places=2) can hold.
+MAX_FINE = Decimal('9999.99')
+
+
+class FinePolicy:
+    def __init__(self, rate='1.00', grace_days=0, cap=None):
+        self.rate = Decimal(str(rate))
+        self.grace_days = int(grace_days)
+        self.cap = min(Decimal(str(cap)), MAX_FINE) if cap is not None else MAX_FINE
+
+    @classmethod
+    def from_settings(cls):
+        conf = getattr(settings, 'LIBMGS_FINES', {})
+        return cls(conf.get('RATE', '1.00'), conf.get('GRACE_DAYS', 0), conf.get('CAP'))
+
+    def fine_for_days(self, overdue_days):
+        charged = overdue_days - self.grace_days
+        if charged <= 0:
+            return Decimal('0.00')
+        return min(charged * self.rate, self.cap).quantize(Decimal('0.01'))
+
+    def fine(self, expected_return_date, at):
+        if at <= expected_return_date:
+            return Decimal('0.00')
+        return self.fine_for_days((at - expected_return_date).days)
+
+    def cap_day(self):
+        """First overdue day on which the fine reaches the cap (None if it never charges)."""
+        if self.rate <= 0:
+            return None
+        return self.grace_days + max(1, math.ceil(self.cap / self.rate))
+
+
+def accrue_fines(now=None, policy=None):
+    """
+    Bring fine_amount on every open loan up to date. Returns the number of
+    rows changed. Also refreshes the accrued-fines dashboard counter.
+    """
+    now = now or timezone.now()
+    policy = policy or FinePolicy.from_settings()
+    active = Transaction.objects.active()
+    changed = 0
+
+    def set_fine(due_filter, amount):
+        stale = active.filter(**due_filter).exclude(fine_amount=amount)
+        with transaction.atomic():
+            Member.objects.filter(pk__in=stale.values('member_id')).update(
+                loans_changed_at=now,
+                outstanding_fines=F('outstanding_fines') + borrowing.fine_change(stale, amount),
+            )
+            return stale.update(fine_amount=amount)
+
+    if policy.cap_day() is None:
+        # Zero rate: nobody owes anything.
+        changed += set_fine({}, Decimal('0.00'))
+        oldest = None
+    else:
+        # Loans not past their grace period owe nothing.
+        changed += set_fine({'expected_return_date__gt': now - timedelta(days=policy.grace_days + 1)},
+                            Decimal('0.00'))
+        oldest = active.aggregate(oldest=Min('expected_return_date'))['oldest']
+
+    if oldest is not None and oldest < now:
+        max_days = (now - oldest).days
+        cap_day = policy.cap_day()
+        last_bucket = min(max_days, cap_day - 1)
+        # (now - due).days == d  <=>  now - (d+1) days < due <= now - d days
+        for d in range(policy.grace_days + 1, last_bucket + 1):
+            changed += set_fine({
+                'expected_return_date__gt': now - timedelta(days=d + 1),
+                'expected_return_date__lte': now - timedelta(days=d),
+            }, policy.fine_for_days(d))
+        if max_days >= cap_day:
+            changed += set_fine({'expected_return_date__lte': now - timedelta(days=cap_day)}, policy.cap)
+
+    borrowing.count_overdue(now)
+    total = active.aggregate(total=Sum('fine_amount'))['total'] or Decimal('0.00')
+    stats.store(accrued_fines=total)
+    return changed
@@ -1,13 +1,19 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
-from .models import Book, Member
-import uuid
+from django.db import transaction
+from .models import Book, Hold, Member
+from . import borrowing, covers, loans, membership
 
 class IssueBookForm(forms.Form):
     isbn = forms.CharField(label="Book ISBN", max_length=13, widget=forms.TextInput(attrs={'class': 'border rounded p-2 w-full'}))
     membership_id = forms.CharField(label="Member ID", max_length=20, widget=forms.TextInput(attrs={'class': 'border rounded p-2 w-full'}))
 
+    # PlaceHoldForm turns these off: a hold is exactly for books with no copy left,
+    # and limits apply when the held copy is issued
+    check_availability = True
+    check_limits = True
+
     def clean(self):
         cleaned_data = super().clean()
         isbn = cleaned_data.get('isbn')
@@ -16,8 +22,6 @@ class IssueBookForm(forms.Form):
         # Check if book exists
         try:
             book = Book.objects.get(isbn=isbn)
-            if book.available_copies < 1:
-                raise forms.ValidationError("Book is currently unavailable.")
             cleaned_data['book_obj'] = book
         except Book.DoesNotExist:
             raise forms.ValidationError("Book with this ISBN not found.")
@@ -28,9 +32,23 @@ class IssueBookForm(forms.Form):
             cleaned_data['member_obj'] = member
         except Member.DoesNotExist:
             raise forms.ValidationError("Member ID not found.")
+
+        # Reads the counters on the member row just loaded; core.loans enforces them again atomically
+        problem = self.check_limits and borrowing.limit_problem(member)
+        if problem:
+            raise forms.ValidationError(problem)
+
+        # A copy set aside by the member's Ready hold counts even when the shelf is empty
+        if (self.check_availability and book.available_copies < 1
+                and not Hold.objects.filter(book=book, member=member, status='Ready').exists()):
+            raise forms.ValidationError("Book is currently unavailable.")
             
         return cleaned_data
 
+class PlaceHoldForm(IssueBookForm):
+    check_availability = False
+    check_limits = False
+
 class MemberSignUpForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'w-full px-4 py-3 rounded-lg border border-gray-300 focus:ring-2 focus:ring-blue-500 outline-none'}))
     phone_number = forms.CharField(max_length=15, required=True, widget=forms.TextInput(attrs={'class': 'w-full px-4 py-3 rounded-lg border border-gray-300 focus:ring-2 focus:ring-blue-500 outline-none'}))
@@ -51,15 +69,17 @@ class MemberSignUpForm(UserCreationForm):
         user = super().save(commit=False)
         user.email = self.cleaned_data['email']
         if commit:
-            user.save()
-            # Generate a random 8-character Membership ID
-            mem_id = str(uuid.uuid4())[:8].upper()
-            Member.objects.create(
-                user=user,
-                membership_id=mem_id,
-                phone_number=self.cleaned_data['phone_number'],
-                address=self.cleaned_data['address']
-            )
+            # The password is already hashed (the slow part); the ID comes from a
+            # pre-reserved block, so the transaction below is two quick INSERTs.
+            mem_id = membership.next_id()
+            with transaction.atomic():
+                user.save()
+                Member.objects.create(
+                    user=user,
+                    membership_id=mem_id,
+                    phone_number=self.cleaned_data['phone_number'],
+                    address=self.cleaned_data['address']
+                )
         return user
 
 # --- NEW FORM FOR DBMS MINI PROJECT (INSERT/UPDATE BOOKS) ---
@@ -75,4 +95,13 @@ class BookForm(forms.ModelForm):
             'total_copies': forms.NumberInput(attrs={'class': 'w-full p-2 border rounded mb-4 focus:ring-2 focus:ring-blue-500 outline-none'}),
             'available_copies': forms.NumberInput(attrs={'class': 'w-full p-2 border rounded mb-4 focus:ring-2 focus:ring-blue-500 outline-none'}),
             'cover_image_url': forms.URLInput(attrs={'class': 'w-full p-2 border rounded mb-4 focus:ring-2 focus:ring-blue-500 outline-none', 'placeholder': 'https://example.com/image.jpg'}),
-        }
\ No newline at end of file
+        }
+
+    def save(self, commit=True):
+        # A new cover URL needs a new thumbnail (reused if that URL was fetched before).
+        if 'cover_image_url' in self.changed_data:
+            self.instance.cover_thumbnail = covers.stored_thumbnail(self.instance.cover_image_url)
+        if not commit or self.instance._state.adding:
+            return super().save(commit)
+        # Added copies go to the book's hold queue first
+        return loans.save_book(super().save(commit=False), self.initial['total_copies'])
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Holds (reservations): a FIFO waitlist per book.
+
+A member can place a hold on a book with no copies on the shelf. Whenever a
+copy comes back (a return, a batch return, a Ready hold expiring or being
+cancelled) loans.release_copies() first offers it to allocate(), which hands
+it to the oldest Waiting hold inside the same transaction: the hold becomes
+Ready until `ready_until` and the copy never reaches the shelf, so walk-ins
+can't jump the queue. Issuing the book to that member fulfils the hold.
+
+Queue heads and positions are range scans and counts over the
+(book, status, id) index, so they stay cheap with thousands of holds on one
+title. Ready holds nobody collected are expired in batches by expire_holds()
+(`manage.py expire_holds`), passing their copies on down the queue.
+
+Settings: LIBMGS_HOLDS = {'PICKUP_DAYS': 3}.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import loans
+from .models import Book, Hold
+
+class HoldError(Exception):
+    """Hold requests that can't be granted; shown to the member or staff."""
+
+
+def pickup_period():
+    return timedelta(days=getattr(settings, 'LIBMGS_HOLDS', {}).get('PICKUP_DAYS', 3))
+
+
+def _lock_books(book_ids):
+    # place_hold() and allocate() both lock the book row before looking at the
+    # shelf or the queue, so a new hold can't slip in between a return reading
+    # an empty queue and shelving the copy.
+    return list(Book.objects.select_for_update().filter(pk__in=book_ids).order_by('pk')
+                .only('id', 'title', 'available_copies'))
+
+
+def place_hold(book, member):
+    """Add `member` to the end of `book`'s waitlist."""
+    with transaction.atomic():
+        locked = _lock_books([book.pk])
+        if not locked:
+            raise HoldError("Book not found.")
+        book = locked[0]
+        if book.available_copies > 0:
+            raise HoldError(f"'{book.title}' is available now, no hold needed.")
+        if Hold.objects.open().filter(book=book, member=member).exists():
+            raise HoldError(f"There is already a hold on '{book.title}' for this member.")
+        return Hold.objects.create(book=book, member=member)
+
+
+def queue_position(hold):
+    """1-based place of a Waiting hold in its book's queue."""
+    return Hold.objects.queue(hold.book_id).filter(id__lte=hold.id).count()
+
+
+def allocate(counts, now=None):
+    """
+    Hand freed copies ({book_id: n}) to waiting holds, oldest first. Must run
+    inside the caller's transaction. Returns {book_id: n} for the copies
+    nobody was waiting for, which the caller puts back on the shelf.
+    """
+    counts = {pk: n for pk, n in counts.items() if n > 0}
+    if not counts:
+        return {}
+    ready_until = (now or timezone.now()) + pickup_period()
+    _lock_books(counts)
+    # One indexed probe finds the books that have a queue at all; most returns stop here.
+    queued = set(Hold.objects.waiting().filter(book_id__in=counts).values_list('book_id', flat=True).distinct())
+    leftover = {}
+    for book_id, n in counts.items():
+        ids = list(Hold.objects.queue(book_id).values_list('id', flat=True)[:n]) if book_id in queued else []
+        if ids:
+            Hold.objects.filter(pk__in=ids, status='Waiting').update(status='Ready', ready_until=ready_until)
+        if n > len(ids):
+            leftover[book_id] = n - len(ids)
+    return leftover
+
+
+def claim(book_id, member_id):
+    """
+    Fulfil the member's Ready hold on a book, if any. True means a copy is
+    already set aside for them and the shelf must not be touched.
+    """
+    return bool(
+        Hold.objects.filter(book_id=book_id, member_id=member_id, status='Ready')
+        .update(status='Fulfilled', ready_until=None)
+    )
+
+
+def cancel_hold(hold):
+    """Withdraw an open hold; a copy it was holding goes to the next in line."""
+    with transaction.atomic():
+        if Hold.objects.filter(pk=hold.pk, status='Ready').update(status='Cancelled', ready_until=None):
+            loans.release_copies({hold.book_id: 1})
+        elif not Hold.objects.filter(pk=hold.pk, status='Waiting').update(status='Cancelled'):
+            raise HoldError("This hold is no longer active.")
+    hold.status = 'Cancelled'
+    return hold
+
+
+def release_held_copies(holds):
+    """
+    Cancel the Ready holds in `holds` (a queryset about to be deleted) and pass
+    the copies they set aside down the queue. Called before Member deletes
+    cascade to holds and before admin deletes; a deleted book takes its copies
+    with it.
+    """
+    ready = list(holds.select_for_update().filter(status='Ready').values_list('id', 'book_id'))
+    if ready:
+        Hold.objects.filter(pk__in=[pk for pk, _ in ready]).update(status='Cancelled', ready_until=None)
+        loans.release_copies(Counter(book_id for _, book_id in ready))
+
+
+def expire_holds(now=None, batch_size=500):
+    """
+    Expire Ready holds whose pickup window has passed, `batch_size` per
+    transaction, and pass their copies down the queue. Returns how many expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Hold.objects.select_for_update()
+                .filter(status='Ready', ready_until__lt=now)
+                .order_by('ready_until', 'id')
+                .values_list('id', 'book_id')[:batch_size]
+            )
+            if not batch:
+                return expired
+            Hold.objects.filter(pk__in=[pk for pk, _ in batch], status='Ready').update(status='Expired')
+            # Holds made Ready here get a window starting now, so this loop never re-expires them.
+            loans.release_copies(Counter(book_id for _, book_id in batch), now)
+        expired += len(batch)
@@ -0,0 +1,182 @@
+"""
+Cached identity for logged-in requests.
+
+Every logged-in request needs its user (is_staff for the staff views, the
+hash Django checks the session against) and usually the user's Member.
+CachedModelBackend keeps both in the cache under the user's id: the User's
+USER_FIELDS, the session auth hashes and has_usable_password() derived from
+the password, and the Member's identity fields (id, membership_id), loaded
+together with one join on a miss. The password hash itself is never cached. With the sessions themselves
+in the cache too (SESSION_ENGINE cached_db, see libmgs/settings.py) a request
+whose entries are warm reads neither table. Other User and Member fields are
+deferred, so reading one still goes to the database and is never stale.
+
+Saving or deleting a User or Member evicts the entry, now and again when the
+transaction commits (core/signals.py), so a password change, a revoked staff
+flag or a deactivated account applies on the next request in this process.
+Other processes that use a per-process cache (LocMemCache) see it within TTL.
+QuerySet.update() on users sends no signal; call invalidate() after one.
+
+purge_expired_sessions() deletes expired database sessions in short batches;
+`manage.py purge_sessions` runs it on a loop.
+
+Settings: LIBMGS_IDENTITY_CACHE = {'TTL': 300}.
+"""
+import time
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .models import Member
+
+IDENTITY_KEY = 'core:identity:{}'
+# User and Member fields cached for each user; the rest stay deferred.
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+MEMBER_FIELDS = ('id', 'membership_id', 'user')
+
+
+def identity_settings():
+    conf = getattr(settings, 'LIBMGS_IDENTITY_CACHE', {})
+    return conf.get('TTL', 300)
+
+
+def _load(user_id):
+    """The cache entry for `user_id`: field values and session hashes, or None."""
+    fields = list(USER_FIELDS) + ['password'] + [f'member_profile__{name}' for name in MEMBER_FIELDS]
+    user = User.objects.select_related('member_profile').only(*fields).filter(pk=user_id).first()
+    if user is None:
+        return None
+    member = getattr(user, 'member_profile', None)
+    return {
+        'user': {name: getattr(user, name) for name in USER_FIELDS},
+        'member': None if member is None else {
+            Member._meta.get_field(name).attname: getattr(member, Member._meta.get_field(name).attname)
+            for name in MEMBER_FIELDS
+        },
+        'usable_password': user.has_usable_password(),
+        'session_hash': user.get_session_auth_hash(),
+        'fallback_hashes': list(user.get_session_auth_fallback_hash()),
+    }
+
+
+def _password_checks(user, entry):
+    # What the entry recorded about the password until the password is loaded
+    # or set on this instance (a password change in this request), then the
+    # real thing.
+    def recorded(method, key):
+        def check():
+            if 'password' in user.__dict__:
+                return method(user)
+            return entry[key]
+        return check
+
+    user.has_usable_password = recorded(User.has_usable_password, 'usable_password')
+    user.get_session_auth_hash = recorded(User.get_session_auth_hash, 'session_hash')
+    fallback_hashes = recorded(User.get_session_auth_fallback_hash, 'fallback_hashes')
+    user.get_session_auth_fallback_hash = lambda: iter(fallback_hashes())
+
+
+def _from_db(model, values):
+    # from_db() wants the loaded values in field order; the rest are deferred.
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+def _restore(entry):
+    """A User built from a cache entry, with member_profile attached (None if they have none)."""
+    user = _from_db(User, entry['user'])
+    member = None
+    if entry['member'] is not None:
+        member = _from_db(Member, entry['member'])
+        Member.user.field.set_cached_value(member, user)
+    User.member_profile.related.set_cached_value(user, member)
+    _password_checks(user, entry)
+    return user
+
+
+def get_identity(user_id):
+    """The user for `user_id` from the cache, loading and caching it on a miss."""
+    key = IDENTITY_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        entry = _load(user_id)
+        if entry is None:
+            return None
+        cache.set(key, entry, identity_settings())
+    return _restore(entry)
+
+
+def invalidate(user_ids):
+    """Drop cached identities, now and once the transaction commits."""
+    keys = [IDENTITY_KEY.format(pk) for pk in user_ids]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+async def amember_profile(user):
+    """user.member_profile (None if they have none) for async views; free for a cached identity."""
+    relation = User.member_profile.related
+    if relation.is_cached(user):
+        return relation.get_cached_value(user)
+    return await Member.objects.only(*MEMBER_FIELDS).filter(user=user).afirst()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose per-request user lookup goes through the identity cache."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and password is not None:
+            # Stop here: the plain ModelBackend after this one in
+            # AUTHENTICATION_BACKENDS would hash the same password again.
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        user = get_identity(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await sync_to_async(get_identity)(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+# --- SESSIONS ---
+
+def session_model():
+    """The model behind SESSION_ENGINE, or None for engines with nothing to purge (signed cookies, cache)."""
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    return store.get_model_class() if hasattr(store, 'get_model_class') else None
+
+
+def purge_expired_sessions(batch_size=1000, pause=0.0, limit=None, now=None, progress=None):
+    """
+    Delete sessions that expired before `now`, `batch_size` per statement,
+    sleeping `pause` seconds between batches and stopping after `limit` if
+    given. `progress(deleted)` is called after each batch. Returns the number
+    deleted.
+    """
+    model = session_model()
+    if model is None:
+        return 0
+    now = now or timezone.now()
+    deleted = 0
+    while limit is None or deleted < limit:
+        size = batch_size if limit is None else min(batch_size, limit - deleted)
+        keys = list(model.objects.filter(expire_date__lt=now).values_list('session_key', flat=True)[:size])
+        if not keys:
+            break
+        model.objects.filter(session_key__in=keys).delete()
+        deleted += len(keys)
+        if progress:
+            progress(deleted)
+        if pause:
+            time.sleep(pause)
+    return deleted
@@ -0,0 +1,215 @@
+"""
+Bulk catalog import from vendor files (CSV or JSON Lines).
+
+Records are parsed as a stream, normalized and validated in chunks, and
+upserted into Book with bulk_create(update_conflicts=True). Each record's
+`copies` are added to an existing book's total/available counts rather than
+overwriting them, going to its hold queue first (core.loans.release_copies). Rejected rows are collected with their line number and
+reason so they can be written to a report.
+
+Expected columns: isbn, title, author, genre, copies (default 1), cover_image_url (optional).
+"""
+import csv
+import io
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import connection, transaction
+
+from . import availability, catalog_cache, loans, search, stats
+from .models import Book
+
+CHUNK_SIZE = 5000
+UPDATE_FIELDS = ['title', 'author', 'genre', 'cover_image_url', 'cover_thumbnail', 'total_copies', 'available_copies']
+
+_validate_url = URLValidator()
+
+
+class RejectedRow(Exception):
+    pass
+
+
+# --- ISBN NORMALIZATION ---
+
+def _isbn13_check_digit(first12):
+    total = sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(first12))
+    return str((10 - total % 10) % 10)
+
+
+def normalize_isbn(raw):
+    """Return a valid 13-digit ISBN (ISBN-10s are converted) or raise RejectedRow."""
+    isbn = ''.join(ch for ch in str(raw or '') if ch not in ' -').upper()
+    if len(isbn) == 10:
+        body, check = isbn[:9], isbn[9]
+        if not body.isdigit() or not (check.isdigit() or check == 'X'):
+            raise RejectedRow(f"malformed ISBN-10 '{raw}'")
+        total = sum((10 - i) * int(d) for i, d in enumerate(body)) + (10 if check == 'X' else int(check))
+        if total % 11:
+            raise RejectedRow(f"bad ISBN-10 check digit '{raw}'")
+        isbn = '978' + body
+        return isbn + _isbn13_check_digit(isbn)
+    if len(isbn) == 13 and isbn.isdigit():
+        if _isbn13_check_digit(isbn[:12]) != isbn[12]:
+            raise RejectedRow(f"bad ISBN-13 check digit '{raw}'")
+        return isbn
+    raise RejectedRow(f"malformed ISBN '{raw}'")
+
+
+def clean_record(record):
+    """Validate one raw record (dict of strings) and return a normalized dict."""
+    isbn = normalize_isbn(record.get('isbn'))
+    cleaned = {'isbn': isbn}
+    for field, max_length in (('title', 255), ('author', 255), ('genre', 100)):
+        value = str(record.get(field) or '').strip()
+        if not value:
+            raise RejectedRow(f"missing {field}")
+        if len(value) > max_length:
+            raise RejectedRow(f"{field} longer than {max_length} characters")
+        cleaned[field] = value
+
+    copies = record.get('copies')
+    try:
+        cleaned['copies'] = 1 if copies in (None, '') else int(copies)
+    except (TypeError, ValueError):
+        raise RejectedRow(f"copies is not a number: '{copies}'")
+    if cleaned['copies'] < 0:
+        raise RejectedRow("copies cannot be negative")
+
+    url = str(record.get('cover_image_url') or '').strip() or None
+    if url:
+        try:
+            _validate_url(url)
+        except ValidationError:
+            raise RejectedRow(f"invalid cover_image_url '{url}'")
+    cleaned['cover_image_url'] = url
+    return cleaned
+
+
+# --- PARSING ---
+
+def read_records(fh, fmt):
+    """Yield (line_number, record_dict or None, raw_text) from a text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(fh)
+        for record in reader:
+            yield reader.line_num, record, None
+    else:
+        for line_number, line in enumerate(fh, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_number, None, line.rstrip('\n')
+                continue
+            yield line_number, (record if isinstance(record, dict) else None), line.rstrip('\n')
+
+
+# --- UPSERT ---
+
+def upsert_chunk(records):
+    """
+    Upsert a chunk of cleaned records. Duplicate ISBNs within the chunk are
+    merged (copies summed, last metadata wins). Returns (created, updated).
+    """
+    merged = {}
+    for rec in records:
+        if rec['isbn'] in merged:
+            rec = dict(rec, copies=merged[rec['isbn']]['copies'] + rec['copies'])
+        merged[rec['isbn']] = rec
+
+    with transaction.atomic():
+        existing = {
+            row[0]: row[1:] for row in
+            Book.objects.select_for_update().filter(isbn__in=merged)
+            .values_list('isbn', 'id', 'total_copies', 'available_copies', 'cover_image_url', 'cover_thumbnail',
+                         *search.FIELD_WEIGHTS)
+        }
+        rows = []
+        reindex = []  # new books and books whose searchable text changed
+        added = {}  # copies added to existing books, released to their hold queues below
+        for isbn, rec in merged.items():
+            pk, total, available, url, thumbnail, *indexed = existing.get(isbn, (None, 0, 0, None, ''))
+            if pk is None:
+                available += rec['copies']
+            else:
+                added[pk] = rec['copies']
+            if indexed != [rec[field] for field in search.FIELD_WEIGHTS]:
+                reindex.append(isbn)
+            rows.append(Book(
+                isbn=isbn, title=rec['title'], author=rec['author'], genre=rec['genre'],
+                cover_image_url=rec['cover_image_url'],
+                # keep the thumbnail unless the URL changed; core.covers builds the new one
+                cover_thumbnail=thumbnail if url == rec['cover_image_url'] else '',
+                total_copies=total + rec['copies'], available_copies=available,
+            ))
+        options = {'update_conflicts': True, 'update_fields': UPDATE_FIELDS}
+        if connection.features.supports_update_conflicts_with_target:
+            options['unique_fields'] = ['isbn']  # MySQL's ON DUPLICATE KEY UPDATE takes no target
+        Book.objects.bulk_create(rows, batch_size=1000, **options)
+        loans.release_copies(added)
+
+        # bulk_create skips signals: refresh the search index, catalog cache and dashboard counters here.
+        if reindex:
+            search.index_books(Book.objects.filter(isbn__in=reindex).only('id', *search.FIELD_WEIGHTS))
+        catalog_cache.invalidate_books([row[0] for row in existing.values()], listing=bool(reindex))
+        availability.invalidate(isbns=merged)
+        stats.bump(total_copies=sum(rec['copies'] for rec in merged.values()))
+
+    created = len(merged) - len(existing)
+    return created, len(existing)
+
+
+class ImportResult:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.rejected = []  # (line_number, reason, raw)
+
+
+def import_catalog(fh, fmt='csv', offset=0, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Import records from an open text stream. `offset` skips that many data
+    records (to resume an interrupted run). `progress(result)` is called after
+    every chunk. Returns an ImportResult.
+    """
+    result = ImportResult()
+    chunk = []
+    for position, (line_number, record, raw) in enumerate(read_records(fh, fmt)):
+        if position < offset:
+            continue
+        result.processed += 1
+        try:
+            if record is None:
+                raise RejectedRow("unparseable record")
+            chunk.append(clean_record(record))
+        except RejectedRow as e:
+            result.rejected.append((line_number, str(e), raw if raw is not None else _csv_raw(record)))
+        if len(chunk) >= chunk_size:
+            _flush(chunk, result, progress)
+            chunk = []
+    if chunk:
+        _flush(chunk, result, progress)
+    return result
+
+
+def _flush(chunk, result, progress):
+    created, updated = upsert_chunk(chunk)
+    result.created += created
+    result.updated += updated
+    if progress:
+        progress(result)
+
+
+def _csv_raw(record):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow((record or {}).values())
+    return buffer.getvalue().rstrip('\r\n')
+
+
+def write_rejected_report(rejected, fh):
+    writer = csv.writer(fh)
+    writer.writerow(['line', 'reason', 'raw'])
+    writer.writerows(rejected)
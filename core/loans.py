@@ -0,0 +1,322 @@
+"""
+Loan service: the only place that issues and returns books.
+
+Both operations run inside transaction.atomic() and change counters with
+conditional UPDATE statements, so concurrent desks can never over-issue a
+copy, return the same loan twice or take a member past a borrowing limit
+(see core.borrowing). Returned copies go to the book's hold queue before
+the shelf (see core.holds).
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from . import availability, borrowing, catalog_cache, holds, stats
+from .fines import FinePolicy
+from .models import Book, Hold, Member, Transaction
+
+LOAN_PERIOD = timedelta(days=14)
+
+
+class LoanError(Exception):
+    """Base class for circulation errors shown to staff."""
+
+
+class BookUnavailable(LoanError):
+    pass
+
+
+class AlreadyReturned(LoanError):
+    pass
+
+
+class LimitReached(LoanError):
+    pass
+
+
+def calculate_fine(expected_return_date, returned_at):
+    """Fine owed under the configured policy (default $1 per full day overdue)."""
+    return FinePolicy.from_settings().fine(expected_return_date, returned_at)
+
+
+def issue_book(book, member):
+    """Open a loan for `member`: from their Ready hold if they have one, otherwise off the shelf."""
+    with transaction.atomic():
+        if not holds.claim(book.pk, member.pk):
+            # UPDATE ... SET available_copies = available_copies - 1 WHERE available_copies > 0
+            taken = Book.objects.filter(pk=book.pk, available_copies__gt=0).update(
+                available_copies=F('available_copies') - 1
+            )
+            if not taken:
+                raise BookUnavailable(f"'{book.title}' is currently unavailable.")
+            catalog_cache.invalidate_books([book.pk])
+            availability.invalidate(book_ids=[book.pk])
+        # UPDATE ... SET active_loans = active_loans + 1 WHERE id = %s AND active_loans < limit AND ...
+        # (loans_changed_at is the Last-Modified/ETag of the member loan API)
+        allowed = Member.objects.filter(borrowing.within_limits(), pk=member.pk).update(
+            loans_changed_at=timezone.now(), **borrowing.issued(1)
+        )
+        if not allowed:
+            current = Member.objects.only(*borrowing.COUNTER_FIELDS).get(pk=member.pk)
+            raise LimitReached(borrowing.limit_problem(current) or "Member has reached a borrowing limit.")
+        loan = Transaction.objects.create(book=book, member=member)
+        stats.bump(books_issued=1)
+        return loan
+
+
+def return_book(loan):
+    """
+    Close an open loan, finalize its fine and put the copy back on the shelf.
+    `loan.fine_amount` should hold the value accrued so far (see core.fines).
+    """
+    now = timezone.now()
+    fine = calculate_fine(loan.expected_return_date, now)
+    with transaction.atomic():
+        # Only one caller can flip Issued -> Returned; the rest see 0 rows updated.
+        closed = Transaction.objects.filter(pk=loan.pk, status='Issued').update(
+            status='Returned', actual_return_date=now, fine_amount=fine
+        )
+        if not closed:
+            raise AlreadyReturned("This book is already returned.")
+        release_copies({loan.book_id: 1}, now)
+        Member.objects.filter(pk=loan.member_id).update(
+            loans_changed_at=now, **borrowing.returned([(loan.expected_return_date, loan.fine_amount, fine)])
+        )
+        stats.bump(books_issued=-1, accrued_fines=-loan.fine_amount)
+
+    loan.status = 'Returned'
+    loan.actual_return_date = now
+    loan.fine_amount = fine
+    return loan
+
+
+# --- BATCH CIRCULATION ---
+
+MAX_BATCH_SIZE = 1000
+BATCH_RETRIES = 3
+
+
+class _Contention(Exception):
+    """A guarded batch UPDATE touched fewer rows than planned; roll back and retry."""
+
+
+def _run_batch(func, *args):
+    for attempt in range(BATCH_RETRIES):
+        try:
+            with transaction.atomic():
+                return func(*args)
+        except _Contention:
+            if attempt == BATCH_RETRIES - 1:
+                raise LoanError("The catalog changed while the batch was running, please retry.")
+
+
+def _adjust_copies(counts, sign):
+    """
+    Apply per-book copy deltas in a single UPDATE with a CASE expression.
+    When taking copies every row is guarded by available_copies >= n; returns False
+    if any guard failed so the caller can roll back.
+    """
+    if not counts:
+        return True
+    whens = [When(pk=pk, then=F('available_copies') + sign * n) for pk, n in counts.items()]
+    if sign < 0:
+        guard = Q()
+        for pk, n in counts.items():
+            guard |= Q(pk=pk, available_copies__gte=n)
+    else:
+        guard = Q(pk__in=counts)
+    updated = Book.objects.filter(guard).update(available_copies=Case(
+        *whens, default=F('available_copies'), output_field=PositiveIntegerField()
+    ))
+    catalog_cache.invalidate_books(counts)
+    availability.invalidate(book_ids=counts)
+    return updated == len(counts)
+
+
+def release_copies(counts, now=None):
+    """
+    Put freed copies ({book_id: n}) back into circulation inside the caller's
+    transaction: to waiting holds first, the rest onto the shelf.
+    """
+    _adjust_copies(holds.allocate(counts, now), +1)
+
+
+def save_book(book, previous_total):
+    """
+    Save a catalog edit of an existing book. Copies added since
+    `previous_total` (and put into available_copies with it) are released
+    like returned ones, so waiting holds get them before walk-ins.
+    """
+    added = min(book.total_copies - previous_total, book.available_copies)
+    with transaction.atomic():
+        if added > 0:
+            book.available_copies -= added
+        book.save()
+        if added > 0:
+            release_copies({book.pk: added})
+            book.refresh_from_db(fields=['available_copies'])
+    return book
+
+
+def _issue_batch(items):
+    isbns = {item['isbn'] for item in items}
+    member_ids = {item['membership_id'] for item in items}
+    books = {
+        b.isbn: b for b in
+        Book.objects.select_for_update().filter(isbn__in=isbns).only('id', 'isbn', 'available_copies')
+    }
+    members = Member.objects.select_for_update().only('id', 'membership_id', *borrowing.COUNTER_FIELDS).in_bulk(
+        member_ids, field_name='membership_id'
+    )
+    # Copies already set aside for these members by their Ready holds
+    ready = {
+        (hold.book_id, hold.member_id): hold.pk for hold in
+        Hold.objects.select_for_update().filter(
+            status='Ready', book_id__in=[b.pk for b in books.values()], member_id__in=[m.pk for m in members.values()]
+        ).only('id', 'book_id', 'member_id')
+    }
+    claimed = []
+
+    results = []
+    remaining = {isbn: book.available_copies for isbn, book in books.items()}
+    taken = Counter()
+    borrowed = Counter()  # loans per member so far in this batch
+    loans = []
+    due = timezone.now() + LOAN_PERIOD
+    for item in items:
+        result = {'isbn': item['isbn'], 'membership_id': item['membership_id'], 'ok': False}
+        results.append(result)
+        book = books.get(item['isbn'])
+        member = members.get(item['membership_id'])
+        if book is None:
+            result['error'] = "Book with this ISBN not found."
+        elif member is None:
+            result['error'] = "Member ID not found."
+        elif problem := borrowing.limit_problem(member, borrowed[member.pk] + 1):
+            result['error'] = problem
+        elif (book.pk, member.pk) in ready:
+            claimed.append(ready.pop((book.pk, member.pk)))
+            loans.append(Transaction(book_id=book.pk, member_id=member.pk, expected_return_date=due))
+            borrowed[member.pk] += 1
+            result['ok'] = True
+        elif remaining[book.isbn] < 1:
+            result['error'] = "Book is currently unavailable."
+        else:
+            remaining[book.isbn] -= 1
+            taken[book.pk] += 1
+            loans.append(Transaction(book_id=book.pk, member_id=member.pk, expected_return_date=due))
+            borrowed[member.pk] += 1
+            result['ok'] = True
+
+    if not _adjust_copies(taken, -1):
+        raise _Contention()
+    if claimed and Hold.objects.filter(pk__in=claimed, status='Ready').update(
+        status='Fulfilled', ready_until=None
+    ) != len(claimed):
+        raise _Contention()
+    # bulk_create skips Transaction.save(), so the due date is set explicitly above
+    created = Transaction.objects.bulk_create(loans)
+    # The members' rows are locked, so the limits checked above still hold.
+    borrowing.update_members({pk: borrowing.issued(n) for pk, n in borrowed.items()}, loans_changed_at=timezone.now())
+    stats.bump(books_issued=len(created))
+    if created and created[0].pk is None:
+        # MySQL doesn't return ids from a bulk INSERT; read them back (the batch shares one due date).
+        # Rows for the same book and member were inserted, so numbered, in list order.
+        ids = defaultdict(list)
+        for pk, book_id, member_id in Transaction.objects.filter(
+            expected_return_date=due, book_id__in={loan.book_id for loan in created},
+            member_id__in={loan.member_id for loan in created},
+        ).order_by('id').values_list('id', 'book_id', 'member_id'):
+            ids[book_id, member_id].append(pk)
+        for loan in reversed(created):
+            loan.pk = ids[loan.book_id, loan.member_id].pop()
+    created_iter = iter(created)
+    for result in results:
+        if result['ok']:
+            result['transaction_id'] = next(created_iter).pk
+    return results
+
+
+def issue_batch(items):
+    """
+    Issue many (isbn, membership_id) pairs at once. Books and members are
+    resolved with one query each, loans are bulk-inserted and copy counters
+    updated in a single statement. Returns one result dict per item.
+    """
+    if len(items) > MAX_BATCH_SIZE:
+        raise LoanError(f"A batch may contain at most {MAX_BATCH_SIZE} items.")
+    return _run_batch(_issue_batch, items)
+
+
+def _return_batch(transaction_ids):
+    now = timezone.now()
+    open_loans = {
+        loan.pk: loan for loan in
+        Transaction.objects.select_for_update()
+        .filter(pk__in=set(transaction_ids), status='Issued')
+        .only('id', 'book_id', 'member_id', 'expected_return_date', 'fine_amount')
+    }
+
+    closed = Transaction.objects.filter(pk__in=open_loans, status='Issued').update(
+        status='Returned', actual_return_date=now
+    )
+    if closed != len(open_loans):
+        raise _Contention()
+
+    fined = []
+    accrued = Decimal('0.00')
+    returned = defaultdict(list)  # member_id: [(due date, accrued fine, final fine)]
+    policy = FinePolicy.from_settings()
+    for loan in open_loans.values():
+        accrued += loan.fine_amount
+        fine = policy.fine(loan.expected_return_date, now)
+        returned[loan.member_id].append((loan.expected_return_date, loan.fine_amount, fine))
+        if fine != loan.fine_amount:
+            loan.fine_amount = fine
+            fined.append(loan)
+    Transaction.objects.bulk_update(fined, ['fine_amount'], batch_size=500)
+    release_copies(Counter(loan.book_id for loan in open_loans.values()), now)
+    borrowing.update_members({pk: borrowing.returned(items) for pk, items in returned.items()}, loans_changed_at=now)
+    stats.bump(books_issued=-closed, accrued_fines=-accrued)
+
+    results = []
+    seen = set()
+    for pk in transaction_ids:
+        loan = open_loans.get(pk)
+        if loan is None or pk in seen:
+            results.append({'transaction_id': pk, 'ok': False, 'error': "Loan not found or already returned."})
+        else:
+            results.append({'transaction_id': pk, 'ok': True, 'fine_amount': str(loan.fine_amount)})
+        seen.add(pk)
+    return results
+
+
+def return_batch(transaction_ids):
+    """Return many loans at once with set-based updates. Returns one result dict per id."""
+    if len(transaction_ids) > MAX_BATCH_SIZE:
+        raise LoanError(f"A batch may contain at most {MAX_BATCH_SIZE} items.")
+    return _run_batch(_return_batch, transaction_ids)
+
+
+# --- DELETES ---
+
+def forget_loans(loans):
+    """
+    Take the open loans in `loans` (a queryset about to be deleted) off their
+    members' counters and the dashboard. Called before Book and Member deletes
+    cascade to their loans and before admin deletes; Transaction itself has no
+    delete signals so archival keeps Django's fast bulk delete.
+    """
+    forgotten = defaultdict(list)  # member_id: [(due date, accrued fine, final fine)]
+    accrued = Decimal('0.00')
+    for member_id, due, fine in loans.filter(status='Issued').values_list(
+            'member_id', 'expected_return_date', 'fine_amount'):
+        forgotten[member_id].append((due, fine, 0))
+        accrued += fine
+    if forgotten:
+        borrowing.update_members({pk: borrowing.returned(items) for pk, items in forgotten.items()})
+        stats.bump(books_issued=-sum(len(items) for items in forgotten.values()), accrued_fines=-accrued)
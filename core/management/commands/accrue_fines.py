@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import fines
+
+
+class Command(BaseCommand):
+    help = "Recompute accrued fines on all overdue open loans using set-based updates."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help="Keep running, accruing every SECONDS (simple scheduler loop).")
+
+    def handle(self, *args, **options):
+        policy = fines.FinePolicy.from_settings()
+        self.stdout.write(f"Policy: {policy.rate}/day, {policy.grace_days} grace day(s), cap {policy.cap}")
+        while True:
+            started = time.perf_counter()
+            changed = fines.accrue_fines(policy=policy)
+            self.stdout.write(self.style.SUCCESS(
+                f"Updated fines on {changed} loan(s) in {time.perf_counter() - started:.2f}s."
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
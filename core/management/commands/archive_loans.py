@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move returned loans older than --days from the active Transaction table to the archive, "
+        "in short batches with a pause between them so it can run while the library is open."
+    )
+
+    def add_arguments(self, parser):
+        days, batch_size = archive.archive_settings()
+        parser.add_argument('--days', type=int, default=days, help=f"Archive loans returned more than this many days ago (default {days}).")
+        parser.add_argument('--batch-size', type=int, default=batch_size, help="Loans moved per transaction.")
+        parser.add_argument('--pause', type=float, default=0.2, help="Seconds to sleep between batches.")
+        parser.add_argument('--limit', type=int, help="Stop after moving this many loans.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        moved = archive.archive_loans(
+            days=options['days'], batch_size=options['batch_size'], pause=options['pause'], limit=options['limit'],
+            progress=lambda moved: self.stderr.write(f"  {moved} loan(s) archived"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} loan(s) returned more than {options['days']} days ago "
+            f"in {time.perf_counter() - started:.2f}s."
+        ))
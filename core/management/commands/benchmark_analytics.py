@@ -0,0 +1,86 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import analytics, loans
+from core.management.utils import rolled_back
+from core.models import AnalyticsState, ArchivedTransaction, Book, BorrowCount, CoBorrow, Member, Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a full rebuild of the analytics tables over the existing loan history, an incremental "
+        "refresh after --new fresh loans, and the page reads. Runs in a rolled-back transaction; "
+        "use generate_data --transactions 3000000 for a multi-million-row history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=analytics.analytics_settings()['BATCH_SIZE'])
+        parser.add_argument('--limit', type=int, help="Rebuild from only the first LIMIT loans.")
+        parser.add_argument('--new', type=int, default=5000, help="Loans added before the incremental refresh.")
+        parser.add_argument('--reads', type=int, default=200, help="Repetitions of each read.")
+
+    def handle(self, *args, **options):
+        history = Transaction.objects.count() + ArchivedTransaction.objects.count()
+        if not history:
+            raise CommandError("No loans; run generate_data first.")
+        self.stdout.write(f"Loan history: {history} rows")
+        with rolled_back():
+            self._rebuild(options)
+            self._incremental(options)
+            self._reads(options['reads'])
+
+    def _rebuild(self, options):
+        start = time.perf_counter()
+        processed = analytics.refresh(batch_size=options['batch_size'], rebuild=True, limit=options['limit'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"rebuild      {processed:>9} loans {elapsed:>8.1f}s {processed / elapsed:>9.0f} loans/s  "
+            f"-> {BorrowCount.objects.count()} counts, {CoBorrow.objects.count()} pairs"
+        )
+
+    def _incremental(self, options):
+        rng = random.Random(0)
+        book_ids = list(Book.objects.values_list('id', flat=True)[:5000])
+        member_ids = list(Member.objects.values_list('id', flat=True)[:5000])
+        if options['limit']:
+            # The rebuild stopped early; skip the rest of the history so only the new loans are timed.
+            last = max(model.objects.aggregate(last=Max('id'))['last'] or 0
+                       for model in (Transaction, ArchivedTransaction))
+            AnalyticsState.objects.update(last_transaction_id=last)
+        due = timezone.now() + loans.LOAN_PERIOD
+        Transaction.objects.bulk_create(
+            (Transaction(book_id=rng.choice(book_ids), member_id=rng.choice(member_ids), expected_return_date=due,
+                         status='Returned', actual_return_date=due)
+             for _ in range(options['new'])),
+            batch_size=5000,
+        )
+        later = timezone.now() + timedelta(hours=1)  # past the settle window for loans just created
+        start = time.perf_counter()
+        processed = analytics.refresh(batch_size=options['batch_size'], now=later)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"incremental  {processed:>9} loans {elapsed:>8.1f}s {processed / elapsed:>9.0f} loans/s")
+
+    def _reads(self, repeat):
+        top = analytics.most_borrowed(1)
+        book_id = top[0].book_id if top else Book.objects.values_list('id', flat=True).first()
+        genre = Book.objects.values_list('genre', flat=True).get(pk=book_id)
+        for name, read in (
+            ('most_borrowed', lambda: analytics.most_borrowed(10)),
+            ('trending_in_genre', lambda: analytics.trending_in_genre(genre, 10)),
+            ('also_borrowed', lambda: analytics.also_borrowed(book_id)),
+        ):
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    read()
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{name:<18} {elapsed / repeat * 1000:>7.2f} ms  {len(ctx.captured_queries) // repeat} query"
+            )
@@ -0,0 +1,57 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core import metrics
+
+# (label, GET params) for the anonymous catalog pages being measured.
+PAGES = [
+    ('catalog', {}),
+    ('catalog size=100', {'size': 100}),
+    ('search "the"', {'q': 'the'}),
+    ('search "history"', {'q': 'history'}),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure anonymous catalog requests/second with the catalog cache off, "
+        "then cold and warm with it on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=2.0, help="How long to hammer each page per mode.")
+
+    def handle(self, *args, **options):
+        client = Client()
+        url = reverse('index')
+        self.stdout.write(f"{'page':<22}{'uncached rps':>14}{'cold ms':>10}{'cached rps':>12}{'speedup':>10}")
+        with override_settings(ALLOWED_HOSTS=['*']):
+            for label, params in PAGES:
+                with override_settings(LIBMGS_CATALOG_CACHE={'ENABLED': False}):
+                    uncached = self._rate(client, url, params, options['seconds'])
+
+                cache.clear()
+                start = time.perf_counter()
+                client.get(url, params)
+                cold_ms = (time.perf_counter() - start) * 1000
+                cached = self._rate(client, url, params, options['seconds'])
+
+                self.stdout.write(
+                    f"{label:<22}{uncached:>14.1f}{cold_ms:>10.1f}{cached:>12.1f}{cached / uncached:>9.1f}x"
+                )
+        for line in metrics.registry.render().splitlines():
+            if line.startswith('libmgs_cache_requests_total'):
+                self.stdout.write(line)
+
+    def _rate(self, client, url, params, seconds):
+        done = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            response = client.get(url, params)
+            assert response.status_code == 200, response.status_code
+            done += 1
+        return done / (time.perf_counter() - start)
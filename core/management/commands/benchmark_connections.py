@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from core.models import Book
+
+# (label, CONN_MAX_AGE, CONN_HEALTH_CHECKS)
+MODES = [
+    ('new connection per request', 0, False),
+    ('persistent', 60, False),
+    ('persistent + health checks', 60, True),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request connection overhead for each database alias (primary and replicas): "
+        "a connection per request versus persistent connections, with and without health checks. "
+        "Each simulated request fires Django's request signals around one small query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Simulated requests per alias and mode.")
+
+    def handle(self, *args, **options):
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        try:
+            self.stdout.write(f"{'alias':<12}{'mode':<30}{'ms/request':>12}{'connections':>13}")
+            for alias in connections:
+                for label, max_age, health_checks in MODES:
+                    elapsed, count = self._run(alias, max_age, health_checks, options['requests'], opened)
+                    self.stdout.write(f"{alias:<12}{label:<30}{elapsed * 1000 / options['requests']:>12.3f}{count:>13}")
+        finally:
+            connection_created.disconnect(count_connection)
+
+    def _run(self, alias, max_age, health_checks, requests, opened):
+        connection = connections[alias]
+        saved = {key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        connection.close()
+        connection.settings_dict.update(CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=health_checks)
+        opened.clear()
+        try:
+            start = time.perf_counter()
+            for _ in range(requests):
+                request_started.send(sender=self.__class__)
+                Book.objects.using(alias).only('id').first()
+                request_finished.send(sender=self.__class__)
+            return time.perf_counter() - start, len(opened)
+        finally:
+            connection.close()
+            connection.settings_dict.update(saved)
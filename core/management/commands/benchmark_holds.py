@@ -0,0 +1,78 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import holds, loans
+from core.management.utils import rolled_back
+from core.models import Book, Hold, Member, Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure return throughput, queue-position lookups and the expiry sweep "
+        "for a book with an empty, long and very long hold queue. Uses existing "
+        "members and runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queues', type=int, nargs='+', default=[0, 1000, 5000],
+                            help="Queue lengths to test (capped at the number of members).")
+        parser.add_argument('--returns', type=int, default=200, help="Loans returned per queue length.")
+
+    def handle(self, *args, **options):
+        member_ids = list(Member.objects.order_by('id').values_list('id', flat=True)[:max(options['queues'])])
+        if not member_ids:
+            raise CommandError("No members; run generate_data first.")
+
+        self.stdout.write(
+            f"{'queue':>7}{'returns/s':>12}{'queries/return':>16}{'tail position ms':>18}{'expired/s':>12}"
+        )
+        for length in options['queues']:
+            with rolled_back():
+                row = self._run(min(length, len(member_ids)), member_ids, options['returns'])
+            self.stdout.write(
+                f"{row['queue']:>7}{row['returns_per_s']:>12.1f}{row['queries_per_return']:>16.1f}"
+                f"{row['position_ms']:>18.2f}{row['expired_per_s']:>12.1f}"
+            )
+
+    def _run(self, length, member_ids, returns):
+        book = Book.objects.create(title="Hold benchmark", author="Bench", isbn="0000000000001", genre="Bench",
+                                   total_copies=returns, available_copies=0)
+        due = timezone.now() + loans.LOAN_PERIOD
+        Transaction.objects.bulk_create(
+            Transaction(book=book, member_id=member_ids[i % len(member_ids)], expected_return_date=due)
+            for i in range(returns)
+        )
+        Hold.objects.bulk_create(Hold(book=book, member_id=pk) for pk in member_ids[:length])
+        open_loans = list(Transaction.objects.filter(book=book).only(
+            'id', 'book_id', 'member_id', 'status', 'expected_return_date', 'fine_amount'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for loan in open_loans:
+                loans.return_book(loan)
+            elapsed = time.perf_counter() - start
+
+        tail = Hold.objects.queue(book.pk).last()
+        position_ms = 0.0
+        if tail is not None:
+            start = time.perf_counter()
+            holds.queue_position(tail)
+            position_ms = (time.perf_counter() - start) * 1000
+
+        # Let every Ready hold lapse and time the sweep that passes the copies on.
+        Hold.objects.filter(book=book, status='Ready').update(ready_until=timezone.now() - loans.LOAN_PERIOD)
+        start = time.perf_counter()
+        expired = holds.expire_holds()
+        sweep = time.perf_counter() - start
+
+        return {
+            'queue': length,
+            'returns_per_s': returns / elapsed,
+            'queries_per_return': len(ctx.captured_queries) / returns,
+            'position_ms': position_ms,
+            'expired_per_s': expired / sweep if expired else 0.0,
+        }
@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Sum
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core import borrowing, loans
+from core.management.utils import rolled_back
+from core.models import ArchivedTransaction, Book, Member, Transaction
+
+
+def count_based_problem(member):
+    """The limit check without counters: what IssueBookForm.clean would otherwise run per issue."""
+    conf = borrowing.borrowing_settings()
+    mine = Transaction.objects.filter(member=member)
+    active = mine.filter(status='Issued').count()
+    overdue = mine.overdue().count()
+    owed = sum((model.objects.filter(member=member).aggregate(total=Sum('fine_amount'))['total'] or Decimal('0')
+                for model in (Transaction, ArchivedTransaction)), Decimal('0')) - member.fines_paid
+    if conf['MAX_LOANS'] is not None and active + 1 > conf['MAX_LOANS']:
+        return "loans"
+    if conf['MAX_OVERDUE'] is not None and overdue > conf['MAX_OVERDUE']:
+        return "overdue"
+    if conf['MAX_FINES'] is not None and owed > conf['MAX_FINES']:
+        return "fines"
+    return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the borrowing-limit check read from the member counters with one that counts and sums "
+        "the member's loans, for members with short and very long histories, and time issue_book itself. "
+        "Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--histories', type=int, nargs='+', default=[10, 1000, 20000],
+                            help="Past loans per member (half of them archived).")
+        parser.add_argument('--repeat', type=int, default=200, help="Checks and issues timed per history length.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'history':>8}{'count-based ms':>16}{'queries':>9}{'counters ms':>13}{'queries':>9}{'issue ms':>10}"
+        )
+        for history in options['histories']:
+            with rolled_back():
+                row = self._run(history, options['repeat'])
+            self.stdout.write(
+                f"{history:>8}{row['count_ms']:>16.3f}{row['count_queries']:>9}"
+                f"{row['counter_ms']:>13.3f}{row['counter_queries']:>9}{row['issue_ms']:>10.3f}"
+            )
+
+    def _timed(self, func, repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                func()
+            elapsed = time.perf_counter() - start
+        return elapsed / repeat * 1000, len(ctx.captured_queries) // repeat
+
+    def _run(self, history, repeat):
+        user = User.objects.create_user(f'limits-bench-{history}')
+        member = Member.objects.create(user=user, membership_id=f'LIMITS{history}', phone_number='0', address='-')
+        book = Book.objects.create(title="Limits benchmark", author="Bench", isbn="0000000000002", genre="Bench",
+                                   total_copies=repeat, available_copies=repeat)
+        now = timezone.now()
+        past = [now - timedelta(days=15 + i % 3000) for i in range(history)]
+        Transaction.objects.bulk_create(
+            (Transaction(book=book, member=member, expected_return_date=issued + loans.LOAN_PERIOD, status='Returned',
+                         actual_return_date=issued + loans.LOAN_PERIOD, fine_amount=Decimal('0.50'))
+             for issued in past[:history // 2]), batch_size=5000,
+        )
+        # Archived loans keep their original ids; take fresh ones above both tables.
+        first_id = max(model.objects.aggregate(last=Max('id'))['last'] or 0
+                       for model in (Transaction, ArchivedTransaction)) + 1
+        ArchivedTransaction.objects.bulk_create(
+            (ArchivedTransaction(id=first_id + i, book=book, member=member, issue_date=issued,
+                                 expected_return_date=(issued + loans.LOAN_PERIOD).date(),
+                                 actual_return_date=(issued + loans.LOAN_PERIOD).date(), fine_amount=Decimal('0.50'))
+             for i, issued in enumerate(past[history // 2:])), batch_size=5000,
+        )
+        # Everything owed has been paid, so every check passes and runs to the end; with no open
+        # loans and nothing outstanding the new member's zeroed counters are already right.
+        Member.objects.filter(pk=member.pk).update(fines_paid=Decimal('0.50') * history)
+        member = Member.objects.get(pk=member.pk)
+
+        count_ms, count_queries = self._timed(lambda: count_based_problem(member), repeat)
+        counter_ms, counter_queries = self._timed(
+            lambda: borrowing.limit_problem(Member.objects.only(*borrowing.COUNTER_FIELDS).get(pk=member.pk)), repeat)
+
+        issue_ms = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            loan = loans.issue_book(book, member)
+            issue_ms += time.perf_counter() - start
+            loans.return_book(loan)
+        return {
+            'count_ms': count_ms, 'count_queries': count_queries,
+            'counter_ms': counter_ms, 'counter_queries': counter_queries,
+            'issue_ms': issue_ms / repeat * 1000,
+        }
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import search
+
+DEFAULT_QUERIES = ['harry', 'potter', 'tolkien', 'history', 'science fiction', 'the']
+
+
+class Command(BaseCommand):
+    help = "Compare the indexed search engine with the old icontains scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', help="Queries to run (defaults to a small built-in set).")
+        parser.add_argument('--repeat', type=int, default=5, help="Runs per query per engine.")
+        parser.add_argument('--limit', type=int, default=search.DEFAULT_LIMIT, help="Result rows fetched per query.")
+
+    def _time(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best * 1000, hits
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or DEFAULT_QUERIES
+        repeat, limit = options['repeat'], options['limit']
+
+        self.stdout.write(f"{'query':<24}{'icontains ms':>14}{'hits':>8}{'index ms':>12}{'hits':>8}{'speedup':>10}")
+        for query in queries:
+            old_ms, old_hits = self._time(lambda: len(list(search.icontains_search(query)[:limit])), repeat)
+            new_ms, new_hits = self._time(lambda: len(search.search_books(query, limit=limit)), repeat)
+            speedup = old_ms / new_ms if new_ms else float('inf')
+            self.stdout.write(f"{query:<24}{old_ms:>14.2f}{old_hits:>8}{new_ms:>12.2f}{new_hits:>8}{speedup:>9.1f}x")
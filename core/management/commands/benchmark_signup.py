@@ -0,0 +1,64 @@
+import io
+import os
+import time
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core import onboarding
+from core.management.utils import rolled_back
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure web signups/second and bulk onboarding rows/second at different hashing costs "
+        "and thread counts. Runs in rolled-back transactions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--signups', type=int, default=20, help="Web signups to time.")
+        parser.add_argument('--cohort', type=int, default=1000, help="Rows per onboarding run.")
+        parser.add_argument('--cheap-iterations', type=int, default=10000,
+                            help="Reduced PBKDF2 cost to compare against the site default.")
+
+    def handle(self, *args, **options):
+        with override_settings(ALLOWED_HOSTS=['*']), rolled_back():
+            rate, p50 = self._signups(options['signups'])
+        self.stdout.write(f"web signup: {rate:.1f}/s, p50 {p50:.1f} ms ({get_hasher().algorithm}, site default)")
+
+        cohort = self._cohort(options['cohort'])
+        default_iterations = getattr(get_hasher(), 'iterations', None)
+        workers = os.cpu_count() or 1
+        self.stdout.write(f"{'iterations':>12}{'workers':>9}{'rows/s':>10}")
+        for iterations in (None, options['cheap_iterations']):
+            for threads in sorted({1, workers}):
+                with rolled_back():
+                    start = time.perf_counter()
+                    result = onboarding.onboard(io.StringIO(cohort), iterations=iterations, workers=threads)
+                    elapsed = time.perf_counter() - start
+                assert result.created == options['cohort'], result.rejected[:3]
+                label = iterations or f"{default_iterations or 'default'}"
+                self.stdout.write(f"{label:>12}{threads:>9}{result.created / elapsed:>10.0f}")
+
+    def _signups(self, count):
+        url = reverse('signup')
+        timings = []
+        for n in range(count):
+            client = Client()
+            start = time.perf_counter()
+            response = client.post(url, {
+                'username': f'bench-signup-{n}', 'email': f'bench{n}@example.com',
+                'password1': 'correct horse battery', 'password2': 'correct horse battery',
+                'phone_number': '5550000', 'address': '1 Bench Street',
+            })
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 302, response.status_code
+        timings.sort()
+        return count / sum(timings), timings[len(timings) // 2] * 1000
+
+    def _cohort(self, count):
+        lines = ['username,email,first_name,last_name,phone_number,address']
+        lines += [f'bench-cohort-{n},c{n}@example.com,Student,{n},555{n:07d},{n} Campus Road' for n in range(count)]
+        return '\n'.join(lines) + '\n'
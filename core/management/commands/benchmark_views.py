@@ -0,0 +1,171 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+
+from core import urls as core_urls
+from core.management.utils import percentile, rolled_back, sample_users
+from core.models import Book, Transaction
+
+# How to call each named URL: (log in as, method, extra GET params or JSON body).
+# Anything in core/urls.py that is missing here is reported as skipped.
+PLANS = {
+    'index': (None, 'get', {}),
+    'dashboard': ('member', 'get', {}),
+    'admin_dashboard': ('staff', 'get', {}),
+    'signup': (None, 'get', {}),
+    'issue_book': ('staff', 'get', {}),
+    'all_transactions': ('staff', 'get', {}),
+    'return_book': ('staff', 'get', {}),
+    'issue_batch': ('staff', 'post', 'issue_batch'),
+    'return_batch': ('staff', 'post', 'return_batch'),
+    'book_detail': (None, 'get', {}),
+    'place_hold': ('member', 'get', {}),
+    'export_data': ('staff', 'get', {'format': 'csv'}),
+    'metrics': ('staff', 'get', {}),
+    'member_loans_api': ('member', 'get', {}),
+    'availability_batch': (None, 'get', 'availability_batch'),
+    'availability': (None, 'get', {}),
+    'manage_books': ('staff', 'get', {}),
+    'add_book': ('staff', 'get', {}),
+    'edit_book': ('staff', 'get', {}),
+    'delete_book': ('staff', 'get', {}),
+}
+SEARCH_QUERIES = ['the', 'history', 'shadow river', 'tolkein']
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every URL in core/urls.py through the test client and report p50/p95 latency, "
+        "query counts and peak Python memory per view. Runs in a rolled-back transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help="Timed requests per view.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+
+    def handle(self, *args, **options):
+        results = []
+        with override_settings(ALLOWED_HOSTS=['*']), rolled_back():
+            self.users = sample_users()
+            self.client = Client()
+            self.book = Book.objects.order_by('id').first()
+            self.isbns = list(Book.objects.order_by('id').values_list('isbn', flat=True)[:100])
+            self.etags = {}
+            self.open_loans = iter(Transaction.objects.active().values_list('id', flat=True)[:100000])
+
+            for name in self._url_names():
+                plan = PLANS.get(name)
+                if plan is None:
+                    self.stdout.write(self.style.WARNING(f"skipped {name}: no benchmark plan"))
+                    continue
+                results.append(self._bench(name, name, plan, options['requests']))
+            for query in SEARCH_QUERIES:
+                results.append(self._bench(f"index?q={query}", 'index', (None, 'get', {'q': query}), options['requests']))
+            # A client refreshing an unchanged loan list, against the dashboard it replaces
+            results.append(self._bench('member_loans_api (304)', 'member_loans_api',
+                                       ('member', 'get', 'revalidate'), options['requests']))
+
+        self.stdout.write(
+            f"{'view':<28}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'peak KiB':>10}{'bytes':>10}{'status':>8}"
+        )
+        for r in results:
+            self.stdout.write(
+                f"{r['view']:<28}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['queries']:>9}"
+                f"{r['peak_kib']:>10.0f}{r['bytes']:>10}{r['status']:>8}"
+            )
+
+        if options['output']:
+            report = {
+                'created': timezone.now().isoformat(),
+                'vendor': connection.vendor,
+                'python': platform.python_version(),
+                'requests_per_view': options['requests'],
+                'rows': {'books': Book.objects.count(), 'transactions': Transaction.objects.count()},
+                'results': results,
+            }
+            with open(options['output'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _url_names(self):
+        """Names of all core URL patterns, in urls.py order."""
+        names = []
+        for pattern in core_urls.urlpatterns:
+            if isinstance(pattern, URLPattern) and pattern.name:
+                names.append(pattern.name)
+            elif isinstance(pattern, URLResolver):
+                names.extend(p.name for p in pattern.url_patterns if getattr(p, 'name', None))
+        return names
+
+    def _request(self, name, plan):
+        _, method, extra = plan
+        args = []
+        if name in ('edit_book', 'delete_book', 'place_hold', 'book_detail'):
+            args = [self.book.pk]
+        elif name == 'export_data':
+            args = ['books']
+        elif name == 'availability':
+            args = [self.book.isbn]
+        elif name == 'return_book':
+            # Each call returns a different open loan (all rolled back afterwards).
+            args = [next(self.open_loans, 0)]
+        url = reverse(name, args=args)
+        if extra == 'revalidate':
+            if url not in self.etags:
+                self.etags[url] = self.client.get(url)['ETag']
+            etag = self.etags[url]
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        if extra == 'availability_batch':
+            return self.client.get(url, {'isbn': list(self.isbns)})
+        if method == 'post':
+            if extra == 'issue_batch':
+                body = {'items': [{'isbn': self.book.isbn, 'membership_id': 'missing'}]}
+            else:
+                body = {'transaction_ids': [next(self.open_loans, 0)]}
+            return self.client.post(url, json.dumps(body), content_type='application/json')
+        return self.client.get(url, extra)
+
+    def _bench(self, label, name, plan, count):
+        login_as = plan[0]
+        self.client.logout()
+        if login_as:
+            self.client.force_login(self.users[login_as])
+
+        self._request(name, plan)  # warm-up (template loading, caches)
+        timings = []
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(count):
+                start = time.perf_counter()
+                response = self._request(name, plan)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+        queries = len(ctx.captured_queries) / count if count else 0
+
+        tracemalloc.start()
+        response = self._request(name, plan)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'view': label,
+            'p50_ms': statistics.median(timings) if timings else 0.0,
+            'p95_ms': percentile(timings, 95) if timings else 0.0,
+            'queries': round(queries, 1),
+            'peak_kib': peak / 1024,
+            'bytes': size,
+            'status': response.status_code if timings else None,
+        }
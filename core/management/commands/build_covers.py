@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import covers
+
+
+class Command(BaseCommand):
+    help = (
+        "Fetch each book's cover URL once and store a fixed-size thumbnail for the catalog. "
+        "--report prints how many bytes the thumbnails save per catalog page."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=covers.cover_settings()['WORKERS'],
+                            help="Covers fetched and resized at a time.")
+        parser.add_argument('--from-dir', metavar='DIR',
+                            help="Read each URL's file name from DIR instead of downloading it.")
+        parser.add_argument('--retry-failed', action='store_true', help="Fetch URLs that failed before again.")
+        parser.add_argument('--limit', type=int, help="Stop after this many books.")
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help="Keep running, building new covers every SECONDS (simple scheduler loop).")
+        parser.add_argument('--report', action='store_true', help="Only print the bytes saved per catalog page.")
+        parser.add_argument('--pages', type=int, default=10, help="Catalog pages listed by --report.")
+
+    def handle(self, *args, **options):
+        if options['report']:
+            return self.report(options['pages'])
+        fetcher = covers.LocalFetcher(options['from_dir']) if options['from_dir'] else None
+        while True:
+            started = time.perf_counter()
+            result = covers.build_thumbnails(
+                workers=options['workers'], fetcher=fetcher, retry_failed=options['retry_failed'],
+                limit=options['limit'],
+                progress=lambda r: self.stderr.write(f"  {r.books} book(s), {r.fetched} URL(s) fetched"),
+            )
+            for url, error in result.failed:
+                self.stderr.write(f"  {url}: {error}")
+            self.stdout.write(self.style.SUCCESS(
+                f"Thumbnails for {result.books} book(s) ({result.reused} reusing an earlier fetch), "
+                f"{result.fetched} URL(s) fetched, {len(result.failed)} failed, "
+                f"in {time.perf_counter() - started:.2f}s."
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def report(self, pages):
+        self.stdout.write(f"{'page':>6} {'covers':>7} {'full size':>12} {'thumbnails':>12} {'saved':>12}")
+        count = full_total = thumb_total = 0
+        for page, n, full, thumbs in covers.page_savings():
+            if page <= pages:
+                self.stdout.write(f"{page:>6} {n:>7} {full:>12,} {thumbs:>12,} {full - thumbs:>12,}")
+            count += 1
+            full_total += full
+            thumb_total += thumbs
+        if count:
+            self.stdout.write(
+                f"{count} page(s): {full_total - thumb_total:,} bytes saved in all, "
+                f"{(full_total - thumb_total) // count:,} per page on average "
+                f"({full_total // count:,} -> {thumb_total // count:,})."
+            )
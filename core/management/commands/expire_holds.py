@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import holds
+
+
+class Command(BaseCommand):
+    help = "Expire Ready holds past their pickup window and pass the copies to the next members in line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Holds expired per transaction.")
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help="Keep running, sweeping every SECONDS (simple scheduler loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            expired = holds.expire_holds(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Expired {expired} hold(s) in {time.perf_counter() - started:.2f}s."
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
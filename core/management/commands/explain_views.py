@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.management.utils import rolled_back, sample_users
+
+# (label, url name, GET params, log in as)
+VIEWS = [
+    ('index', 'index', {}, None),
+    ('index search', 'index', {'q': 'the'}, None),
+    ('member dashboard', 'dashboard', {}, 'member'),
+    ('admin dashboard', 'admin_dashboard', {}, 'staff'),
+    ('all transactions', 'all_transactions', {}, 'staff'),
+    ('manage books', 'manage_books', {}, 'staff'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Request each view, EXPLAIN every SELECT it ran and flag full table scans "
+        "and temporary sorts. Run it against a seeded database; nothing is written."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Print every plan, not only flagged ones.")
+
+    def handle(self, *args, **options):
+        self.flagged = 0
+        # The test client talks to 'testserver'
+        with override_settings(ALLOWED_HOSTS=['*']), rolled_back():
+            client = Client()
+            users = sample_users()
+            for label, name, params, login_as in VIEWS:
+                client.logout()
+                if login_as:
+                    client.force_login(users[login_as])
+                with CaptureQueriesContext(connection) as ctx:
+                    client.get(reverse(name), params)
+                self.stdout.write(self.style.MIGRATE_HEADING(f"{label} ({len(ctx.captured_queries)} queries)"))
+                for query in ctx.captured_queries:
+                    if query['sql'].lstrip().upper().startswith('SELECT'):
+                        self._explain(query['sql'], options['all'])
+
+        if self.flagged:
+            self.stdout.write(self.style.WARNING(f"{self.flagged} query plan(s) flagged."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No full scans found."))
+
+    def _explain(self, sql, show_all):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+                problems = [
+                    line for line in plan
+                    if (line.startswith('SCAN ') and ' USING ' not in line) or 'TEMP B-TREE' in line
+                ]
+            else:
+                cursor.execute(f"EXPLAIN {sql}")
+                columns = [c[0] for c in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                plan = [
+                    f"{r.get('table')}: type={r.get('type')} key={r.get('key')} rows={r.get('rows')} {r.get('Extra') or ''}"
+                    for r in rows
+                ]
+                problems = [
+                    line for r, line in zip(rows, plan)
+                    if r.get('type') == 'ALL' or 'filesort' in (r.get('Extra') or '')
+                ]
+
+        if problems:
+            self.flagged += 1
+        if problems or show_all:
+            self.stdout.write(f"  {sql[:160]}{'...' if len(sql) > 160 else ''}")
+            for line in plan:
+                if line in problems:
+                    self.stdout.write(self.style.WARNING(f"    !! {line}"))
+                else:
+                    self.stdout.write(f"       {line}")
@@ -0,0 +1,38 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+
+
+class Command(BaseCommand):
+    help = "Stream the loan history or the catalog to a CSV/JSON file (or stdout) in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=exports.KINDS)
+        parser.add_argument('--format', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--from', dest='date_from', help="Transactions issued on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='date_to', help="Transactions issued on or before this date (YYYY-MM-DD).")
+        parser.add_argument('--status', help="Only transactions with this status.")
+        parser.add_argument('--output', '-o', help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            filters = exports.parse_filters(options['date_from'], options['date_to'], options['status'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = exports.stream(options['kind'], options['format'], filters, options['gzip'])
+        if options['output']:
+            written = 0
+            with open(options['output'], 'wb') as fh:
+                for chunk in chunks:
+                    fh.write(chunk)
+                    written += len(chunk)
+            self.stderr.write(f"Wrote {written} bytes to {options['output']}.")
+        else:
+            out = sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
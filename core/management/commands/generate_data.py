@@ -0,0 +1,177 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import borrowing, search, stats
+from core.models import Book, Member, Transaction
+
+GENRES = [
+    'Fiction', 'Fantasy', 'Science Fiction', 'Mystery', 'Romance', 'History', 'Biography',
+    'Science', 'Philosophy', 'Poetry', 'Travel', 'Children', 'Horror', 'Self Help', 'Art',
+]
+WORDS = (
+    'shadow river silent garden empire night lost city fire winter secret ocean king stone '
+    'glass dream iron forest light storm house road star memory island song clock war map '
+    'mountain letter crown wolf tide harvest signal engine theory mind history future'
+).split()
+FIRST_NAMES = 'anna ben chloe david emma farah george hana ivan julia kiran leo maya noah omar priya'.split()
+LAST_NAMES = 'smith khan patel garcia chen novak silva rossi mueller dubois kowalski sato okafor'.split()
+
+# Every generated row carries this prefix so runs never collide with real data.
+ISBN_PREFIX = '990'
+MEMBER_PREFIX = 'SYN'
+
+
+@contextmanager
+def manual_timestamps(*fields):
+    """Let bulk_create write historical dates into auto_now_add fields."""
+    saved = [(f, f.auto_now_add) for f in fields]
+    for f, _ in saved:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, value in saved:
+            f.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic library (books, members, loan history) with bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--members', type=int, default=5000)
+        parser.add_argument('--transactions', type=int, default=50000)
+        parser.add_argument('--active-ratio', type=float, default=0.05,
+                            help="Fraction of loans still issued (the rest are returned).")
+        parser.add_argument('--overdue-ratio', type=float, default=0.2,
+                            help="Fraction of active loans that are past their due date.")
+        parser.add_argument('--skew', type=float, default=3.0,
+                            help="Popularity skew; higher concentrates loans on fewer books.")
+        parser.add_argument('--days', type=int, default=3 * 365, help="How far back loan history goes.")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--skip-search-index', action='store_true',
+                            help="Don't rebuild the search index afterwards.")
+
+    def handle(self, *args, **options):
+        for name in ('active_ratio', 'overdue_ratio'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be between 0 and 1.")
+        self.rng = random.Random(options['seed'])
+        self.chunk = options['chunk_size']
+        self.now = timezone.now()
+        started = time.perf_counter()
+
+        book_ids = self.generate_books(options['books'])
+        member_ids = self.generate_members(options['members'])
+        if options['transactions'] and (not book_ids or not member_ids):
+            raise CommandError("Loans need at least one book and one member.")
+        self.generate_transactions(options, book_ids, member_ids)
+
+        stats.recompute(save=True)
+        borrowing.reconcile(batch_size=self.chunk)
+        if not options['skip_search_index']:
+            self.stdout.write("Rebuilding search index...")
+            search.rebuild_index(chunk_size=self.chunk)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s."))
+
+    def _title(self):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(1, 4))).title()
+
+    def _person(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}".title()
+
+    def generate_books(self, count):
+        start = Book.objects.filter(isbn__startswith=ISBN_PREFIX).count()
+        self.copies = {}
+        for offset in range(0, count, self.chunk):
+            rows = []
+            for n in range(start + offset, start + min(offset + self.chunk, count)):
+                copies = self.rng.randint(1, 10)
+                rows.append(Book(
+                    title=self._title(), author=self._person(), isbn=f"{ISBN_PREFIX}{n:010d}",
+                    genre=self.rng.choice(GENRES), total_copies=copies, available_copies=copies,
+                ))
+            Book.objects.bulk_create(rows, batch_size=self.chunk)
+            self.stdout.write(f"Books: {offset + len(rows)}/{count}")
+        # Re-read ids (MySQL's bulk_create doesn't return them) in isbn order.
+        ids = []
+        for pk, copies in (Book.objects.filter(isbn__startswith=ISBN_PREFIX).order_by('isbn')
+                           .values_list('id', 'total_copies')[start:start + count].iterator(chunk_size=self.chunk)):
+            ids.append(pk)
+            self.copies[pk] = copies
+        return ids
+
+    def generate_members(self, count):
+        start = Member.objects.filter(membership_id__startswith=MEMBER_PREFIX).count()
+        # Hash once; every synthetic account shares the password "password".
+        password = make_password('password')
+        joined_field = Member._meta.get_field('joined_at')
+        for offset in range(0, count, self.chunk):
+            numbers = range(start + offset, start + min(offset + self.chunk, count))
+            users = [User(username=f"syn{n:08d}", email=f"syn{n:08d}@example.com", password=password,
+                          first_name=self.rng.choice(FIRST_NAMES).title(), last_name=self.rng.choice(LAST_NAMES).title())
+                     for n in numbers]
+            User.objects.bulk_create(users, batch_size=self.chunk)
+            user_ids = dict(User.objects.filter(username__in=[u.username for u in users]).values_list('username', 'id'))
+            members = [
+                Member(user_id=user_ids[f"syn{n:08d}"], membership_id=f"{MEMBER_PREFIX}{n:08d}",
+                       phone_number=f"555{n:07d}"[-10:], address=f"{n} Synthetic Street",
+                       joined_at=self.now - timedelta(days=self.rng.randint(0, 5 * 365)))
+                for n in numbers
+            ]
+            with manual_timestamps(joined_field):
+                Member.objects.bulk_create(members, batch_size=self.chunk)
+            self.stdout.write(f"Members: {offset + len(members)}/{count}")
+        return list(Member.objects.filter(membership_id__startswith=MEMBER_PREFIX)
+                    .order_by('membership_id').values_list('id', flat=True)[start:start + count])
+
+    def generate_transactions(self, options, book_ids, member_ids):
+        count = options['transactions']
+        skew = options['skew']
+        history = timedelta(days=options['days'])
+        issue_field = Transaction._meta.get_field('issue_date')
+        available = dict(self.copies)
+        taken = {}
+
+        for offset in range(0, count, self.chunk):
+            rows = []
+            for _ in range(min(self.chunk, count - offset)):
+                # Power-law index: low ids (the "bestsellers") are borrowed far more often.
+                book_id = book_ids[int(len(book_ids) * self.rng.random() ** skew)]
+                member_id = self.rng.choice(member_ids)
+                active = self.rng.random() < options['active_ratio'] and available[book_id] > 0
+                if active:
+                    overdue = self.rng.random() < options['overdue_ratio']
+                    due = self.now + (timedelta(days=-self.rng.randint(1, 60)) if overdue
+                                      else timedelta(days=self.rng.randint(0, 13), hours=1))
+                    issued = due - timedelta(days=14)
+                    available[book_id] -= 1
+                    taken[book_id] = taken.get(book_id, 0) + 1
+                    rows.append(Transaction(book_id=book_id, member_id=member_id, issue_date=issued,
+                                            expected_return_date=due, status='Issued'))
+                else:
+                    issued = self.now - timedelta(days=14) - history * self.rng.random()
+                    due = issued + timedelta(days=14)
+                    late_days = max(0, int(self.rng.gauss(-3, 5)))
+                    rows.append(Transaction(
+                        book_id=book_id, member_id=member_id, issue_date=issued, expected_return_date=due,
+                        actual_return_date=due + timedelta(days=late_days) - timedelta(hours=1),
+                        status='Returned', fine_amount=late_days - 1 if late_days > 1 else 0,
+                    ))
+            with manual_timestamps(issue_field):
+                Transaction.objects.bulk_create(rows, batch_size=self.chunk)
+            self.stdout.write(f"Transactions: {offset + len(rows)}/{count}")
+
+        # Copies out on loan are no longer available.
+        changed = []
+        for book_id, n in taken.items():
+            changed.append(Book(pk=book_id, available_copies=self.copies[book_id] - n))
+        Book.objects.bulk_update(changed, ['available_copies'], batch_size=self.chunk)
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import imports
+
+
+class Command(BaseCommand):
+    help = "Upsert books from a vendor CSV or JSON Lines file in chunks, adding copies to existing ISBNs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="File format (default: guessed from the extension).")
+        parser.add_argument('--offset', type=int, default=0,
+                            help="Skip this many records, e.g. to resume an interrupted import.")
+        parser.add_argument('--chunk-size', type=int, default=imports.CHUNK_SIZE)
+        parser.add_argument('--rejected', metavar='PATH',
+                            help="Write rejected rows to this CSV (default: <path>.rejected.csv).")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+        offset = options['offset']
+        started = time.perf_counter()
+
+        def progress(result):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{result.processed} records ({result.processed / elapsed:,.0f}/s): "
+                f"{result.created} created, {result.updated} updated, {len(result.rejected)} rejected "
+                f"-- resume with --offset {offset + result.processed}"
+            )
+
+        try:
+            with open(path, newline='', encoding='utf-8') as fh:
+                result = imports.import_catalog(fh, fmt, offset, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        if result.rejected:
+            report = options['rejected'] or f"{path}.rejected.csv"
+            with open(report, 'w', newline='', encoding='utf-8') as fh:
+                imports.write_rejected_report(result.rejected, fh)
+            self.stdout.write(self.style.WARNING(f"{len(result.rejected)} rows rejected, see {report}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.created + result.updated} books ({result.created} new) "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
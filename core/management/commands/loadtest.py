@@ -0,0 +1,237 @@
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from core.management.utils import percentile
+from core.models import Member
+
+# name -> (path, query string, log in as)
+TARGETS = {
+    'index': ('/', '', None),
+    'search': ('/', 'q=history', None),
+    'dashboard': ('/dashboard/', '', 'member'),
+    'admin_dashboard': ('/admin-dashboard/', '', 'staff'),
+    'all_transactions': ('/transactions/', '', 'staff'),
+}
+HOST = 'localhost'
+STAFF_USERNAME = 'loadtest-staff'
+
+
+def _summary(latencies, elapsed, errors):
+    ms = [s * 1000 for s in latencies]
+    return {
+        'requests': len(ms),
+        'errors': errors,
+        'rps': len(ms) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(ms) if ms else 0.0,
+        'p95_ms': percentile(ms, 95) if ms else 0.0,
+        'p99_ms': percentile(ms, 99) if ms else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI and ASGI throughput and tail latency on the current database. "
+        "Each mode runs in its own process (ASGI with LIBMGS_ASYNC_VIEWS=1) and drives "
+        "the Django handler directly with --concurrency simultaneous requests, so the "
+        "numbers exclude any web server. Only GET pages are hit; nothing is written "
+        "except a login session per run (and a temporary staff user if none exists)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration per view and mode.")
+        parser.add_argument('--view', action='append', choices=sorted(TARGETS), dest='views',
+                            help="View to test (repeatable). Default: all.")
+        parser.add_argument('--output', help="Write results as JSON to this path.")
+        parser.add_argument('--worker', choices=['wsgi', 'asgi'], help="Internal: run one mode and print JSON.")
+        parser.add_argument('--staff-id', type=int, help="Internal.")
+        parser.add_argument('--member-id', type=int, help="Internal.")
+
+    def handle(self, *args, **options):
+        views = options['views'] or list(TARGETS)
+        if options['worker']:
+            results = Worker(options['worker'], options).run(views)
+            self.stdout.write(json.dumps(results))
+            return
+
+        member = Member.objects.filter(transaction__status='Issued').select_related('user').first()
+        if member is None:
+            raise CommandError("No member with an open loan; run generate_data first.")
+        staff = User.objects.filter(is_staff=True).first()
+        created_staff = staff is None
+        if created_staff:
+            staff = User.objects.create_user(STAFF_USERNAME, is_staff=True)
+        try:
+            report = {mode: self._run_mode(mode, views, staff, member.user, options) for mode in ('wsgi', 'asgi')}
+        finally:
+            if created_staff:
+                staff.delete()
+
+        self.stdout.write(
+            f"{'view':<18}{'mode':<6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for view in views:
+            for mode in ('wsgi', 'asgi'):
+                r = report[mode][view]
+                self.stdout.write(
+                    f"{view:<18}{mode:<6}{r['rps']:>9.1f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}"
+                    f"{r['p99_ms']:>9.2f}{r['errors']:>8}"
+                )
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump({'concurrency': options['concurrency'], 'seconds': options['seconds'],
+                           'vendor': settings.DATABASES['default']['ENGINE'], 'results': report}, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def _run_mode(self, mode, views, staff, member_user, options):
+        command = [
+            sys.executable, '-m', 'django', 'loadtest', '--worker', mode,
+            '--concurrency', str(options['concurrency']), '--seconds', str(options['seconds']),
+            '--staff-id', str(staff.pk), '--member-id', str(member_user.pk),
+        ]
+        for view in views:
+            command += ['--view', view]
+        env = dict(os.environ, LIBMGS_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        self.stderr.write(f"Running {mode}...")
+        done = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if done.returncode:
+            raise CommandError(f"{mode} worker failed:\n{done.stderr}")
+        return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+class Worker:
+    """Drives one handler (WSGI or ASGI) in this process."""
+
+    def __init__(self, mode, options):
+        self.mode = mode
+        self.concurrency = options['concurrency']
+        self.seconds = options['seconds']
+        self.cookies = {None: ''}
+        self.clients = []
+        for role, pk in (('staff', options['staff_id']), ('member', options['member_id'])):
+            client = Client()
+            client.force_login(User.objects.get(pk=pk))
+            self.clients.append(client)
+            self.cookies[role] = f"{settings.SESSION_COOKIE_NAME}={client.session.session_key}"
+
+    def run(self, views):
+        try:
+            if self.mode == 'wsgi':
+                from django.core.handlers.wsgi import WSGIHandler
+                self.app = WSGIHandler()
+                return {view: self._run_wsgi(TARGETS[view]) for view in views}
+            from django.core.handlers.asgi import ASGIHandler
+            self.app = ASGIHandler()
+            return asyncio.run(self._run_asgi_all(views))
+        finally:
+            for client in self.clients:
+                client.logout()
+
+    # --- WSGI: a thread per concurrent request, like a threaded WSGI server ---
+
+    def _wsgi_request(self, target):
+        path, query, role = target
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+            'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'HTTP_HOST': HOST,
+            'HTTP_COOKIE': self.cookies[role], 'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(b''),
+            'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+        }
+        status = []
+        body = self.app(environ, lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for _ in body:
+                pass
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+        return status[0].startswith('200')
+
+    def _run_wsgi(self, target):
+        self._wsgi_request(target)  # warm-up
+        latencies, errors = [], []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + self.seconds
+
+        def loop():
+            mine, failed = [], 0
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ok = self._wsgi_request(target)
+                mine.append(time.perf_counter() - start)
+                failed += not ok
+            with lock:
+                latencies.extend(mine)
+                errors.append(failed)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            for _ in range(self.concurrency):
+                pool.submit(loop)
+        return _summary(latencies, time.perf_counter() - start, sum(errors))
+
+    # --- ASGI: concurrent tasks on one event loop, like an ASGI server ---
+
+    async def _asgi_request(self, target):
+        path, query, role = target
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': (HOST, 80),
+            'headers': [(b'host', HOST.encode()), (b'cookie', self.cookies[role].encode())],
+        }
+        finished = asyncio.Event()
+        sent_request = False
+        status = []
+
+        async def receive():
+            nonlocal sent_request
+            if not sent_request:
+                sent_request = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await finished.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body' and not message.get('more_body'):
+                finished.set()
+
+        await self.app(scope, receive, send)
+        finished.set()
+        return status[0] == 200
+
+    async def _run_asgi(self, target):
+        await self._asgi_request(target)  # warm-up
+        latencies, errors = [], 0
+        deadline = time.perf_counter() + self.seconds
+
+        async def loop():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ok = await self._asgi_request(target)
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(self.concurrency)))
+        return _summary(latencies, time.perf_counter() - start, errors)
+
+    async def _run_asgi_all(self, views):
+        return {view: await self._run_asgi(TARGETS[view]) for view in views}
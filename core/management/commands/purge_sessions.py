@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import identity
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in short batches (a gentler clearsessions). "
+        "Does nothing for session engines without a table, such as signed cookies."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Sessions deleted per statement.")
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds to sleep between batches.")
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help="Keep running, purging every SECONDS (simple scheduler loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            deleted = identity.purge_expired_sessions(
+                batch_size=options['batch_size'], pause=options['pause'],
+                progress=lambda deleted: self.stderr.write(f"  {deleted} session(s) deleted"),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {deleted} expired session(s) in {time.perf_counter() - started:.2f}s."
+            ))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the catalog search index from scratch in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows fetched and inserted per batch.")
+
+    def handle(self, *args, **options):
+        count = search.rebuild_index(chunk_size=options['chunk_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Search index rebuilt for {count} books."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from core import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard counters from scratch and report any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report drift; leave the stored counters untouched.")
+
+    def handle(self, *args, **options):
+        drift = stats.recompute(save=not options['dry_run'])
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Dashboard counters are in sync."))
+            return
+        for field, (stored, actual) in drift.items():
+            self.stdout.write(self.style.WARNING(f"{field}: stored {stored}, actual {actual} (drift {stored - actual:+})"))
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Counters corrected."))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import analytics
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold loans made since the last run into the popularity and \"also borrowed\" tables. "
+        "--rebuild recomputes them from the whole loan history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=analytics.analytics_settings()['BATCH_SIZE'],
+                            help="Loans folded per transaction.")
+        parser.add_argument('--rebuild', action='store_true', help="Empty the tables and start from the first loan.")
+        parser.add_argument('--loop', type=int, metavar='SECONDS', default=0,
+                            help="Keep running, refreshing every SECONDS (simple scheduler loop).")
+
+    def handle(self, *args, **options):
+        rebuild = options['rebuild']
+        while True:
+            started = time.perf_counter()
+            processed = analytics.refresh(
+                batch_size=options['batch_size'], rebuild=rebuild,
+                progress=lambda n, watermark: self.stderr.write(f"  {n} loan(s), up to id {watermark}"),
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Folded {processed} loan(s) in {time.perf_counter() - started:.2f}s."
+            ))
+            if not options['loop']:
+                break
+            rebuild = False
+            time.sleep(options['loop'])
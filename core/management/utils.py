@@ -0,0 +1,44 @@
+"""Helpers shared by the diagnostic/benchmark management commands."""
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from core.models import Book, Member, Transaction
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def percentile(samples, pct):
+    """The nearest-rank `pct`th percentile of a non-empty list of samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def sample_users():
+    """
+    A staff user and a member with at least one loan, creating them if the
+    database has none. Call inside rolled_back() so nothing is left behind.
+    """
+    staff = User.objects.filter(is_staff=True).first() or User.objects.create_user('bench-staff', is_staff=True)
+    member = Member.objects.select_related('user').filter(transaction__isnull=False).first()
+    if member is None:
+        user = User.objects.create_user('bench-member')
+        member = Member.objects.create(user=user, membership_id='BENCH', phone_number='0', address='-')
+        book = Book.objects.first() or Book.objects.create(
+            title='Bench', author='Bench', isbn='0000000000000', genre='Bench')
+        Transaction.objects.create(book=book, member=member)
+    return {'staff': staff, 'member': member.user}
@@ -0,0 +1,88 @@
+"""
+Membership ID allocation.
+
+IDs are 10 digits: a 9-digit number from the MembershipSequence row followed
+by a Luhn check digit, so a mistyped digit or swapped neighbours at the desk
+is rejected rather than matching someone else. Numbers come from one
+counter, so two signups can never get the same ID and nothing has to be
+retried. The older 8-character random IDs and the synthetic SYN... IDs have
+different lengths and can't clash with these either.
+
+To keep the counter row from becoming a hot spot, each process reserves
+BLOCK_SIZE numbers at a time (one short UPDATE) and hands them out from
+memory. Numbers reserved by a process that exits unused are simply skipped;
+IDs are unique, not gapless.
+"""
+import threading
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import MembershipSequence
+
+BLOCK_SIZE = 100
+SEQUENCE_PK = 1
+DIGITS = 9
+
+
+def check_digit(number):
+    """Luhn check digit for a string of digits."""
+    total = 0
+    for i, digit in enumerate(reversed(number)):
+        value = int(digit) * (2 if i % 2 == 0 else 1)
+        total += value - 9 if value > 9 else value
+    return str(-total % 10)
+
+
+def format_id(value):
+    number = f"{value:0{DIGITS}d}"
+    return number + check_digit(number)
+
+
+def is_valid(membership_id):
+    """True for a well-formed ID from this allocator (checks length and check digit)."""
+    return (len(membership_id) == DIGITS + 1 and membership_id.isdigit()
+            and check_digit(membership_id[:-1]) == membership_id[-1])
+
+
+def reserve(count):
+    """Reserve `count` consecutive numbers in the current transaction; returns the first."""
+    with transaction.atomic():
+        # The UPDATE locks the row until commit, so the value read back is ours alone.
+        updated = MembershipSequence.objects.filter(pk=SEQUENCE_PK).update(next_value=F('next_value') + count)
+        if not updated:
+            MembershipSequence.objects.get_or_create(pk=SEQUENCE_PK)
+            MembershipSequence.objects.filter(pk=SEQUENCE_PK).update(next_value=F('next_value') + count)
+        return MembershipSequence.objects.values_list('next_value', flat=True).get(pk=SEQUENCE_PK) - count
+
+
+class Allocator:
+    """Hands out membership IDs from blocks reserved BLOCK_SIZE at a time; thread-safe."""
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def allocate(self, count=1):
+        """Return `count` new membership IDs."""
+        if count >= self.block_size or connection.in_atomic_block:
+            # Inside the caller's transaction a reservation commits or rolls back with it,
+            # so its leftovers can't be kept for later callers; take exactly what's needed.
+            start = reserve(count)
+            return [format_id(value) for value in range(start, start + count)]
+        with self._lock:
+            if self._end - self._next < count:
+                self._next = reserve(self.block_size)
+                self._end = self._next + self.block_size
+            values = range(self._next, self._next + count)
+            self._next += count
+        return [format_id(value) for value in values]
+
+
+allocator = Allocator()
+
+
+def next_id():
+    """One new membership ID."""
+    return allocator.allocate()[0]
@@ -0,0 +1,191 @@
+"""
+In-process request metrics.
+
+MetricsMiddleware (core/middleware.py) records one observation per request
+into fixed-bucket histograms keyed by URL name. Histograms are cumulative
+since process start, which is what Prometheus expects: rates and quantiles
+over a rolling window come from rate()/histogram_quantile() on the scraper
+side. Each worker process keeps its own numbers; scrape every worker or put
+them behind something that does.
+
+Template render time is measured by TimedDjangoTemplates, a drop-in for the
+stock DjangoTemplates backend (see TEMPLATES in settings).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template
+
+# Bucket upper bounds per metric (Prometheus adds +Inf).
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 250)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+METRICS = {
+    'libmgs_request_duration_seconds': ('Wall time spent handling the request.', SECONDS_BUCKETS),
+    'libmgs_request_db_seconds': ('Time spent executing SQL during the request.', SECONDS_BUCKETS),
+    'libmgs_request_queries': ('SQL queries executed during the request.', QUERY_BUCKETS),
+    'libmgs_template_render_seconds': ('Time spent rendering templates during the request.', SECONDS_BUCKETS),
+    'libmgs_response_bytes': ('Size of the response body.', BYTES_BUCKETS),
+}
+COUNTERS = {
+    'libmgs_cache_requests_total': 'Catalog cache lookups, by cache layer and result.',
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms per (metric, view), a response counter per (view, status) and labelled counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._responses = {}
+            self._counters = {}
+
+    def observe(self, view, status, values):
+        """Record one request; `values` maps metric name -> observation (None skips it)."""
+        with self._lock:
+            key = (view, status)
+            self._responses[key] = self._responses.get(key, 0) + 1
+            for metric, value in values.items():
+                if value is None:
+                    continue
+                histogram = self._histograms.get((metric, view))
+                if histogram is None:
+                    histogram = self._histograms[(metric, view)] = Histogram(METRICS[metric][1])
+                histogram.observe(value)
+
+    def increment(self, counter, labels, amount=1):
+        """Add to a counter from COUNTERS; `labels` is a tuple of (name, value) pairs."""
+        if not amount:
+            return
+        with self._lock:
+            key = (counter, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            histograms = {
+                key: (list(h.counts), h.total, h.count) for key, h in self._histograms.items()
+            }
+            responses = dict(self._responses)
+            counters = dict(self._counters)
+
+        lines = [
+            '# HELP libmgs_responses_total Responses sent, by view and status code.',
+            '# TYPE libmgs_responses_total counter',
+        ]
+        for (view, status), count in sorted(responses.items()):
+            lines.append(f'libmgs_responses_total{{view="{_escape(view)}",status="{status}"}} {count}')
+
+        for counter, help_text in COUNTERS.items():
+            lines.append(f'# HELP {counter} {help_text}')
+            lines.append(f'# TYPE {counter} counter')
+            for (name, labels), count in sorted(counters.items()):
+                if name == counter:
+                    label = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+                    lines.append(f'{counter}{{{label}}} {count}')
+
+        for metric, (help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (name, view), (counts, total, count) in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                label = f'view="{_escape(view)}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{{label}}} {total:.6g}')
+                lines.append(f'{metric}_count{{{label}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+# --- PER-REQUEST STATE ---
+
+class RequestTimings:
+    """Accumulates DB and template time for the request being handled."""
+    __slots__ = ('queries', 'db_time', 'template_time', 'statements')
+
+    def __init__(self, capture_sql=False):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = [] if capture_sql else None
+
+
+current = ContextVar('libmgs_request_timings', default=None)
+
+# Most statements kept for one slow-request log entry.
+MAX_LOGGED_STATEMENTS = 200
+
+
+def timed_execute(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the current request's timings."""
+    timings = current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        timings.queries += 1
+        timings.db_time += duration
+        if timings.statements is not None and len(timings.statements) < MAX_LOGGED_STATEMENTS:
+            timings.statements.append((duration, sql))
+
+
+# --- TEMPLATE TIMING ---
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current.get()
+        if timings is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose top-level renders count towards the request's template time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
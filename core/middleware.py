@@ -0,0 +1,93 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import metrics
+
+slow_logger = logging.getLogger('core.slow_requests')
+
+
+def metrics_settings():
+    conf = getattr(settings, 'LIBMGS_METRICS', {})
+    return conf.get('ENABLED', True), conf.get('SLOW_REQUEST_MS')
+
+
+class MetricsMiddleware:
+    """
+    Record wall time, DB time, query count, template time and response size
+    per URL name into core.metrics.registry. With LIBMGS_METRICS['SLOW_REQUEST_MS']
+    set, requests slower than that are logged to 'core.slow_requests' with their SQL.
+    Streaming responses are timed up to the first byte and have no size recorded.
+
+    Works under WSGI and ASGI. SQL is timed by metrics.timed_execute, which is
+    installed on every database connection (see core/signals.py) and reads the
+    request's timings from a context variable, so ORM calls made from async
+    views on executor threads are counted too.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        enabled, slow_ms = metrics_settings()
+        if not enabled:
+            return self.get_response(request)
+
+        timings, token, start = self._start(slow_ms)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self._finish(request, response, timings, start, slow_ms)
+        return response
+
+    async def __acall__(self, request):
+        enabled, slow_ms = metrics_settings()
+        if not enabled:
+            return await self.get_response(request)
+
+        timings, token, start = self._start(slow_ms)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        self._finish(request, response, timings, start, slow_ms)
+        return response
+
+    def _start(self, slow_ms):
+        timings = metrics.RequestTimings(capture_sql=slow_ms is not None)
+        return timings, metrics.current.set(timings), time.perf_counter()
+
+    def _finish(self, request, response, timings, start, slow_ms):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        values = {
+            'libmgs_request_duration_seconds': elapsed,
+            'libmgs_request_db_seconds': timings.db_time,
+            'libmgs_request_queries': timings.queries,
+            'libmgs_template_render_seconds': timings.template_time,
+            'libmgs_response_bytes': None if response.streaming else len(response.content),
+        }
+        metrics.registry.observe(view, response.status_code, values)
+
+        if slow_ms is not None and elapsed * 1000 >= slow_ms:
+            self._log_slow(request, view, elapsed, timings)
+
+    def _log_slow(self, request, view, elapsed, timings):
+        lines = [
+            f"Slow request: {request.method} {request.get_full_path()} ({view}) took {elapsed * 1000:.0f} ms, "
+            f"{timings.queries} queries in {timings.db_time * 1000:.0f} ms, "
+            f"templates {timings.template_time * 1000:.0f} ms"
+        ]
+        lines.extend(f"  {duration * 1000:8.2f} ms  {sql}" for duration, sql in timings.statements)
+        slow_logger.warning('\n'.join(lines))
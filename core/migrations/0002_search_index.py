@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:47
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Frozen copies of core.search's tokenizer, so this migration keeps building
+# the same index however the live code changes later.
+FIELD_WEIGHTS = {'title': 3, 'author': 2, 'genre': 1}
+MAX_TERM_LENGTH = 64
+_SPLIT_RE = re.compile(r'[^0-9a-z]+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text))
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return [t[:MAX_TERM_LENGTH] for t in _SPLIT_RE.split(text) if t]
+
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def book_terms(book):
+    weights = {}
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term in set(tokenize(getattr(book, field))):
+            weights[term] = weights.get(term, 0) + field_weight
+    return weights
+
+
+def build_index(apps, schema_editor):
+    # Index the books already in the catalog; later writes keep it up to date.
+    Book = apps.get_model('core', 'Book')
+    SearchToken = apps.get_model('core', 'SearchToken')
+    SearchGram = apps.get_model('core', 'SearchGram')
+    tokens, terms = [], set()
+    for book in Book.objects.only('id', *FIELD_WEIGHTS).order_by('id').iterator(chunk_size=2000):
+        for term, weight in book_terms(book).items():
+            tokens.append(SearchToken(term=term, book_id=book.pk, weight=weight))
+            terms.add(term)
+        if len(tokens) >= 2000:
+            SearchToken.objects.bulk_create(tokens)
+            tokens = []
+    SearchToken.objects.bulk_create(tokens)
+    SearchGram.objects.bulk_create([SearchGram(gram=gram, term=term) for term in terms for gram in trigrams(term)],
+                                   batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('term', models.CharField(max_length=64)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('gram', 'term'), name='core_searchgram_gram_term_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'book'], name='core_searchtoken_term_book')],
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:51
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def seed_stats(apps, schema_editor):
+    Book = apps.get_model('core', 'Book')
+    Member = apps.get_model('core', 'Member')
+    Transaction = apps.get_model('core', 'Transaction')
+    LibraryStats = apps.get_model('core', 'LibraryStats')
+    LibraryStats.objects.update_or_create(pk=1, defaults={
+        'total_copies': Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0,
+        'books_issued': Transaction.objects.filter(status='Issued').count(),
+        'total_members': Member.objects.count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_copies', models.BigIntegerField(default=0)),
+                ('books_issued', models.BigIntegerField(default=0)),
+                ('total_members', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'library stats',
+            },
+        ),
+        migrations.RunPython(seed_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_library_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['title', 'id'], name='core_book_title_id'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'expected_return_date', 'id'], name='core_txn_status_due'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('status', 'Issued')), fields=['expected_return_date', 'id'], name='core_txn_active_due'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['member', '-issue_date'], name='core_txn_member_issued'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-issue_date'], name='core_txn_issued'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='librarystats',
+            name='accrued_fines',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+    ]
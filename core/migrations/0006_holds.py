@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_accrued_fines'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('Waiting', 'Waiting'), ('Ready', 'Ready'), ('Fulfilled', 'Fulfilled'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], default='Waiting', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('ready_until', models.DateTimeField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='core.book')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='core.member')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', 'status', 'id'], name='core_hold_book_queue'), models.Index(fields=['member', 'status'], name='core_hold_member_status'), models.Index(fields=['status', 'ready_until'], name='core_hold_status_ready')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ('Waiting', 'Ready'))), fields=('book', 'member'), name='core_hold_one_open_per_member')],
+            },
+        ),
+    ]
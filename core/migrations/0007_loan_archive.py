@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_holds'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('issue_date', models.DateTimeField()),
+                ('expected_return_date', models.DateField()),
+                ('actual_return_date', models.DateField()),
+                ('fine_amount', models.DecimalField(decimal_places=2, default=0, max_digits=6)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'actual_return_date'], name='core_txn_status_returned'),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.book'),
+        ),
+        migrations.AddField(
+            model_name='archivedtransaction',
+            name='member',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.member'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['member', '-issue_date'], name='core_archtxn_member_issued'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_loan_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_membership_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BorrowCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('M', 'Month'), ('W', 'Week')], max_length=1)),
+                ('bucket', models.DateField()),
+                ('genre', models.CharField(max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'bucket', '-count', 'book'], name='core_borrowcount_top'), models.Index(fields=['genre', 'period', 'bucket', '-count', 'book'], name='core_borrowcount_genre_top')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'period', 'bucket'), name='core_borrowcount_book_bucket_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CoBorrow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['book', '-score', 'other'], name='core_coborrow_book_top')],
+                'constraints': [models.UniqueConstraint(fields=('book', 'other'), name='core_coborrow_pair_uniq')],
+            },
+        ),
+    ]
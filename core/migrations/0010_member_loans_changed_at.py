@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='loans_changed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_member_loans_changed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoverImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_url', models.URLField(unique=True)),
+                ('digest', models.CharField(blank=True, max_length=64)),
+                ('source_bytes', models.PositiveIntegerField(blank=True, null=True)),
+                ('thumbnail_bytes', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('fetched_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_thumbnail',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:14
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
+
+
+def seed_counters(apps, schema_editor):
+    # Same set-based rebuild as core.borrowing.reconcile(), in one statement.
+    Member = apps.get_model('core', 'Member')
+    Transaction = apps.get_model('core', 'Transaction')
+    ArchivedTransaction = apps.get_model('core', 'ArchivedTransaction')
+    money = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def per_member(queryset, aggregate, default):
+        return Coalesce(Subquery(
+            queryset.filter(member_id=OuterRef('pk')).order_by().values('member_id')
+            .annotate(value=aggregate).values('value')
+        ), default)
+
+    active = Transaction.objects.filter(status='Issued')
+    Member.objects.update(
+        active_loans=per_member(active, Count('id'), 0),
+        overdue_loans=per_member(active.filter(expected_return_date__lt=Now()), Count('id'), 0),
+        overdue_counted_at=Now(),
+        outstanding_fines=(
+            per_member(Transaction.objects.all(), Sum('fine_amount'), Value(Decimal('0.00'), output_field=money))
+            + per_member(ArchivedTransaction.objects.all(), Sum('fine_amount'),
+                         Value(Decimal('0.00'), output_field=money))
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_cover_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='active_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='fines_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='outstanding_fines',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='overdue_counted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='overdue_loans',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.urls import reverse
 from django.utils import timezone
 
 # --- MEMBER MODEL ---
@@ -9,10 +10,38 @@ class Member(models.Model):
     phone_number = models.CharField(max_length=15)
     address = models.TextField()
     joined_at = models.DateTimeField(auto_now_add=True)
+    # Last issue/return/fine change to this member's loans; validators for the loan API
+    loans_changed_at = models.DateTimeField(null=True, blank=True)
+    # Loan counters behind the borrowing limits (core.borrowing); only ever changed with F() updates
+    active_loans = models.PositiveIntegerField(default=0)
+    overdue_loans = models.PositiveIntegerField(default=0)
+    overdue_counted_at = models.DateTimeField(null=True, blank=True)
+    outstanding_fines = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    fines_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    # Written by UPDATE statements elsewhere; save() on an existing member leaves them alone.
+    UPDATED_IN_PLACE = ('loans_changed_at', 'active_loans', 'overdue_loans', 'overdue_counted_at',
+                        'outstanding_fines', 'fines_paid')
 
     def __str__(self):
         return f"{self.user.username} ({self.membership_id})"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.UPDATED_IN_PLACE and f.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+class MembershipSequence(models.Model):
+    """Single-row counter behind core.membership's collision-free membership IDs."""
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"Next membership number {self.next_value}"
+
 # --- BOOK MODEL ---
 class Book(models.Model):
     title = models.CharField(max_length=255)
@@ -22,11 +51,49 @@ class Book(models.Model):
     total_copies = models.PositiveIntegerField(default=1)
     available_copies = models.PositiveIntegerField(default=1)
     cover_image_url = models.URLField(blank=True, null=True) # Store image link
+    # Digest of the local thumbnail made from cover_image_url (core.covers); blank until built
+    cover_thumbnail = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # Catalog and manage_books listings are keyset-paginated on (title, id)
+            models.Index(fields=['title', 'id'], name='core_book_title_id'),
+        ]
     
     def __str__(self):
         return self.title
 
+    @property
+    def cover_thumbnail_url(self):
+        return reverse('cover_thumbnail', args=[self.cover_thumbnail]) if self.cover_thumbnail else None
+
+class CoverImage(models.Model):
+    """One fetched cover URL: the thumbnail it produced (or why it failed) and the bytes saved."""
+    source_url = models.URLField(unique=True)
+    digest = models.CharField(max_length=64, blank=True)
+    source_bytes = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_bytes = models.PositiveIntegerField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.source_url
+
 # --- TRANSACTION MODEL ---
+class TransactionQuerySet(models.QuerySet):
+    def with_related(self):
+        """Join the book and member/user so templates and __str__ don't query per row."""
+        return self.select_related('book', 'member__user')
+
+    def active(self):
+        return self.filter(status='Issued')
+
+    def overdue(self, now=None):
+        return self.active().filter(expected_return_date__lt=now or timezone.now())
+
+    def for_member(self, member):
+        return self.filter(member=member)
+
 class Transaction(models.Model):
     STATUS_CHOICES = (
         ('Issued', 'Issued'),
@@ -43,6 +110,24 @@ class Transaction(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Issued')
     fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Overdue counts and all_transactions: status filter, keyset on (due date, id)
+            models.Index(fields=['status', 'expected_return_date', 'id'], name='core_txn_status_due'),
+            # Same access path restricted to open loans. Partial, so built only where the backend
+            # supports it (SQLite, PostgreSQL); on MySQL core_txn_status_due serves these queries.
+            models.Index(fields=['expected_return_date', 'id'], name='core_txn_active_due',
+                         condition=models.Q(status='Issued')),
+            # Member dashboard: a member's loans, newest first
+            models.Index(fields=['member', '-issue_date'], name='core_txn_member_issued'),
+            # Admin dashboard recent activity
+            models.Index(fields=['-issue_date'], name='core_txn_issued'),
+            # Archival takes the oldest returns first (core.archive)
+            models.Index(fields=['status', 'actual_return_date'], name='core_txn_status_returned'),
+        ]
+
     def save(self, *args, **kwargs):
         # Auto-set expected return date to 14 days from now if not set
         if not self.id and not self.expected_return_date:
@@ -50,4 +135,201 @@ class Transaction(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.book.title} - {self.member.user.username}"
\ No newline at end of file
+        return f"{self.book.title} - {self.member.user.username}"
+
+# --- LOAN ARCHIVE ---
+class ArchivedTransactionQuerySet(models.QuerySet):
+    def for_member(self, member):
+        return self.filter(member=member)
+
+class ArchivedTransaction(models.Model):
+    """
+    A returned loan moved out of Transaction by core.archive, keeping its id.
+    Compact: no status column (always Returned) and the due/return dates as
+    plain dates, which is all the history pages and exports show.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    issue_date = models.DateTimeField()
+    expected_return_date = models.DateField()
+    actual_return_date = models.DateField()
+    fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0)
+
+    # Read like a Transaction in templates that list both
+    status = 'Returned'
+
+    objects = ArchivedTransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Member history, newest first
+            models.Index(fields=['member', '-issue_date'], name='core_archtxn_member_issued'),
+        ]
+
+    def __str__(self):
+        return f"{self.book.title} - {self.member.user.username} (archived)"
+
+# --- ANALYTICS (POPULARITY AND RECOMMENDATIONS) ---
+class AnalyticsState(models.Model):
+    """Single row: how far core.analytics has folded the loan history into the tables below."""
+    last_transaction_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Analytics up to loan {self.last_transaction_id}"
+
+class BorrowCount(models.Model):
+    """Loans of one book per calendar month ('M') or ISO week ('W'), keyed by the period's first day."""
+    PERIOD_CHOICES = (
+        ('M', 'Month'),
+        ('W', 'Week'),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    bucket = models.DateField()
+    # The book's genre when counted, so "trending in genre" needs no join
+    genre = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'period', 'bucket'], name='core_borrowcount_book_bucket_uniq'),
+        ]
+        indexes = [
+            # Most borrowed in a period
+            models.Index(fields=['period', 'bucket', '-count', 'book'], name='core_borrowcount_top'),
+            # Trending in a genre
+            models.Index(fields=['genre', 'period', 'bucket', '-count', 'book'], name='core_borrowcount_genre_top'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {self.period}{self.bucket}: {self.count}"
+
+class CoBorrow(models.Model):
+    """Members who borrowed `book` also borrowed `other` (score = such members); top-K per book."""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'other'], name='core_coborrow_pair_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['book', '-score', 'other'], name='core_coborrow_book_top'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.other_id}: {self.score}"
+
+# --- DASHBOARD STATS ---
+class LibraryStats(models.Model):
+    """
+    Single-row summary table maintained incrementally by the circulation,
+    book and signup paths. `reconcile_stats` rebuilds it from scratch.
+    """
+    total_copies = models.BigIntegerField(default=0)
+    books_issued = models.BigIntegerField(default=0)
+    total_members = models.BigIntegerField(default=0)
+    # Sum of fines accrued on open loans, refreshed by each accrue_fines run
+    accrued_fines = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "library stats"
+
+    def __str__(self):
+        return f"Stats ({self.updated_at:%Y-%m-%d %H:%M})"
+
+
+# --- SEARCH INDEX MODELS ---
+class SearchToken(models.Model):
+    """Inverted index posting: one row per (term, book) with a field-based weight."""
+    term = models.CharField(max_length=64)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'book'], name='core_searchtoken_term_book'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.book_id}"
+
+class SearchGram(models.Model):
+    """Trigram vocabulary used to find typo-tolerant candidates for a query term."""
+    gram = models.CharField(max_length=3)
+    term = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['gram', 'term'], name='core_searchgram_gram_term_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.gram} ~ {self.term}"
+
+
+# --- HOLDS (RESERVATIONS) ---
+class HoldQuerySet(models.QuerySet):
+    def waiting(self):
+        return self.filter(status='Waiting')
+
+    def open(self):
+        return self.filter(status__in=('Waiting', 'Ready'))
+
+    def queue(self, book_id):
+        """A book's waitlist in FIFO order (served by core_hold_book_queue)."""
+        return self.filter(book_id=book_id, status='Waiting').order_by('id')
+
+    def with_positions(self):
+        """Annotate queue_position (1-based; meaningful for Waiting holds) with one correlated count each."""
+        ahead = (
+            Hold.objects.filter(book=models.OuterRef('book'), status='Waiting', id__lte=models.OuterRef('id'))
+            .order_by().values('book').annotate(n=models.Count('id')).values('n')
+        )
+        return self.annotate(queue_position=models.Subquery(ahead))
+
+class Hold(models.Model):
+    """
+    A member's place in a book's waitlist. Returned copies go to the oldest
+    Waiting hold, which becomes Ready and keeps the copy off the shelf until
+    `ready_until`; issuing the book to that member fulfils it.
+    """
+    STATUS_CHOICES = (
+        ('Waiting', 'Waiting'),
+        ('Ready', 'Ready'),
+        ('Fulfilled', 'Fulfilled'),
+        ('Cancelled', 'Cancelled'),
+        ('Expired', 'Expired'),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holds')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='holds')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Waiting')
+    created_at = models.DateTimeField(auto_now_add=True)
+    ready_until = models.DateTimeField(null=True, blank=True)
+
+    objects = HoldQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Queue head and positions: WHERE book = ? AND status = 'Waiting' [AND id < ?] ORDER BY id
+            models.Index(fields=['book', 'status', 'id'], name='core_hold_book_queue'),
+            # Member dashboard and duplicate-hold checks
+            models.Index(fields=['member', 'status'], name='core_hold_member_status'),
+            # Expiry sweep over Ready holds past their pickup window
+            models.Index(fields=['status', 'ready_until'], name='core_hold_status_ready'),
+        ]
+        constraints = [
+            # One open hold per member and book (conditional constraints are skipped on MySQL;
+            # core.holds.place_hold checks as well)
+            models.UniqueConstraint(fields=['book', 'member'], condition=models.Q(status__in=('Waiting', 'Ready')),
+                                    name='core_hold_one_open_per_member'),
+        ]
+
+    def __str__(self):
+        return f"{self.book} - {self.member} ({self.status})"
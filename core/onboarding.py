@@ -0,0 +1,147 @@
+"""
+Bulk member onboarding for whole student cohorts.
+
+CSV rows are validated and created in chunks: User and Member rows go in
+with bulk_create, one transaction per chunk, with membership IDs from
+core.membership. Rows without a password get a random one, which is
+returned so it can be handed out.
+
+Password hashing is nearly all of the cost. Each chunk's hashes are computed
+on a thread pool before its transaction (hashlib's PBKDF2 releases the GIL),
+and the PBKDF2 iteration count for these initial passwords can be lowered.
+Django re-hashes a password whose iteration count differs from the site's
+on the member's first successful login, so a cheap initial hash is replaced
+by a full-cost one as soon as the account is used.
+
+Expected columns: username, email, first_name, last_name, phone_number,
+address, password (all optional except username).
+"""
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils.crypto import get_random_string
+
+from . import membership, stats
+from .imports import RejectedRow
+from .models import Member
+
+CHUNK_SIZE = 500
+MAX_LENGTHS = {'username': 150, 'email': 254, 'first_name': 150, 'last_name': 150, 'phone_number': 15}
+
+_validate_username = User.username_validator
+
+
+def cohort_hasher(iterations=None):
+    """PBKDF2 hasher with `iterations` rounds; None uses the site's default hasher."""
+    if iterations is None:
+        return get_hasher()
+    hasher = PBKDF2PasswordHasher()
+    hasher.iterations = iterations
+    return hasher
+
+
+def clean_row(record):
+    """Validate one CSV row and return a normalized dict."""
+    cleaned = {}
+    for field, max_length in MAX_LENGTHS.items():
+        value = str(record.get(field) or '').strip()
+        if len(value) > max_length:
+            raise RejectedRow(f"{field} longer than {max_length} characters")
+        cleaned[field] = value
+    if not cleaned['username']:
+        raise RejectedRow("missing username")
+    try:
+        _validate_username(cleaned['username'])
+        if cleaned['email']:
+            validate_email(cleaned['email'])
+    except ValidationError as e:
+        raise RejectedRow(e.messages[0])
+    cleaned['address'] = str(record.get('address') or '').strip()
+    cleaned['password'] = record.get('password') or ''
+    return cleaned
+
+
+class OnboardResult:
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.rejected = []  # (line_number, reason)
+        self.credentials = []  # (username, membership_id, generated password or '')
+
+
+def create_chunk(rows, hasher, workers, result):
+    """Create members for a chunk of (line_number, cleaned row) pairs."""
+    taken = set(User.objects.filter(username__in=[row['username'] for _, row in rows])
+                .values_list('username', flat=True))
+    fresh, seen = [], set()
+    for line_number, row in rows:
+        if row['username'] in taken or row['username'] in seen:
+            result.rejected.append((line_number, f"username '{row['username']}' already exists"))
+        else:
+            seen.add(row['username'])
+            fresh.append(row)
+    if not fresh:
+        return
+
+    generated = [not row['password'] for row in fresh]
+    passwords = [row['password'] or get_random_string(12) for row in fresh]
+    with ThreadPoolExecutor(workers) as pool:
+        hashes = list(pool.map(lambda password: make_password(password, hasher=hasher), passwords))
+    ids = membership.allocator.allocate(len(fresh))
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=row['username'], email=row['email'], first_name=row['first_name'],
+                 last_name=row['last_name'], password=encoded)
+            for row, encoded in zip(fresh, hashes)
+        ])
+        if users[0].pk is None:
+            # MySQL doesn't return ids from a bulk INSERT; read them back.
+            user_ids = dict(User.objects.filter(username__in=seen).values_list('username', 'id'))
+            for user in users:
+                user.pk = user_ids[user.username]
+        # bulk_create skips the signup signal that counts members
+        Member.objects.bulk_create([
+            Member(user_id=user.pk, membership_id=membership_id,
+                   phone_number=row['phone_number'], address=row['address'])
+            for user, row, membership_id in zip(users, fresh, ids)
+        ])
+        stats.bump(total_members=len(users))
+
+    result.created += len(users)
+    result.credentials.extend(
+        (row['username'], membership_id, password if was_generated else '')
+        for row, membership_id, password, was_generated in zip(fresh, ids, passwords, generated)
+    )
+
+
+def onboard(fh, chunk_size=CHUNK_SIZE, iterations=None, workers=4, progress=None):
+    """
+    Create members from an open CSV text stream. `progress(result)` is called
+    after every chunk. Returns an OnboardResult.
+    """
+    hasher = cohort_hasher(iterations)
+    result = OnboardResult()
+    reader = csv.DictReader(fh)
+    chunk = []
+    for record in reader:
+        result.processed += 1
+        try:
+            chunk.append((reader.line_num, clean_row(record)))
+        except RejectedRow as e:
+            result.rejected.append((reader.line_num, str(e)))
+        if len(chunk) >= chunk_size:
+            create_chunk(chunk, hasher, workers, result)
+            chunk = []
+            if progress:
+                progress(result)
+    if chunk:
+        create_chunk(chunk, hasher, workers, result)
+        if progress:
+            progress(result)
+    return result
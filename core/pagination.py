@@ -0,0 +1,207 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are addressed by the sort key of the last/first row shown instead of
+an OFFSET, so fetching page 1000 costs the same as fetching page 1. The
+ordering must be unique (always end it with the primary key).
+"""
+import base64
+import binascii
+import datetime
+import heapq
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return ['dt', value.isoformat()]
+    if isinstance(value, Decimal):
+        return ['dec', str(value)]
+    return ['v', value]
+
+
+def _decode_value(item):
+    kind, value = item
+    if kind == 'dt':
+        return parse_datetime(value)
+    if kind == 'dec':
+        return Decimal(value)
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Decode a cursor token; returns None for anything malformed or of the wrong arity."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = [_decode_value(item) for item in json.loads(base64.urlsafe_b64decode(padded))]
+    except (ValueError, TypeError, binascii.Error):
+        return None
+    if len(values) != size or any(v is None for v in values):
+        return None
+    return values
+
+
+def _clean_cursor(queryset, ordering, values):
+    """
+    `values` converted to their ordering fields' types, or None if any can't
+    be: cursors come from the client and may be forged or mangled.
+    """
+    cleaned = []
+    for key, value in zip(ordering, values):
+        name = key.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        try:
+            field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+            cleaned.append(field.to_python(value))
+        except (FieldDoesNotExist, TypeError, ValueError, ValidationError):
+            return None
+    return None if any(v is None for v in cleaned) else cleaned
+
+
+def _row_value(row, field):
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def _seek_filter(ordering, values, forward):
+    """WHERE clause selecting rows strictly after (or before) `values` in `ordering`."""
+    condition = Q()
+    for i, key in enumerate(ordering):
+        field = key.lstrip('-')
+        descending = key.startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        step = Q(**{f'{field}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= step
+    return condition
+
+
+def _reverse(ordering):
+    return [key[1:] if key.startswith('-') else f'-{key}' for key in ordering]
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(request.GET.get('size', default))
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
+
+
+class KeysetPage:
+    """One page of results plus the query strings for its neighbours."""
+
+    def __init__(self, object_list, next_query=None, prev_query=None):
+        self.object_list = object_list
+        self.next_query = next_query
+        self.prev_query = prev_query
+
+    @property
+    def has_next(self):
+        return self.next_query is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_query is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _seek(request, queryset, ordering, default_size, max_size):
+    """The queryset slice to fetch for a page, plus what _page() needs to assemble it."""
+    ordering = list(ordering)
+    size = get_page_size(request, default_size, max_size)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    forward = True
+    cursor = decode_cursor(after, len(ordering)) if after else None
+    if cursor is None and before:
+        cursor = decode_cursor(before, len(ordering))
+        forward = cursor is None
+    if cursor is not None:
+        # A cursor that doesn't fit the ordering's fields reads as no cursor: the first page.
+        cursor = _clean_cursor(queryset, ordering, cursor)
+        forward = forward or cursor is None
+
+    qs = queryset
+    if cursor is not None:
+        qs = qs.filter(_seek_filter(ordering, cursor, forward))
+    qs = qs.order_by(*(ordering if forward else _reverse(ordering)))
+    # Fetch one extra row to know whether another page exists.
+    return qs[:size + 1], (ordering, size, forward, cursor)
+
+
+def _page(request, rows, state):
+    ordering, size, forward, cursor = state
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not forward:
+        rows.reverse()
+
+    fields = [key.lstrip('-') for key in ordering]
+
+    def query_for(param, row):
+        params = request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[param] = encode_cursor([_row_value(row, f) for f in fields])
+        return params.urlencode()
+
+    next_query = prev_query = None
+    if rows:
+        if has_more or not forward:
+            next_query = query_for('after', rows[-1])
+        if (has_more and not forward) or (forward and cursor is not None):
+            prev_query = query_for('before', rows[0])
+    return KeysetPage(rows, next_query, prev_query)
+
+
+def keyset_paginate(request, queryset, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    """Return a KeysetPage of `queryset` for the `after`/`before`/`size` GET parameters."""
+    qs, state = _seek(request, queryset, ordering, default_size, max_size)
+    return _page(request, list(qs), state)
+
+
+def keyset_paginate_many(request, querysets, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    """
+    keyset_paginate() over several querysets read as one list, e.g. a table
+    and its archive. Each is seeked and fetched separately and the results
+    merged; `ordering` must be unique across all of them and sort every key
+    the same way.
+    """
+    if len({key.startswith('-') for key in ordering}) != 1:
+        raise ValueError("keyset_paginate_many() needs every ordering key in the same direction.")
+    fetched = [_seek(request, queryset, ordering, default_size, max_size) for queryset in querysets]
+    state = fetched[0][1]
+    _, size, forward, _ = state
+    fields = [key.lstrip('-') for key in ordering]
+    rows = heapq.merge(
+        *(list(qs) for qs, _ in fetched),
+        key=lambda row: tuple(_row_value(row, f) for f in fields),
+        reverse=ordering[0].startswith('-') == forward,
+    )
+    return _page(request, list(rows)[:size + 1], state)
+
+
+async def akeyset_paginate(request, queryset, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+    """keyset_paginate() for async views: the page is fetched with async iteration."""
+    qs, state = _seek(request, queryset, ordering, default_size, max_size)
+    return _page(request, [row async for row in qs], state)
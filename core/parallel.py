@@ -0,0 +1,31 @@
+"""
+Run independent ORM work concurrently from async views.
+
+Django's async ORM methods (aget, acount, ...) hand each query to the
+request's single thread-sensitive executor, so two of them awaited with
+asyncio.gather() still execute one after the other on one connection.
+gather() here runs each callable on its own worker thread, and therefore
+its own database connection, which lets the database work on them at the
+same time. Each call closes the connections it opened when it finishes:
+the worker threads belong to a shared pool, and a persistent connection
+(CONN_MAX_AGE) left on one would stay open, since request_finished only
+closes the request thread's connections.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+
+def _on_own_connection(func):
+    def run():
+        try:
+            return func()
+        finally:
+            connections.close_all()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def gather(*funcs):
+    """Call the sync callables `funcs` concurrently; returns their results in order."""
+    return await asyncio.gather(*(_on_own_connection(func)() for func in funcs))
@@ -0,0 +1,153 @@
+"""
+Read replicas: database routing with read-your-writes pinning.
+
+Writes always go to the primary (`default`). Reads go to a replica only in
+views marked @replica_reads (the catalog, dashboards, listings, exports and
+read APIs), only for GET/HEAD, and only until something writes: the first
+write in a request pins the rest of it to the primary, and ReplicaMiddleware
+then sets a cookie that keeps that browser's reads on the primary for
+PIN_SECONDS, longer than replicas are expected to lag, so users see their
+own changes. Reads inside a transaction and reads of auth/session tables
+(identity has to be current right after login or a password change) also
+stay on the primary. Each request reads from one replica, picked at random.
+
+Outside a request (management commands, the shell) everything uses the
+primary. With no replicas configured the router sends everything to the
+primary.
+
+Settings: LIBMGS_REPLICAS = {'ALIASES': ['replica1'], 'PIN_SECONDS': 5}; the
+aliases are DATABASES entries (see libmgs/settings.py).
+"""
+import random
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'libmgs_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+# Apps whose rows must be read from the primary.
+PRIMARY_APPS = {'auth', 'sessions', 'contenttypes'}
+
+
+def replica_settings():
+    conf = getattr(settings, 'LIBMGS_REPLICAS', {})
+    return list(conf.get('ALIASES', [])), conf.get('PIN_SECONDS', 5)
+
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned  # reads must use the primary for the rest of the request
+        self.wrote = False
+        self.replica = None  # alias reads go to, once the view allows replica reads
+
+
+_state = ContextVar('libmgs_replica_state', default=None)
+
+
+def replica_reads(view):
+    """Mark a read-only view whose GET/HEAD queries may be served by a replica."""
+    view.replica_reads = True
+    return view
+
+
+def reading_replica():
+    """True while the current request's reads are going to a replica."""
+    state = _state.get()
+    return state is not None and state.replica is not None and not state.pinned
+
+
+def read_alias():
+    """
+    The alias the current request's reads go to. Also for reads made after
+    the view returns, which the router no longer sees (streamed exports).
+    """
+    if reading_replica() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return _state.get().replica
+    return DEFAULT_DB_ALIAS
+
+
+def served_by_replica():
+    """True while the current request's reads are actually served by a replica (which may lag)."""
+    return read_alias() != DEFAULT_DB_ALIAS
+
+
+# --- ROUTER ---
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_settings()[0]}
+        return obj1._state.db in aliases and obj2._state.db in aliases
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary.
+        return db == DEFAULT_DB_ALIAS
+
+
+# --- MIDDLEWARE ---
+
+class ReplicaMiddleware:
+    """
+    Tracks each request's routing state: lets @replica_reads views read from
+    a replica unless the browser is pinned, and pins it after a write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(state, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        aliases, _ = replica_settings()
+        state = _state.get()
+        if aliases and state is not None and request.method in SAFE_METHODS and getattr(view_func, 'replica_reads', False):
+            state.replica = random.choice(aliases)
+
+    def _start(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = _RequestState(pinned)
+        return state, _state.set(state)
+
+    def _finish(self, state, response):
+        aliases, pin_seconds = replica_settings()
+        if state.wrote and aliases:
+            response.set_cookie(PIN_COOKIE, f"{time.time() + pin_seconds:.3f}", max_age=pin_seconds,
+                                httponly=True, samesite='Lax')
+        return response
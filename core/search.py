@@ -0,0 +1,234 @@
+"""
+Catalog search engine backed by an inverted index (SearchToken) and a
+trigram vocabulary (SearchGram). Everything is plain ORM so it works the
+same on SQLite and MySQL.
+"""
+import re
+import unicodedata
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Max, Q, Sum, Value, When
+
+from .models import Book, SearchGram, SearchToken
+
+# Field weights used for ranking: a title hit beats an author hit beats a genre hit.
+FIELD_WEIGHTS = {'title': 3, 'author': 2, 'genre': 1}
+
+# Score multipliers per match kind.
+EXACT_SCORE = 10
+PREFIX_SCORE = 6
+FUZZY_SCORE = 3
+
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TERMS = 8
+MAX_FUZZY_CANDIDATES = 50
+DEFAULT_LIMIT = 200
+
+_SPLIT_RE = re.compile(r'[^0-9a-z]+')
+
+
+def tokenize(text):
+    """Lowercase, strip accents and split text into alphanumeric terms."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', str(text))
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    return [t[:MAX_TERM_LENGTH] for t in _SPLIT_RE.split(text) if t]
+
+
+def trigrams(term):
+    """Padded trigrams of a term, e.g. 'cat' -> {'  c', ' ca', 'cat', 'at '}."""
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance, giving up early once it exceeds `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def book_terms(book):
+    """Return {term: weight} for a book, summing the weights of each field it appears in."""
+    weights = {}
+    for field, field_weight in FIELD_WEIGHTS.items():
+        for term in set(tokenize(getattr(book, field))):
+            weights[term] = weights.get(term, 0) + field_weight
+    return weights
+
+
+# --- INDEX MAINTENANCE ---
+
+def _register_grams(terms):
+    """Add any new terms to the trigram vocabulary."""
+    terms = set(terms)
+    if len(terms) > 1:
+        # Every term has the leading gram '  <first letter>', so known terms can be
+        # found through the (gram, term) unique index without expanding all their grams.
+        known = SearchGram.objects.filter(
+            gram__in={f"  {term[0]}" for term in terms}, term__in=terms,
+        ).values_list('term', flat=True)
+        terms -= set(known)
+    rows = [SearchGram(gram=gram, term=term) for term in terms for gram in trigrams(term)]
+    SearchGram.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+
+
+def index_book(book):
+    """(Re)index a single book. Called from the Book post_save signal."""
+    index_books([book])
+
+
+def index_books(books):
+    """(Re)index a batch of books with one delete and bulk inserts (used by bulk writers)."""
+    tokens = []
+    seen_terms = set()
+    for book in books:
+        for term, weight in book_terms(book).items():
+            tokens.append(SearchToken(term=term, book_id=book.pk, weight=weight))
+            seen_terms.add(term)
+    with transaction.atomic():
+        SearchToken.objects.filter(book_id__in=[book.pk for book in books]).delete()
+        SearchToken.objects.bulk_create(tokens, batch_size=1000)
+        _register_grams(seen_terms)
+
+
+def rebuild_index(chunk_size=2000, stdout=None):
+    """
+    Drop and rebuild the whole index in bulk, in one transaction so searches
+    keep using the old index until the new one commits (or if it fails).
+    Returns the number of books indexed.
+    """
+    with transaction.atomic():
+        SearchToken.objects.all().delete()
+        SearchGram.objects.all().delete()
+
+        indexed = 0
+        seen_terms = set()
+        books = Book.objects.only('id', *FIELD_WEIGHTS).order_by('id')
+        tokens = []
+        for book in books.iterator(chunk_size=chunk_size):
+            for term, weight in book_terms(book).items():
+                tokens.append(SearchToken(term=term, book_id=book.pk, weight=weight))
+                seen_terms.add(term)
+            indexed += 1
+            if len(tokens) >= chunk_size:
+                SearchToken.objects.bulk_create(tokens, batch_size=chunk_size)
+                tokens = []
+                if stdout:
+                    stdout.write(f"Indexed {indexed} books...")
+        SearchToken.objects.bulk_create(tokens, batch_size=chunk_size)
+        _register_grams(seen_terms)
+    return indexed
+
+
+# --- QUERYING ---
+
+def fuzzy_candidates(term):
+    """Vocabulary terms within a small edit distance of `term` (typo tolerance)."""
+    if len(term) < 4:
+        return []
+    limit = 1 if len(term) < 7 else 2
+    grams = trigrams(term)
+    # A term within `limit` edits shares most of its trigrams with the query.
+    min_shared = max(1, len(grams) - 3 * limit)
+    candidates = (
+        SearchGram.objects.filter(gram__in=grams)
+        .values('term')
+        .annotate(shared=Count('id'))
+        .filter(shared__gte=min_shared)
+        .order_by('-shared')
+        .values_list('term', flat=True)[:MAX_FUZZY_CANDIDATES * 4]
+    )
+    matches = [c for c in candidates if c != term and edit_distance(term, c, limit) <= limit]
+    return matches[:MAX_FUZZY_CANDIDATES]
+
+
+def _term_conditions(term):
+    """Q objects for exact, prefix and fuzzy matches of one query term."""
+    exact = Q(term=term)
+    # A left-anchored LIKE, which MySQL answers from the (term, book) index. Unlike
+    # an upper bound such as term + '\uffff' it doesn't depend on the collation.
+    prefix = Q(term__startswith=term) & ~Q(term=term)
+    fuzzy = fuzzy_candidates(term)
+    return exact, prefix, (Q(term__in=fuzzy) if fuzzy else None)
+
+
+def ranked_queryset(query):
+    """
+    Unordered queryset of {'book_id', 'score'} rows matching every query term.
+    Callers order it by ('-score', 'book_id'), directly or through keyset pagination.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return SearchToken.objects.none().values('book_id').annotate(score=Sum('weight'))
+
+    where = Q()
+    score_parts = []
+    matched_parts = []
+    for term in terms:
+        exact, prefix, fuzzy = _term_conditions(term)
+        whens = [
+            When(exact, then=F('weight') * EXACT_SCORE),
+            When(prefix, then=F('weight') * PREFIX_SCORE),
+        ]
+        any_match = exact | prefix
+        if fuzzy is not None:
+            whens.append(When(fuzzy, then=F('weight') * FUZZY_SCORE))
+            any_match |= fuzzy
+        where |= any_match
+        score_parts.append(Case(*whens, default=Value(0), output_field=IntegerField()))
+        matched_parts.append(Max(Case(When(any_match, then=Value(1)), default=Value(0), output_field=IntegerField())))
+
+    score = sum(score_parts[1:], score_parts[0])
+    matched = sum(matched_parts[1:], matched_parts[0])
+    return (
+        SearchToken.objects.filter(where)
+        .values('book_id')
+        .annotate(score=Sum(score), matched=matched)
+        .filter(matched=len(terms))
+    )
+
+
+def ranked_book_ids(query, limit=DEFAULT_LIMIT):
+    """Return book ids matching every query term, best matches first."""
+    rows = ranked_queryset(query).order_by('-score', 'book_id').values_list('book_id', flat=True)
+    if limit:
+        rows = rows[:limit]
+    return list(rows)
+
+
+def books_for_ids(ids, fields=None):
+    """Fetch books for a list of ids, preserving the order of `ids`."""
+    qs = Book.objects.only(*fields) if fields else Book.objects.all()
+    books = qs.in_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
+
+
+async def abooks_for_ids(ids, fields=None):
+    """books_for_ids() for async views."""
+    qs = Book.objects.only(*fields) if fields else Book.objects.all()
+    books = await qs.ain_bulk(ids)
+    return [books[pk] for pk in ids if pk in books]
+
+
+def search_books(query, limit=DEFAULT_LIMIT):
+    """Return a ranked list of Book objects for a free-text query."""
+    return books_for_ids(ranked_book_ids(query, limit=limit))
+
+
+def icontains_search(query):
+    """The original LIKE '%q%' scan, kept for benchmarking against the index."""
+    return Book.objects.filter(
+        Q(title__icontains=query) |
+        Q(author__icontains=query) |
+        Q(genre__icontains=query)
+    )
@@ -0,0 +1,101 @@
+from django.db.backends.signals import connection_created
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import Book, Hold, Member, Transaction
+from . import availability, catalog_cache, holds, identity, loans, metrics, search, stats
+
+# Time every query for the request metrics, whichever thread the connection lives on.
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    if metrics.timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.timed_execute)
+
+# Keep the search index in step with every Book write (views, admin, shell).
+# Deletes need no handler: SearchToken rows cascade with the book.
+@receiver(post_save, sender=Book)
+def index_book_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_book(instance)
+
+# --- CATALOG AND AVAILABILITY CACHES ---
+# Any save changes the book's card; only new books and edits to the listed
+# fields change which books a catalog/search page shows.
+@receiver(post_init, sender=Book)
+def remember_listing_fields(sender, instance, **kwargs):
+    instance._loaded_listing = tuple(instance.__dict__.get(f) for f in catalog_cache.LISTING_FIELDS)
+
+@receiver(post_save, sender=Book)
+def invalidate_catalog_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    listing = tuple(getattr(instance, f) for f in catalog_cache.LISTING_FIELDS)
+    catalog_cache.invalidate_books([instance.pk], listing=created or listing != instance._loaded_listing)
+    instance._loaded_listing = listing
+    # By id as well, in case the ISBN itself was edited.
+    availability.invalidate(isbns=[instance.isbn], book_ids=[instance.pk])
+
+@receiver(post_delete, sender=Book)
+def invalidate_catalog_on_delete(sender, instance, **kwargs):
+    catalog_cache.invalidate_books([instance.pk], listing=True)
+    availability.invalidate(isbns=[instance.isbn], book_ids=[instance.pk])
+
+# --- IDENTITY CACHE ---
+# Password, staff flag, active flag and membership ID all live on these rows.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_identity_for_user(sender, instance, raw=False, **kwargs):
+    if not raw:
+        identity.invalidate([instance.pk])
+
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def invalidate_identity_for_member(sender, instance, raw=False, **kwargs):
+    if not raw:
+        identity.invalidate([instance.user_id])
+
+# --- DASHBOARD COUNTERS ---
+# Remember the loaded total_copies so a save can bump the stats by the difference.
+@receiver(post_init, sender=Book)
+def remember_total_copies(sender, instance, **kwargs):
+    instance._loaded_total_copies = instance.__dict__.get('total_copies')
+
+@receiver(post_save, sender=Book)
+def count_copies_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = 0 if created else instance._loaded_total_copies
+    if previous is not None:
+        stats.bump(total_copies=instance.total_copies - previous)
+    instance._loaded_total_copies = instance.total_copies
+
+@receiver(post_delete, sender=Book)
+def count_copies_on_delete(sender, instance, **kwargs):
+    stats.bump(total_copies=-instance.total_copies)
+
+@receiver(post_save, sender=Member)
+def count_member_on_signup(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.bump(total_members=1)
+
+@receiver(post_delete, sender=Member)
+def count_member_on_delete(sender, instance, **kwargs):
+    stats.bump(total_members=-1)
+
+# Issue/return update the counters in core.loans; deletes of open loans are
+# counted here when books and members cascade to them. Transaction has no
+# delete receivers, so archival's bulk deletes stay fast.
+@receiver(pre_delete, sender=Book)
+def count_loans_on_book_delete(sender, instance, **kwargs):
+    loans.forget_loans(Transaction.objects.filter(book_id=instance.pk))
+
+@receiver(pre_delete, sender=Member)
+def count_loans_on_member_delete(sender, instance, **kwargs):
+    loans.forget_loans(Transaction.objects.filter(member_id=instance.pk))
+
+# Copies set aside by a deleted member's Ready holds go to the next in line.
+@receiver(pre_delete, sender=Member)
+def release_holds_on_member_delete(sender, instance, **kwargs):
+    holds.release_held_copies(Hold.objects.filter(member_id=instance.pk))
@@ -0,0 +1,104 @@
+"""
+Dashboard statistics.
+
+Counters live in the single LibraryStats row and are bumped with F()
+expressions by the code paths that change them, so reading them never
+scans Book/Transaction/Member. The assembled dashboard numbers are cached
+in the default Django cache (see CACHES in settings) for a short TTL so
+several workers can share them; the overdue count, which changes with the
+clock rather than with writes, is refreshed on that TTL. Numbers read from a
+replica aren't cached, so a lagging replica can't undo an eviction.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+
+from . import parallel, replicas
+from .models import Book, LibraryStats, Member, Transaction
+
+CACHE_KEY = 'core:dashboard-stats'
+STATS_PK = 1
+
+
+def cache_ttl():
+    return getattr(settings, 'LIBMGS_STATS_CACHE_TTL', 30)
+
+
+def _stats_row():
+    row, _ = LibraryStats.objects.get_or_create(pk=STATS_PK)
+    return row
+
+
+def bump(**deltas):
+    """Atomically add deltas to the counters, e.g. bump(books_issued=-1)."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updated = LibraryStats.objects.filter(pk=STATS_PK).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    if not updated:
+        # First write on a fresh database: seed from the tables, which already include this change.
+        recompute(save=True)
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
+
+
+def store(**values):
+    """Overwrite counters with freshly computed values (e.g. after a fine accrual run)."""
+    LibraryStats.objects.filter(pk=STATS_PK).update(**values)
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
+
+
+def _dashboard_data(row, overdue_count):
+    return {
+        'total_books': row.total_copies,
+        'books_issued': row.books_issued,
+        'books_available': row.total_copies - row.books_issued,
+        'total_members': row.total_members,
+        'accrued_fines': row.accrued_fines,
+        'overdue_count': overdue_count,
+    }
+
+
+def get_dashboard_stats():
+    """Return the admin dashboard numbers, from cache when possible."""
+    data = cache.get(CACHE_KEY)
+    if data is None:
+        data = _dashboard_data(_stats_row(), Transaction.objects.overdue().count())
+        if not replicas.served_by_replica():
+            cache.set(CACHE_KEY, data, cache_ttl())
+    return data
+
+
+async def aget_dashboard_stats():
+    """get_dashboard_stats() for async views; on a miss both queries run at once."""
+    data = await cache.aget(CACHE_KEY)
+    if data is None:
+        row, overdue_count = await parallel.gather(_stats_row, Transaction.objects.overdue().count)
+        data = _dashboard_data(row, overdue_count)
+        if not replicas.served_by_replica():
+            await cache.aset(CACHE_KEY, data, cache_ttl())
+    return data
+
+
+def recompute(save=False):
+    """
+    Recompute every counter from scratch. Returns {field: (stored, actual)} for
+    the fields that drifted; with save=True the row is corrected.
+    """
+    actual = {
+        'total_copies': Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0,
+        'books_issued': Transaction.objects.active().count(),
+        'total_members': Member.objects.count(),
+        'accrued_fines': Transaction.objects.active().aggregate(total=Sum('fine_amount'))['total'] or 0,
+    }
+    row = _stats_row()
+    drift = {
+        field: (getattr(row, field), value)
+        for field, value in actual.items() if getattr(row, field) != value
+    }
+    if save:
+        LibraryStats.objects.filter(pk=STATS_PK).update(**actual)
+        cache.delete(CACHE_KEY)
+    return drift
@@ -1,3 +1,1700 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connection, connections, router
+from django.db.models.constants import OnConflict
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import (
+    analytics, archive, async_views, availability, borrowing, covers, exports, fines, holds, identity, imports, loans,
+    membership, metrics, onboarding, pagination, parallel, replicas, search, stats,
+)
+from .forms import BookForm, IssueBookForm
+from .management.commands import loadtest
+from .models import (
+    AnalyticsState, ArchivedTransaction, Book, CoBorrow, CoverImage, Hold, LibraryStats, Member, MembershipSequence,
+    SearchToken, Transaction,
+)
+
+
+@contextmanager
+def without_upsert_target():
+    """
+    Make SQLite upsert the way MySQL does: Django refuses a conflict target
+    (unique_fields), and the update applies on any unique key.
+    """
+    original = connection.ops.on_conflict_suffix_sql
+
+    def suffix(fields, on_conflict, update_fields, unique_fields):
+        if on_conflict != OnConflict.UPDATE:
+            return original(fields, on_conflict, update_fields, unique_fields)
+        names = [connection.ops.quote_name(name) for name in update_fields]
+        return "ON CONFLICT DO UPDATE SET " + ", ".join(f"{name} = EXCLUDED.{name}" for name in names)
+
+    with mock.patch.object(connection.features, 'supports_update_conflicts_with_target', False), \
+            mock.patch.object(connection.ops, 'on_conflict_suffix_sql', suffix):
+        yield
+
+
+class CatalogSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hobbit = Book.objects.create(title="The Hobbit", author="J.R.R. Tolkien", isbn="9780547928227", genre="Fantasy")
+        cls.dune = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="Science Fiction")
+        cls.history = Book.objects.create(title="A Brief History of Time", author="Stephen Hawking", isbn="9780553380163", genre="Science")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_maintained_on_save_and_delete(self):
+        self.assertTrue(SearchToken.objects.filter(book=self.dune, term='dune').exists())
+        self.dune.title = "Dune Messiah"
+        self.dune.save()
+        self.assertTrue(SearchToken.objects.filter(book=self.dune, term='messiah').exists())
+        self.dune.delete()
+        self.assertFalse(SearchToken.objects.filter(term='messiah').exists())
+
+    def test_exact_prefix_and_typo_matches(self):
+        self.assertEqual(search.search_books("tolkien"), [self.hobbit])
+        self.assertEqual(search.search_books("hob"), [self.hobbit])
+        self.assertEqual(search.search_books("tolkein"), [self.hobbit])
+
+    def test_all_terms_required_and_ranked(self):
+        # A title hit outranks an author hit for the same term.
+        stories = Book.objects.create(title="Frank Stories", author="Anon", isbn="9780000000001", genre="Essays")
+        self.assertEqual(search.search_books("frank"), [stories, self.dune])
+        self.assertEqual(search.search_books("science frank"), [self.dune])
+        self.assertEqual(search.search_books("!!!"), [])
+
+    def test_rebuild_index(self):
+        SearchToken.objects.all().delete()
+        self.assertEqual(search.rebuild_index(chunk_size=2), 3)
+        self.assertEqual(search.search_books("hawking"), [self.history])
+
+        # A rebuild that fails part way leaves the old index in place.
+        with mock.patch.object(search, '_register_grams', side_effect=OperationalError):
+            with self.assertRaises(OperationalError):
+                search.rebuild_index()
+        self.assertEqual(search.search_books("hawkng"), [self.history])
+
+    def test_index_view_uses_search(self):
+        response = self.client.get(reverse('index'), {'q': 'herbert'})
+        self.assertEqual(list(response.context['books']), [self.dune])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [
+            Book.objects.create(title=title, author="Author", isbn=f"978000000010{i}", genre="Misc")
+            for i, title in enumerate(["Echo", "Alpha", "Delta", "Bravo", "Charlie"])
+        ]
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        member_user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=member_user, membership_id='M1', phone_number='1', address='x')
+        now = timezone.now()
+        cls.loans = [
+            Transaction.objects.create(book=book, member=cls.member, expected_return_date=now + timedelta(days=days))
+            for book, days in zip(cls.books, [3, 1, 2, 1, 5])
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, response):
+        return [b.title for b in response.context['books']]
+
+    def test_homepage_walks_forward_and_back(self):
+        url = reverse('index')
+        first = self.client.get(url, {'size': 2})
+        self.assertEqual(self.titles(first), ["Alpha", "Bravo"])
+        self.assertFalse(first.context['page'].has_previous)
+
+        second = self.client.get(f"{url}?{first.context['page'].next_query}")
+        self.assertEqual(self.titles(second), ["Charlie", "Delta"])
+
+        third = self.client.get(f"{url}?{second.context['page'].next_query}")
+        self.assertEqual(self.titles(third), ["Echo"])
+        self.assertFalse(third.context['page'].has_next)
+
+        back = self.client.get(f"{url}?{third.context['page'].prev_query}")
+        self.assertEqual(self.titles(back), ["Charlie", "Delta"])
+
+    def test_search_results_are_paginated_by_rank(self):
+        url = reverse('index')
+        first = self.client.get(url, {'q': 'author', 'size': 3})
+        self.assertEqual(len(first.context['books']), 3)
+        second = self.client.get(f"{url}?{first.context['page'].next_query}")
+        self.assertEqual(len(second.context['books']), 2)
+        seen = {b.pk for b in first.context['books']} | {b.pk for b in second.context['books']}
+        self.assertEqual(seen, {b.pk for b in self.books})
+
+    def test_page_size_is_capped_and_bad_cursor_ignored(self):
+        response = self.client.get(reverse('index'), {'size': 100000, 'after': 'garbage'})
+        self.assertEqual(len(response.context['books']), 5)
+        self.assertEqual(pagination.get_page_size(response.wsgi_request), pagination.MAX_PAGE_SIZE)
+
+    def test_tampered_cursors_read_as_the_first_page(self):
+        def forged(*values):
+            return base64.urlsafe_b64encode(json.dumps([['v', v] for v in values]).encode()).decode()
+
+        response = self.client.get(reverse('index'), {'after': forged('A', 'abc')})
+        self.assertEqual(self.titles(response), ["Alpha", "Bravo", "Charlie", "Delta", "Echo"])
+        response = self.client.get(reverse('index'), {'q': 'author', 'before': forged([1], {})})
+        self.assertEqual(len(response.context['books']), 5)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('all_transactions'), {'after': forged('notadate', 1)})
+        self.assertEqual(len(response.context['transactions']), 5)
+        self.client.force_login(self.member.user)
+        response = self.client.get(reverse('member_loans_api'), {'after': forged('x', 'y')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['loans']), 5)
+
+    def test_all_transactions_ordered_by_due_date_then_id(self):
+        self.client.force_login(self.staff)
+        url = reverse('all_transactions')
+        first = self.client.get(url, {'size': 3})
+        self.assertEqual(list(first.context['transactions']), [self.loans[1], self.loans[3], self.loans[2]])
+        second = self.client.get(f"{url}?{first.context['page'].next_query}")
+        self.assertEqual(list(second.context['transactions']), [self.loans[0], self.loans[4]])
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Each view must run a fixed number of queries no matter how many rows it
+    renders. Sessions are read from the cache; budgets for logged-in views
+    include the one user lookup (joined with the member) of a cold identity cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.reader = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=cls.reader, membership_id='M1', phone_number='1', address='x')
+        now = timezone.now()
+        for i in range(10):
+            book = Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000002{i:02}", genre="Misc")
+            Transaction.objects.create(book=book, member=cls.member, expected_return_date=now + timedelta(days=i - 5))
+
+    def setUp(self):
+        cache.clear()
+
+    def assertBudget(self, budget, url, user=None, **params):
+        if user:
+            self.client.force_login(user)
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_index(self):
+        # books + most borrowed this month
+        self.assertBudget(2, reverse('index'))
+
+    def test_index_search(self):
+        # fuzzy candidate lookup + ranked ids + book fetch
+        self.assertBudget(3, reverse('index'), q='author')
+
+    def test_book_detail(self):
+        # book, also borrowed, trending in genre
+        self.assertBudget(3, reverse('book_detail', args=[Book.objects.first().pk]))
+
+    def test_member_dashboard(self):
+        # user and member, holds (positions in a subquery), loans, archived loans
+        self.assertBudget(4, reverse('dashboard'), user=self.reader)
+
+    def test_member_loans_api(self):
+        # user, member validators, loans, archived loans
+        self.assertBudget(4, reverse('member_loans_api'), user=self.reader)
+
+    def test_admin_dashboard(self):
+        self.assertBudget(4, reverse('admin_dashboard'), user=self.staff)
+
+    def test_all_transactions(self):
+        self.assertBudget(2, reverse('all_transactions'), user=self.staff)
+
+    def test_manage_books(self):
+        self.assertBudget(2, reverse('manage_books'), user=self.staff)
+
+    def test_transaction_admin_changelist(self):
+        self.client.force_login(User.objects.create_superuser('root', password='pw'))
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('admin:core_transaction_changelist'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_transaction_str_uses_joined_rows(self):
+        loans = list(Transaction.objects.with_related())
+        with self.assertNumQueries(0):
+            [str(t) for t in loans]
+
+
+class LoanServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                       total_copies=1, available_copies=1)
+        user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=user, membership_id='M1', phone_number='1', address='x')
+
+    def test_issue_takes_a_copy_and_refuses_when_none_left(self):
+        loans.issue_book(self.book, self.member)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        with self.assertRaises(loans.BookUnavailable):
+            loans.issue_book(self.book, self.member)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_return_records_fine_once(self):
+        loan = loans.issue_book(self.book, self.member)
+        Transaction.objects.filter(pk=loan.pk).update(expected_return_date=timezone.now() - timedelta(days=3, hours=1))
+        loan.refresh_from_db()
+        loans.return_book(loan)
+        loan.refresh_from_db()
+        self.assertEqual(loan.status, 'Returned')
+        self.assertEqual(loan.fine_amount, Decimal('3.00'))
+        with self.assertRaises(loans.AlreadyReturned):
+            loans.return_book(loan)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+
+
+class LoanConcurrencyTests(TransactionTestCase):
+    """Hammer one book from many threads; no copy may be issued twice."""
+
+    COPIES = 5
+    THREADS = 20
+
+    def test_no_over_issue_under_contention(self):
+        book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                   total_copies=self.COPIES, available_copies=self.COPIES)
+        user = User.objects.create_user('reader', password='pw')
+        member = Member.objects.create(user=user, membership_id='M1', phone_number='1', address='x')
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(50):
+                    try:
+                        loans.issue_book(book, member)
+                        outcomes.append('issued')
+                        return
+                    except loans.BookUnavailable:
+                        outcomes.append('unavailable')
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of blocking; retry.
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        book.refresh_from_db()
+        self.assertEqual(outcomes.count('issued'), self.COPIES)
+        self.assertEqual(Transaction.objects.filter(book=book).count(), self.COPIES)
+        self.assertEqual(book.available_copies, 0)
+
+
+class BatchCirculationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.members = [
+            Member.objects.create(user=User.objects.create_user(f'reader{i}', password='pw'),
+                                  membership_id=f'M{i}', phone_number='1', address='x')
+            for i in range(5)
+        ]
+        cls.books = [
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000003{i:02}", genre="Misc",
+                                total_copies=100, available_copies=100)
+            for i in range(5)
+        ]
+        Book.objects.filter(pk=cls.books[0].pk).update(total_copies=1, available_copies=1)
+
+    def post(self, name, payload):
+        self.client.force_login(self.staff)
+        return self.client.post(reverse(name), json.dumps(payload), content_type='application/json')
+
+    def test_issue_batch_reports_per_item(self):
+        items = [
+            {'isbn': self.books[0].isbn, 'membership_id': 'M0'},
+            {'isbn': self.books[0].isbn, 'membership_id': 'M1'},
+            {'isbn': 'missing', 'membership_id': 'M1'},
+            {'isbn': self.books[1].isbn, 'membership_id': 'nobody'},
+            {'isbn': self.books[1].isbn, 'membership_id': 'M2'},
+        ]
+        data = self.post('issue_batch', {'items': items}).json()
+        self.assertEqual(data['issued'], 2)
+        self.assertEqual([r['ok'] for r in data['results']], [True, False, False, False, True])
+        self.assertEqual(data['results'][1]['error'], "Book is currently unavailable.")
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Book.objects.get(pk=self.books[0].pk).available_copies, 0)
+        self.assertEqual(Book.objects.get(pk=self.books[1].pk).available_copies, 99)
+        loan = Transaction.objects.get(pk=data['results'][4]['transaction_id'])
+        self.assertEqual(loan.member, self.members[2])
+
+    @override_settings(LIBMGS_BORROWING={'MAX_LOANS': None})  # 60 loans per member
+    def test_return_bin_uses_constant_queries(self):
+        items = [
+            {'isbn': self.books[i % 4 + 1].isbn, 'membership_id': f'M{i % 5}'}
+            for i in range(300)
+        ]
+        issued = loans.issue_batch(items)
+        ids = [r['transaction_id'] for r in issued]
+        Transaction.objects.filter(pk__in=ids[:10]).update(expected_return_date=timezone.now() - timedelta(days=2, hours=1))
+
+        # savepoint, select, close, fines, lock books, hold queue probe, copy counters, members' loan
+        # change marker, stats, release -- independent of bin size
+        with self.assertNumQueries(10):
+            results = loans.return_batch(ids + [ids[0], 999999])
+        self.assertEqual(sum(r['ok'] for r in results), 300)
+        self.assertFalse(results[-1]['ok'])
+        self.assertFalse(results[-2]['ok'])
+        self.assertEqual(Transaction.objects.filter(status='Issued').count(), 0)
+        self.assertEqual(Transaction.objects.filter(fine_amount=Decimal('2.00')).count(), 10)
+        self.assertEqual(sum(Book.objects.values_list('available_copies', flat=True)), 401)
+
+    def test_rejects_malformed_payload(self):
+        self.assertEqual(self.post('return_batch', {'transaction_ids': ['x']}).status_code, 400)
+        self.assertEqual(self.post('issue_batch', {'items': 'nope'}).status_code, 400)
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def counters(self):
+        row = LibraryStats.objects.get(pk=stats.STATS_PK)
+        return row.total_copies, row.books_issued, row.total_members
+
+    def test_counters_follow_book_member_and_loan_changes(self):
+        stats.recompute(save=True)
+        book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                   total_copies=3, available_copies=3)
+        self.assertEqual(self.counters(), (3, 0, 0))
+
+        book = Book.objects.get(pk=book.pk)
+        book.total_copies = 5
+        book.save()
+        member = Member.objects.create(user=User.objects.create_user('reader'), membership_id='M1',
+                                       phone_number='1', address='x')
+        self.assertEqual(self.counters(), (5, 0, 1))
+
+        loan = loans.issue_book(book, member)
+        self.assertEqual(self.counters(), (5, 1, 1))
+        loans.return_book(loan)
+        loans.issue_book(book, member)
+        self.assertEqual(self.counters(), (5, 1, 1))
+
+        book.delete()
+        self.assertEqual(self.counters(), (0, 0, 1))
+        self.assertEqual(stats.recompute(), {})
+
+    def test_dashboard_reads_cached_summary(self):
+        staff = User.objects.create_user('librarian', is_staff=True)
+        self.client.force_login(staff)
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF", total_copies=4)
+        response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.context['total_books'], 4)
+        # Warm caches: only the recent-activity query remains.
+        with self.assertNumQueries(1):
+            self.client.get(reverse('admin_dashboard'))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF", total_copies=4)
+        LibraryStats.objects.filter(pk=stats.STATS_PK).update(total_copies=99)
+        out = StringIO()
+        call_command('reconcile_stats', stdout=out)
+        self.assertIn("total_copies: stored 99, actual 4", out.getvalue())
+        self.assertEqual(stats.recompute(), {})
+
+
+class QueryPlanTests(TestCase):
+    def test_view_queries_avoid_full_scans(self):
+        for i in range(20):
+            Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000004{i:02}", genre="Misc")
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        flagged = [line for line in out.getvalue().splitlines() if '!!' in line and 'SCAN' in line]
+        self.assertEqual(flagged, [])
+        # The command rolls back the users/loans it creates for the walk-through.
+        self.assertFalse(User.objects.exists())
+
+
+class SyntheticDataTests(TestCase):
+    def test_generate_data_and_benchmark_views(self):
+        call_command('generate_data', books=30, members=10, transactions=400, active_ratio=0.3,
+                     overdue_ratio=0.5, chunk_size=50, seed=7, stdout=StringIO())
+        self.assertEqual(Book.objects.count(), 30)
+        self.assertEqual(Member.objects.count(), 10)
+        self.assertEqual(Transaction.objects.count(), 400)
+        self.assertEqual(stats.recompute(), {})
+        # Copies out on loan were taken off the shelf, never below zero.
+        for book in Book.objects.all():
+            self.assertEqual(book.available_copies, book.total_copies - book.transaction_set.active().count())
+        self.assertTrue(Transaction.objects.overdue().exists())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.json')
+            call_command('benchmark_views', requests=1, output=path, stdout=StringIO())
+            with open(path) as fh:
+                report = json.load(fh)
+        views = {r['view']: r for r in report['results']}
+        self.assertEqual(views['index']['status'], 200)
+        self.assertIn('return_batch', views)
+        # The benchmark runs in a rolled-back transaction.
+        self.assertEqual(Transaction.objects.count(), 400)
+        self.assertEqual(stats.recompute(), {})
+
+
+class FineAccrualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                       total_copies=20, available_copies=20)
+        user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=user, membership_id='M1', phone_number='1', address='x')
+
+    def loan_due(self, now, days_overdue):
+        loan = loans.issue_book(self.book, self.member)
+        Transaction.objects.filter(pk=loan.pk).update(expected_return_date=now - timedelta(days=days_overdue, hours=1))
+        return loan.pk
+
+    def test_accrual_matches_policy_per_loan(self):
+        now = timezone.now()
+        policy = fines.FinePolicy(rate='0.50', grace_days=2, cap='5.00')
+        ids = {days: self.loan_due(now, days) for days in (-3, 0, 2, 3, 7, 12, 13, 400)}
+
+        changed = fines.accrue_fines(now=now, policy=policy)
+        amounts = dict(Transaction.objects.values_list('id', 'fine_amount'))
+        expected = {-3: '0.00', 0: '0.00', 2: '0.00', 3: '0.50', 7: '2.50', 12: '5.00', 13: '5.00', 400: '5.00'}
+        for days, fine in expected.items():
+            self.assertEqual(amounts[ids[days]], Decimal(fine), days)
+        self.assertEqual(changed, 5)
+        # A second run at the same instant rewrites nothing.
+        self.assertEqual(fines.accrue_fines(now=now, policy=policy), 0)
+        self.assertEqual(LibraryStats.objects.get(pk=stats.STATS_PK).accrued_fines, Decimal('18.00'))
+
+    def test_return_finalizes_and_releases_accrued_fine(self):
+        now = timezone.now()
+        pk = self.loan_due(now, 4)
+        fines.accrue_fines(now=now)
+        loan = Transaction.objects.get(pk=pk)
+        self.assertEqual(loan.fine_amount, Decimal('4.00'))
+        loans.return_book(loan)
+        loan.refresh_from_db()
+        self.assertEqual(loan.fine_amount, Decimal('4.00'))
+        self.assertEqual(LibraryStats.objects.get(pk=stats.STATS_PK).accrued_fines, Decimal('0.00'))
+        self.assertEqual(stats.recompute(), {})
+
+
+@override_settings(LIBMGS_BORROWING={'MAX_LOANS': 2, 'MAX_OVERDUE': 0, 'MAX_FINES': '5.00'})
+class BorrowingLimitTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                       total_copies=20, available_copies=20)
+        user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=user, membership_id='M1', phone_number='1', address='x')
+
+    def counters(self):
+        return Member.objects.values_list(*borrowing.COUNTER_FIELDS).get(pk=self.member.pk)
+
+    def overdue_loan(self, now, days):
+        loan = loans.issue_book(self.book, self.member)
+        Transaction.objects.filter(pk=loan.pk).update(expected_return_date=now - timedelta(days=days, hours=1))
+        return Transaction.objects.get(pk=loan.pk)
+
+    def test_issue_and_return_keep_counters_and_refuse_past_the_limit(self):
+        first = loans.issue_book(self.book, self.member)
+        loans.issue_book(self.book, self.member)
+        self.assertEqual(self.counters(), (2, 0, Decimal('0.00')))
+        with self.assertRaises(loans.LimitReached):
+            loans.issue_book(self.book, self.member)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).available_copies, 18)
+        loans.return_book(first)
+        self.assertEqual(self.counters(), (1, 0, Decimal('0.00')))
+        loans.issue_book(self.book, self.member)
+
+    def test_overdue_loans_block_until_returned(self):
+        now = timezone.now()
+        loan = self.overdue_loan(now, 3)
+        fines.accrue_fines(now=now)
+        self.assertEqual(self.counters(), (1, 1, Decimal('3.00')))
+        self.assertIn("overdue", borrowing.limit_problem(Member.objects.get(pk=self.member.pk)))
+        with self.assertRaises(loans.LimitReached):
+            loans.issue_book(self.book, self.member)
+        loan.refresh_from_db()  # return_book expects the fine accrued so far
+        loans.return_book(loan)
+        self.assertEqual(self.counters(), (0, 0, Decimal('3.00')))
+        loans.issue_book(self.book, self.member)
+
+    def test_fines_block_until_paid(self):
+        now = timezone.now()
+        loans.return_book(self.overdue_loan(now, 7))
+        self.assertEqual(self.counters(), (0, 0, Decimal('7.00')))
+        with self.assertRaises(loans.LimitReached):
+            loans.issue_book(self.book, self.member)
+        self.assertFalse(borrowing.pay_fines(self.member.pk, '8.00'))
+        self.assertTrue(borrowing.pay_fines(self.member.pk, '4.00'))
+        self.assertEqual(self.counters(), (0, 0, Decimal('3.00')))
+        loans.issue_book(self.book, self.member)
+
+    def test_form_and_batch_report_the_limit(self):
+        loans.issue_book(self.book, self.member)
+        loans.issue_book(self.book, self.member)
+        form = IssueBookForm({'isbn': self.book.isbn, 'membership_id': 'M1'})
+        self.assertFalse(form.is_valid())
+        self.assertIn("limit 2", form.non_field_errors()[0])
+
+        loans.return_book(Transaction.objects.filter(status='Issued').first())
+        results = loans.issue_batch([{'isbn': self.book.isbn, 'membership_id': 'M1'}] * 2)
+        self.assertEqual([r['ok'] for r in results], [True, False])
+        self.assertIn("limit 2", results[1]['error'])
+        self.assertEqual(self.counters()[0], 2)
+
+    def test_deleting_a_book_releases_its_open_loans(self):
+        other = Book.objects.create(title="Emma", author="Jane Austen", isbn="9780141439587", genre="Classic",
+                                    total_copies=1, available_copies=1)
+        loans.issue_book(self.book, self.member)
+        loans.issue_book(other, self.member)
+        other.delete()
+        self.assertEqual(self.counters()[0], 1)
+        self.assertEqual(borrowing.reconcile(save=False), 0)
+        self.assertEqual(stats.recompute(), {})
+
+    def test_member_save_leaves_counters_alone(self):
+        member = Member.objects.get(pk=self.member.pk)
+        loans.issue_book(self.book, self.member)
+        member.address = 'elsewhere'
+        member.save()
+        self.assertEqual(self.counters()[0], 1)
+        self.assertEqual(Member.objects.get(pk=self.member.pk).address, 'elsewhere')
+
+    def test_reconcile_repairs_drift(self):
+        now = timezone.now()
+        self.overdue_loan(now, 2)
+        fines.accrue_fines(now=now)
+        expected = self.counters()
+        Member.objects.filter(pk=self.member.pk).update(active_loans=5, overdue_loans=0,
+                                                        outstanding_fines=Decimal('0.00'))
+        self.assertEqual(borrowing.reconcile(save=False, now=now), 1)
+        self.assertEqual(self.counters()[0], 5)
+
+        out = StringIO()
+        call_command('reconcile_member_counters', batch_size=1, stdout=out, stderr=StringIO())
+        self.assertIn("1 member(s) had drifted", out.getvalue())
+        self.assertEqual(self.counters(), expected)
+        self.assertEqual(borrowing.reconcile(), 0)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        user = User.objects.create_user('reader', password='pw')
+        member = Member.objects.create(user=user, membership_id='M1', phone_number='1', address='x')
+        cls.books = [
+            Book.objects.create(title=f"Book, {i}", author="Author", isbn=f"97800000005{i:02}", genre="Misc",
+                                total_copies=5, available_copies=5)
+            for i in range(5)
+        ]
+        for book in cls.books:
+            loans.issue_book(book, member)
+        loans.return_book(Transaction.objects.order_by('id').first())
+
+    def export(self, kind, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_data', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_in_small_batches(self):
+        with mock.patch.object(exports, 'BATCH_SIZE', 2):
+            body = self.export('books').decode()
+        rows = list(csv.reader(body.splitlines()))
+        self.assertEqual(rows[0], [name for name, _ in exports.BOOK_FIELDS])
+        self.assertEqual([r[2] for r in rows[1:]], [b.title for b in self.books])
+
+    def test_json_export_with_filters_and_gzip(self):
+        body = gzip.decompress(self.export('transactions', format='json', status='Issued', gzip='1'))
+        rows = json.loads(body)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual({r['status'] for r in rows}, {'Issued'})
+        self.assertEqual(rows[0]['membership_id'], 'M1')
+
+        today = timezone.localdate().isoformat()
+        self.assertEqual(len(json.loads(self.export('transactions', format='json', to=today))), 5)
+        self.assertEqual(len(json.loads(self.export('transactions', format='json', **{'from': '2999-01-01'}))), 0)
+
+    def test_rejects_bad_filters(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('export_data', args=['transactions']), {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data', args=['members'])).status_code, 404)
+
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'loans.csv')
+            call_command('export_data', 'transactions', output=path, status='Returned', stderr=StringIO())
+            with open(path) as fh:
+                self.assertEqual(len(fh.read().splitlines()), 2)
+
+
+class CatalogImportTests(TestCase):
+    def test_normalize_isbn(self):
+        self.assertEqual(imports.normalize_isbn('0-306-40615-2'), '9780306406157')
+        self.assertEqual(imports.normalize_isbn('978-0-306-40615-7'), '9780306406157')
+        for bad in ('0-306-40615-3', '9780306406158', 'abc', ''):
+            with self.assertRaises(imports.RejectedRow):
+                imports.normalize_isbn(bad)
+
+    def test_upsert_adds_copies_and_reports_rejects(self):
+        existing = Book.objects.create(title="Old Title", author="A", isbn="9780306406157", genre="G",
+                                       total_copies=3, available_copies=1)
+        data = (
+            "isbn,title,author,genre,copies,cover_image_url\n"
+            "0-306-40615-2,New Title,A,G,2,\n"
+            "9780441172719,Dune,Frank Herbert,SF,,https://example.com/dune.jpg\n"
+            "9780441172719,Dune,Frank Herbert,SF,4,\n"
+            "123,Broken,X,Y,1,\n"
+            "9780547928227,,Tolkien,Fantasy,1,\n"
+        )
+        result = imports.import_catalog(StringIO(data), 'csv', chunk_size=2)
+        # Dune's second row lands in the next chunk, so it counts as an update.
+        self.assertEqual((result.processed, result.created, result.updated), (5, 1, 2))
+        self.assertEqual([r[1] for r in result.rejected], ["malformed ISBN '123'", "missing title"])
+
+        existing.refresh_from_db()
+        self.assertEqual((existing.title, existing.total_copies, existing.available_copies), ("New Title", 5, 3))
+        dune = Book.objects.get(isbn='9780441172719')
+        self.assertEqual((dune.total_copies, dune.available_copies), (5, 5))
+        self.assertEqual(search.search_books("herbert"), [dune])
+        self.assertEqual(stats.recompute(), {})
+
+    def test_jsonl_resume_from_offset(self):
+        lines = [json.dumps({'isbn': isbn, 'title': t, 'author': 'A', 'genre': 'G'})
+                 for isbn, t in (('9780306406157', 'One'), ('9780441172719', 'Two'))]
+        result = imports.import_catalog(StringIO('\n'.join(lines + ['not json'])), 'jsonl', offset=1)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Two'])
+        self.assertEqual(result.rejected, [(3, 'unparseable record', 'not json')])
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                            total_copies=1, available_copies=1)
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'), {'q': 'dune'})
+        self.client.get('/no-such-page/')
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('libmgs_responses_total{view="index",status="200"} 2', body)
+        self.assertIn('libmgs_responses_total{view="<unresolved>",status="404"} 1', body)
+        self.assertIn('libmgs_request_duration_seconds_count{view="index"} 2', body)
+        self.assertIn('libmgs_request_queries_bucket{view="index",le="+Inf"} 2', body)
+        # Both index requests ran SQL and rendered a template.
+        self.assertIn('libmgs_request_queries_bucket{view="index",le="0"} 0', body)
+        template_sum = re.search(r'libmgs_template_render_seconds_sum\{view="index"\} (\S+)', body).group(1)
+        self.assertGreater(float(template_sum), 0)
+        self.assertIn('libmgs_response_bytes_count{view="index"} 2', body)
+
+    def test_endpoint_is_staff_only(self):
+        reader = User.objects.create_user('reader', password='pw')
+        self.client.force_login(reader)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.settings(LIBMGS_METRICS={'SLOW_REQUEST_MS': 0}):
+            with self.assertLogs('core.slow_requests', 'WARNING') as logs:
+                self.client.get(reverse('index'))
+        self.assertIn('(index)', logs.output[0])
+        self.assertIn('core_book', logs.output[0])
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [
+            Book.objects.create(title=title, author="Author", isbn=f"978000000060{i}", genre="Misc",
+                                total_copies=1, available_copies=1)
+            for i, title in enumerate(["Alpha", "Bravo", "Charlie"])
+        ]
+        member_user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=member_user, membership_id='M1', phone_number='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def cache_count(self, layer, result):
+        match = re.search(rf'libmgs_cache_requests_total{{cache="{layer}",result="{result}"}} (\d+)',
+                          metrics.registry.render())
+        return int(match.group(1)) if match else 0
+
+    def test_warm_catalog_page_runs_no_queries(self):
+        first = self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertEqual(response.content, first.content)
+        self.assertEqual((self.cache_count('page', 'hit'), self.cache_count('html', 'hit')), (1, 1))
+
+        # Logged-in users share the page entry and cards but render their own navbar.
+        self.client.force_login(self.member.user)
+        response = self.client.get(reverse('index'))
+        self.assertEqual([b.title for b in response.context['books']], ["Alpha", "Bravo", "Charlie"])
+        self.assertContains(response, "Logout")
+        self.assertEqual(self.cache_count('card', 'hit'), 3)
+
+    def test_issue_and_return_refresh_only_that_card(self):
+        self.client.get(reverse('index'))
+        loan = loans.issue_book(self.books[1], self.member)
+        # The page entry is still valid; only Bravo's card is re-read and re-rendered.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, "Out of Stock", count=1)
+        self.assertEqual(self.cache_count('card', 'miss'), 4)
+
+        loans.return_book(loan)
+        self.assertNotContains(self.client.get(reverse('index')), "Out of Stock")
+
+    def test_listing_edits_refresh_pages(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'), {'q': 'alpha'})
+        self.books[0].title = "Zulu"
+        self.books[0].save()
+        titles = [b.title for b in self.client.get(reverse('index')).context['books']]
+        self.assertEqual(titles, ["Bravo", "Charlie", "Zulu"])
+        self.assertEqual(list(self.client.get(reverse('index'), {'q': 'alpha'}).context['books']), [])
+
+        Book.objects.create(title="Delta", author="Author", isbn="9780000000700", genre="Misc")
+        self.assertContains(self.client.get(reverse('index')), "Delta")
+        self.books[1].delete()
+        self.assertNotContains(self.client.get(reverse('index')), "Bravo")
+
+    def test_disabled_cache_renders_directly(self):
+        with self.settings(LIBMGS_CATALOG_CACHE={'ENABLED': False}):
+            self.client.get(reverse('index'))
+            with self.assertNumQueries(1):
+                self.client.get(reverse('index'))
+        self.assertEqual(self.cache_count('page', 'miss') + self.cache_count('page', 'hit'), 0)
+
+
+@override_settings(ROOT_URLCONF='libmgs.urls_async')
+class AsyncViewTests(TransactionTestCase):
+    """The ASGI URLconf serves the read-heavy pages from core.async_views."""
+    # Outside a test transaction these pages read from replicas, when any are configured.
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        self.reader = User.objects.create_user('reader', password='pw')
+        member = Member.objects.create(user=self.reader, membership_id='M1', phone_number='1', address='x')
+        self.books = [
+            Book.objects.create(title=title, author="Frank Herbert", isbn=f"978000000080{i}", genre="SF",
+                                total_copies=2, available_copies=2)
+            for i, title in enumerate(["Dune", "Dune Messiah", "Children of Dune"])
+        ]
+        self.loan = loans.issue_book(self.books[0], member)
+
+    def test_routes_to_async_views(self):
+        self.assertIs(resolve('/').func, async_views.index)
+        for name in ('dashboard', 'admin_dashboard', 'all_transactions'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func), name)
+        self.assertFalse(iscoroutinefunction(resolve(reverse('manage_books')).func))
+
+    async def test_catalog_and_search(self):
+        response = await self.async_client.get(reverse('index'), {'size': 2})
+        self.assertEqual([b.title for b in response.context['books']], ["Children of Dune", "Dune"])
+        response = await self.async_client.get(f"{reverse('index')}?{response.context['page'].next_query}")
+        self.assertEqual([b.title for b in response.context['books']], ["Dune Messiah"])
+
+        response = await self.async_client.get(reverse('index'), {'q': 'messiah'})
+        self.assertEqual([b.title for b in response.context['books']], ["Dune Messiah"])
+        self.assertContains(response, "Dune Messiah")
+
+    async def test_dashboards(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual([t.pk for t in response.context['transactions']], [self.loan.pk])
+        self.assertContains(response, "Logout")
+
+        await self.async_client.aforce_login(self.staff)
+        response = await self.async_client.get(reverse('admin_dashboard'))
+        self.assertEqual((response.context['total_books'], response.context['books_issued']), (6, 1))
+        self.assertEqual([t.pk for t in response.context['recent_transactions']], [self.loan.pk])
+
+        response = await self.async_client.get(reverse('all_transactions'))
+        self.assertEqual([t.pk for t in response.context['transactions']], [self.loan.pk])
+        # Queries made on executor threads still count towards the view's metrics.
+        self.assertIn('libmgs_request_queries_count{view="all_transactions"} 1', metrics.registry.render())
+        self.assertNotIn('libmgs_request_queries_sum{view="all_transactions"} 0\n', metrics.registry.render())
+
+    @override_settings(ALLOWED_HOSTS=['localhost'])
+    def test_loadtest_worker_drives_both_handlers(self):
+        options = {'concurrency': 2, 'seconds': 0.2, 'staff_id': self.staff.pk, 'member_id': self.reader.pk}
+        for mode in ('wsgi', 'asgi'):
+            results = loadtest.Worker(mode, options).run(['search', 'admin_dashboard'])
+            for view, result in results.items():
+                self.assertGreater(result['requests'], 0, (mode, view))
+                self.assertEqual(result['errors'], 0, (mode, view))
+
+    async def test_parallel_closes_worker_connections(self):
+        opened = []
+
+        def count_books():
+            opened.append(connections[DEFAULT_DB_ALIAS])  # this worker thread's connection
+            return Book.objects.count()
+
+        # Persistent connections would otherwise stay open on the pool's threads.
+        # (An in-memory test database ignores close() itself, so watch for the calls.)
+        wrapper = type(connections[DEFAULT_DB_ALIAS])
+        with mock.patch.dict(connection.settings_dict, CONN_MAX_AGE=60), \
+                mock.patch.object(wrapper, 'close', autospec=True) as close:
+            self.assertEqual(await parallel.gather(count_books, count_books), [3, 3])
+        closed = [call.args[0] for call in close.call_args_list]
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(any(conn is other for other in closed) for conn in opened))
+
+    async def test_staff_only_and_login_required(self):
+        self.assertEqual((await self.async_client.get(reverse('dashboard'))).status_code, 302)
+        await self.async_client.aforce_login(self.reader)
+        self.assertEqual((await self.async_client.get(reverse('admin_dashboard'))).status_code, 302)
+
+
+class AvailabilityApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dune = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                       total_copies=2, available_copies=2)
+        cls.hobbit = Book.objects.create(title="The Hobbit", author="J.R.R. Tolkien", isbn="9780547928227",
+                                         genre="Fantasy", total_copies=1, available_copies=1)
+        member_user = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=member_user, membership_id='M1', phone_number='1', address='x')
+
+    def setUp(self):
+        availability.cache.clear()
+
+    def get(self, isbn, **headers):
+        return self.client.get(reverse('availability', args=[isbn]), headers=headers)
+
+    def test_single_lookup_is_cached_and_supports_etags(self):
+        with self.assertNumQueries(1):
+            response = self.get(self.dune.isbn)
+        self.assertEqual(response.json(), {'isbn': self.dune.isbn, 'available_copies': 2, 'total_copies': 2})
+        with self.assertNumQueries(0):
+            not_modified = self.get(self.dune.isbn, if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.assertEqual(self.get('0000000000000').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get('0000000000000').status_code, 404)
+
+    def test_replica_reads_are_not_cached(self):
+        # A lagging replica could put back counts (or dashboard numbers) a write just evicted.
+        cache.clear()
+        with mock.patch.object(replicas, 'served_by_replica', return_value=True):
+            availability.lookup([self.dune.isbn])
+            with self.assertNumQueries(1):
+                availability.lookup([self.dune.isbn])
+            stats.get_dashboard_stats()
+            self.assertIsNone(cache.get(stats.CACHE_KEY))
+        availability.lookup([self.dune.isbn])
+        with self.assertNumQueries(0):
+            availability.lookup([self.dune.isbn])
+
+    def test_batch_loads_misses_in_one_query(self):
+        url = reverse('availability_batch')
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'isbn': [self.dune.isbn, 'missing'], 'isbns': self.hobbit.isbn})
+        self.assertEqual(response.json()['results'], {
+            self.dune.isbn: {'available_copies': 2, 'total_copies': 2},
+            'missing': None,
+            self.hobbit.isbn: {'available_copies': 1, 'total_copies': 1},
+        })
+        with self.assertNumQueries(0):
+            self.client.get(url, {'isbns': f"{self.hobbit.isbn},{self.dune.isbn}"})
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        too_many = ','.join(str(i) for i in range(availability.MAX_BATCH_SIZE + 1))
+        self.assertEqual(self.client.get(url, {'isbns': too_many}).status_code, 400)
+
+    def test_writes_invalidate_entries(self):
+        first = self.get(self.dune.isbn)
+        loan = loans.issue_book(self.dune, self.member)
+        changed = self.get(self.dune.isbn, if_none_match=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['available_copies'], 1)
+
+        loans.return_batch([loan.pk])
+        self.assertEqual(self.get(self.dune.isbn).json()['available_copies'], 2)
+
+        self.get(self.hobbit.isbn)
+        self.hobbit.isbn = '9780261103344'
+        self.hobbit.save()
+        self.assertEqual(self.get('9780547928227').status_code, 404)
+        self.assertEqual(self.get('9780261103344').json()['total_copies'], 1)
+
+    def test_racing_load_is_not_cached(self):
+        evictions = availability.cache.evictions
+        availability.invalidate(book_ids=[self.dune.pk])
+        availability.cache.set_many({self.dune.isbn: (self.dune.pk, 0, 2)}, evictions)
+        self.assertEqual(availability.cache.get_many([self.dune.isbn]), ({}, [self.dune.isbn]))
+
+
+class HoldTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.members = [
+            Member.objects.create(user=User.objects.create_user(f'reader{i}', password='pw'),
+                                  membership_id=f'M{i}', phone_number='1', address='x')
+            for i in range(4)
+        ]
+        cls.book = Book.objects.create(title="Dune", author="Frank Herbert", isbn="9780441172719", genre="SF",
+                                       total_copies=1, available_copies=1)
+
+    def setUp(self):
+        cache.clear()
+        self.loan = loans.issue_book(self.book, self.members[0])
+
+    def copies(self):
+        return Book.objects.get(pk=self.book.pk).available_copies
+
+    def queue(self, *members):
+        return [holds.place_hold(self.book, member) for member in members]
+
+    def test_holds_only_for_unavailable_books_once_per_member(self):
+        first, second = self.queue(self.members[1], self.members[2])
+        self.assertEqual([holds.queue_position(first), holds.queue_position(second)], [1, 2])
+        with self.assertRaises(holds.HoldError):
+            holds.place_hold(self.book, self.members[1])
+
+        loans.return_book(self.loan)
+        other = Book.objects.create(title="Emma", author="Jane Austen", isbn="9780141439587", genre="Classic")
+        with self.assertRaises(holds.HoldError):
+            holds.place_hold(other, self.members[1])
+
+    def test_return_goes_to_the_head_of_the_queue(self):
+        first, second = self.queue(self.members[1], self.members[2])
+        loans.return_book(self.loan)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'Ready')
+        self.assertIsNotNone(first.ready_until)
+        self.assertEqual(self.copies(), 0)
+        self.assertEqual(holds.queue_position(second), 1)
+
+        # The copy is set aside: nobody else can take it, the hold's member can.
+        with self.assertRaises(loans.BookUnavailable):
+            loans.issue_book(self.book, self.members[3])
+        loans.issue_book(self.book, self.members[1])
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'Fulfilled')
+        self.assertEqual(self.copies(), 0)
+
+    def test_expired_and_cancelled_holds_pass_the_copy_on(self):
+        first, second = self.queue(self.members[1], self.members[2])
+        loans.return_book(self.loan)
+        later = timezone.now() + holds.pickup_period() + timedelta(hours=1)
+        self.assertEqual(holds.expire_holds(now=later, batch_size=1), 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('Expired', 'Ready'))
+
+        holds.cancel_hold(second)
+        self.assertEqual(self.copies(), 1)
+        with self.assertRaises(holds.HoldError):
+            holds.cancel_hold(second)
+
+    def test_batch_circulation_uses_the_queue(self):
+        hold, = self.queue(self.members[1])
+        loans.return_batch([self.loan.pk])
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'Ready')
+
+        results = loans.issue_batch([
+            {'isbn': self.book.isbn, 'membership_id': 'M2'},
+            {'isbn': self.book.isbn, 'membership_id': 'M1'},
+        ])
+        self.assertEqual([r['ok'] for r in results], [False, True])
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'Fulfilled')
+
+    def test_batch_reads_back_ids_without_returning(self):
+        self.queue(self.members[1])
+        loans.return_book(self.loan)
+        other = Book.objects.create(title="Emma", author="Jane Austen", isbn="9780141439587", genre="Classic",
+                                    total_copies=5, available_copies=5)
+        create = Transaction.objects.bulk_create
+
+        def without_ids(objs, *args, **kwargs):  # as on MySQL
+            created = create(objs, *args, **kwargs)
+            for loan in created:
+                loan.pk = None
+            return created
+
+        items = [(other, 'M2'), (self.book, 'M1'), (other, 'M1'), (other, 'M2')]
+        with mock.patch.object(Transaction.objects, 'bulk_create', side_effect=without_ids):
+            results = loans.issue_batch([{'isbn': book.isbn, 'membership_id': m} for book, m in items])
+        self.assertTrue(all(r['ok'] for r in results))
+        issued = Transaction.objects.in_bulk([r['transaction_id'] for r in results])
+        self.assertEqual([(issued[r['transaction_id']].book, issued[r['transaction_id']].member.membership_id)
+                          for r in results], items)
+
+    def test_added_copies_go_to_the_queue(self):
+        first, second, third = self.queue(*self.members[1:])
+        data = f"isbn,title,author,genre,copies\n{self.book.isbn},Dune,Frank Herbert,SF,1\n"
+        imports.import_catalog(StringIO(data), 'csv')
+        self.assertEqual(self.copies(), 0)
+        self.assertEqual(Hold.objects.get(pk=first.pk).status, 'Ready')
+
+        # The desk adds three copies to both counts; two are for the queue.
+        self.client.force_login(self.staff)
+        self.client.post(reverse('edit_book', args=[self.book.pk]), {
+            'title': "Dune", 'author': "Frank Herbert", 'isbn': self.book.isbn, 'genre': "SF",
+            'total_copies': 5, 'available_copies': 3,
+        })
+        self.assertEqual(list(Hold.objects.filter(pk__in=[second.pk, third.pk]).values_list('status', flat=True)),
+                         ['Ready', 'Ready'])
+        self.assertEqual(self.copies(), 1)
+        self.assertEqual(stats.recompute(), {})
+
+    def test_removing_a_ready_hold_passes_its_copy_on(self):
+        holds_ = self.queue(*self.members[1:])
+        loans.return_book(self.loan)
+        status = lambda: list(Hold.objects.order_by('id').values_list('status', flat=True))
+        self.assertEqual(status(), ['Ready', 'Waiting', 'Waiting'])
+
+        admin_user = User.objects.create_superuser('admin', password='pw')
+        self.client.force_login(admin_user)
+        # Status is read-only in the admin; the copy stays with the Ready hold.
+        self.client.post(reverse('admin:core_hold_change', args=[holds_[0].pk]), {
+            'book': self.book.pk, 'member': self.members[1].pk, 'status': 'Cancelled',
+        })
+        self.assertEqual(status(), ['Ready', 'Waiting', 'Waiting'])
+
+        self.client.post(reverse('admin:core_hold_delete', args=[holds_[0].pk]), {'post': 'yes'})
+        self.assertEqual(status(), ['Ready', 'Waiting'])
+        self.client.post(reverse('admin:core_hold_changelist'), {
+            'action': 'delete_selected', '_selected_action': [holds_[1].pk], 'post': 'yes',
+        })
+        self.assertEqual(status(), ['Ready'])
+
+        self.members[3].delete()
+        self.assertFalse(Hold.objects.exists())
+        self.assertEqual(self.copies(), 1)
+
+    def test_member_and_desk_views(self):
+        self.client.force_login(self.members[1].user)
+        self.assertContains(self.client.get(reverse('place_hold', args=[self.book.pk])), "Join the Queue")
+        self.client.post(reverse('place_hold', args=[self.book.pk]))
+        self.queue(self.members[2])
+        self.client.force_login(self.members[2].user)
+        self.assertContains(self.client.get(reverse('dashboard')), "Number 2 in the queue")
+
+        self.client.force_login(self.staff)
+        response = self.client.post(reverse('issue_book'), {'isbn': self.book.isbn, 'membership_id': 'M3'})
+        self.assertContains(response, "Book is currently unavailable.")
+        self.client.post(reverse('issue_book'), {'isbn': self.book.isbn, 'membership_id': 'M3', 'action': 'hold'})
+        self.assertEqual(list(Hold.objects.queue(self.book.pk).values_list('member__membership_id', flat=True)),
+                         ['M1', 'M2', 'M3'])
+
+        hold = Hold.objects.get(member=self.members[1])
+        self.client.force_login(self.members[2].user)
+        self.assertEqual(self.client.post(reverse('cancel_hold', args=[hold.pk])).status_code, 404)
+        self.client.force_login(self.members[1].user)
+        self.client.post(reverse('cancel_hold', args=[hold.pk]))
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'Cancelled')
+
+
+class LoanArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.reader = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=cls.reader, membership_id='M1', phone_number='1', address='x')
+        now = timezone.now()
+        cls.loans = []
+        for i, (issued_days_ago, returned_days_ago) in enumerate([(800, 790), (500, 480), (30, 20), (900, None)]):
+            book = Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000007{i:02}", genre="Misc")
+            loan = Transaction.objects.create(book=book, member=cls.member,
+                                              expected_return_date=now - timedelta(days=issued_days_ago - 14))
+            Transaction.objects.filter(pk=loan.pk).update(
+                issue_date=now - timedelta(days=issued_days_ago),
+                status='Issued' if returned_days_ago is None else 'Returned',
+                actual_return_date=None if returned_days_ago is None else now - timedelta(days=returned_days_ago),
+                fine_amount=Decimal('1.50') if i == 0 else 0,
+            )
+            cls.loans.append(loan)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_moves_only_old_returns_in_batches(self):
+        batches = []
+        self.assertEqual(archive.archive_loans(days=365, batch_size=1, progress=batches.append), 2)
+        self.assertEqual(batches, [1, 2])
+        self.assertEqual(set(Transaction.objects.values_list('id', flat=True)), {self.loans[2].pk, self.loans[3].pk})
+        oldest = ArchivedTransaction.objects.get(pk=self.loans[0].pk)
+        self.assertEqual((oldest.fine_amount, oldest.status), (Decimal('1.50'), 'Returned'))
+        self.assertEqual(oldest.actual_return_date, timezone.localdate(timezone.now() - timedelta(days=790)))
+        self.assertEqual(archive.archive_loans(days=365), 0)
+
+        out = StringIO()
+        call_command('archive_loans', days=0, pause=0, stdout=out, stderr=StringIO())
+        self.assertIn("Archived 1 loan(s)", out.getvalue())
+        self.assertEqual(Transaction.objects.get().pk, self.loans[3].pk)
+
+    def test_batches_delete_without_loading_rows(self):
+        long_ago = timezone.now() - timedelta(days=700)
+        Transaction.objects.bulk_create([
+            Transaction(book=self.loans[0].book, member=self.member, expected_return_date=long_ago,
+                        status='Returned', actual_return_date=long_ago)
+            for _ in range(150)
+        ])
+        before = timezone.now() - timedelta(days=365)
+        # savepoint, select, insert, delete, release -- whatever the batch size
+        for size in (1, 100):
+            with self.assertNumQueries(5):
+                self.assertEqual(archive.archive_batch(before, batch_size=size), size)
+
+    def test_history_and_export_cover_both_tables(self):
+        archive.archive_loans(days=365)
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual([t.book.title for t in response.context['transactions']],
+                         ["Book 2", "Book 1", "Book 0", "Book 3"])
+        self.assertContains(response, "4 Records")
+
+        self.client.force_login(self.staff)
+        rows = json.loads(b''.join(self.client.get(
+            reverse('export_data', args=['transactions']), {'format': 'json'}).streaming_content))
+        self.assertEqual(sorted(r['id'] for r in rows), sorted(loan.pk for loan in self.loans))
+        self.assertEqual({r['status'] for r in rows if r['id'] == self.loans[0].pk}, {'Returned'})
+        issued = json.loads(b''.join(self.client.get(
+            reverse('export_data', args=['transactions']), {'format': 'json', 'status': 'Issued'}).streaming_content))
+        self.assertEqual([r['id'] for r in issued], [self.loans[3].pk])
+
+
+class MembershipIdTests(TransactionTestCase):
+    def test_ids_are_unique_and_check_digited(self):
+        allocator = membership.Allocator(block_size=10)
+        ids = [allocator.allocate()[0] for _ in range(25)] + allocator.allocate(15)
+        self.assertEqual(len(set(ids)), 40)
+        self.assertTrue(all(membership.is_valid(i) for i in ids))
+        # Three blocks of 10, then 15 reserved directly
+        self.assertEqual(MembershipSequence.objects.get().next_value, 46)
+
+        self.assertEqual(membership.check_digit('7992739871'), '3')  # the textbook Luhn example
+        self.assertTrue(membership.is_valid('7992739875'))
+        self.assertFalse(membership.is_valid('7992739876'))  # wrong check digit
+        self.assertFalse(membership.is_valid('7992379875'))  # swapped neighbours
+        self.assertFalse(membership.is_valid('1A2B3C4D'))  # legacy random ID
+
+    def test_signup_is_atomic(self):
+        data = {'username': 'newbie', 'email': 'n@example.com', 'password1': 'correct horse battery',
+                'password2': 'correct horse battery', 'phone_number': '1', 'address': 'x'}
+        with mock.patch.object(Member.objects, 'create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post(reverse('signup'), data)
+        self.assertFalse(User.objects.filter(username='newbie').exists())
+
+        self.assertRedirects(self.client.post(reverse('signup'), data), reverse('dashboard'))
+        self.assertTrue(membership.is_valid(Member.objects.get(user__username='newbie').membership_id))
+
+
+class OnboardingTests(TestCase):
+    CSV = (
+        "username,email,first_name,last_name,phone_number,address,password\n"
+        "alice,alice@example.com,Alice,A,555,1 Road,\n"
+        "bob,not-an-email,Bob,B,555,2 Road,\n"
+        "taken,t@example.com,T,T,555,3 Road,\n"
+        "carol,carol@example.com,Carol,C,555,4 Road,s3cret-pass\n"
+        "alice,again@example.com,Alice,A,555,1 Road,\n"
+    )
+
+    def test_bulk_onboarding_with_cheap_initial_hashes(self):
+        User.objects.create_user('taken')
+        stats.recompute(save=True)
+        result = onboarding.onboard(StringIO(self.CSV), chunk_size=2, iterations=1000, workers=2)
+        self.assertEqual((result.processed, result.created), (5, 2))
+        self.assertEqual([line for line, _ in result.rejected], [3, 4, 6])
+        self.assertEqual(stats.recompute(), {})
+
+        alice = Member.objects.select_related('user').get(user__username='alice')
+        username, membership_id, password = result.credentials[0]
+        self.assertEqual((username, membership_id), ('alice', alice.membership_id))
+        self.assertTrue(membership.is_valid(membership_id))
+        self.assertEqual(result.credentials[1][2], '')  # supplied passwords are not echoed
+
+        # The cheap hash verifies and is upgraded to the site's cost on first login
+        self.assertIn('$1000$', alice.user.password)
+        self.assertTrue(self.client.login(username='alice', password=password))
+        alice.user.refresh_from_db()
+        self.assertNotIn('$1000$', alice.user.password)
+
+    def test_command_writes_credentials(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'cohort.csv')
+            with open(path, 'w') as fh:
+                fh.write(self.CSV)
+            out = StringIO()
+            call_command('onboard_members', path, hash_iterations=1000, workers=1, stdout=out)
+            with open(path + '.credentials.csv') as fh:
+                rows = list(csv.DictReader(fh))
+        self.assertEqual([r['username'] for r in rows], ['alice', 'taken', 'carol'])
+        self.assertIn("Created 3 members", out.getvalue())
+
+
+@override_settings(LIBMGS_ANALYTICS={'SETTLE_SECONDS': 0})
+class AnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.members = []
+        for i in range(3):
+            user = User.objects.create_user(f'reader{i}', password='pw')
+            cls.members.append(Member.objects.create(user=user, membership_id=f'M{i}', phone_number='1', address='x'))
+        cls.books = {
+            name: Book.objects.create(title=f"Book {name}", author="Author", isbn=f"978000000090{i}", genre=genre)
+            for i, (name, genre) in enumerate([('A', 'Fantasy'), ('B', 'Fantasy'), ('C', 'Crime'), ('D', 'Fantasy')])
+        }
+        for member, names in zip(cls.members, ['AB', 'ABC', 'AD']):
+            for name in names:
+                cls.borrow(member, name)
+
+    @classmethod
+    def borrow(cls, member, name):
+        return Transaction.objects.create(book=cls.books[name], member=member,
+                                          expected_return_date=timezone.now() + loans.LOAN_PERIOD)
+
+    def setUp(self):
+        cache.clear()
+
+    def neighbours(self, name):
+        return [(row.other.title[-1], row.score) for row in analytics.also_borrowed(self.books[name].pk)]
+
+    def pairs(self):
+        return sorted(CoBorrow.objects.values_list('book_id', 'other_id', 'score'))
+
+    def test_refresh_is_incremental(self):
+        self.assertEqual(analytics.refresh(batch_size=2), 7)
+        self.assertEqual([(row.book.title, row.count) for row in analytics.most_borrowed(2)],
+                         [("Book A", 3), ("Book B", 2)])
+        self.assertEqual([row.book.title for row in analytics.trending_in_genre('Fantasy')],
+                         ["Book A", "Book B", "Book D"])
+        self.assertEqual(self.neighbours('A'), [('B', 2), ('C', 1), ('D', 1)])
+        self.assertEqual(analytics.refresh(), 0)
+
+        # A later run picks up only the new loan, pairing it with the member's earlier books.
+        latest = self.borrow(self.members[2], 'B')
+        self.assertEqual(analytics.refresh(), 1)
+        self.assertEqual(AnalyticsState.objects.get().last_transaction_id, latest.pk)
+        self.assertEqual(self.neighbours('A'), [('B', 3), ('C', 1), ('D', 1)])
+        self.assertEqual(self.neighbours('D'), [('A', 1), ('B', 1)])
+        incremental = self.pairs()
+
+        # Re-borrowing a book doesn't pair it again; a rebuild over archived loans agrees.
+        self.borrow(self.members[0], 'A')
+        Transaction.objects.update(status='Returned', actual_return_date=timezone.now() - timedelta(days=400))
+        archive.archive_loans(days=365)
+        self.assertEqual(analytics.refresh(rebuild=True), 9)
+        self.assertEqual(self.pairs(), incremental)
+        self.assertEqual(analytics.most_borrowed(1)[0].count, 4)
+
+    def test_refresh_without_upsert_target(self):
+        with without_upsert_target():
+            self.assertEqual(analytics.refresh(batch_size=2), 7)
+            self.borrow(self.members[2], 'B')
+            self.assertEqual(analytics.refresh(), 1)
+        self.assertEqual(self.neighbours('A'), [('B', 3), ('C', 1), ('D', 1)])
+        self.assertEqual(analytics.most_borrowed(2)[1].count, 3)
+
+    def test_skips_unsettled_loans_and_keeps_top_neighbours(self):
+        with override_settings(LIBMGS_ANALYTICS={'SETTLE_SECONDS': 60}):
+            self.assertEqual(analytics.refresh(), 0)
+        with override_settings(LIBMGS_ANALYTICS={'SETTLE_SECONDS': 0, 'NEIGHBOURS': 1}):
+            analytics.refresh()
+        self.assertEqual(self.neighbours('A'), [('B', 2)])
+        self.assertEqual(self.neighbours('C'), [('A', 1)])
+        self.assertEqual(CoBorrow.objects.count(), 4)
+
+    def test_pages(self):
+        call_command('refresh_analytics', stdout=StringIO(), stderr=StringIO())
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, "Most Borrowed This Month")
+        self.assertEqual(response.context['popular'][0].book, self.books['A'])
+        self.assertNotContains(self.client.get(reverse('index'), {'q': 'Book'}), "Most Borrowed This Month")
+
+        response = self.client.get(reverse('book_detail', args=[self.books['A'].pk]))
+        self.assertEqual([row.other.title for row in response.context['also_borrowed']],
+                         ["Book B", "Book C", "Book D"])
+        self.assertEqual([row.book.title for row in response.context['trending']], ["Book B", "Book D"])
+        self.assertContains(response, "Trending in Fantasy")
+
+
+class MemberLoanApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.reader = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=cls.reader, membership_id='M1', phone_number='1', address='x')
+        other = Member.objects.create(user=User.objects.create_user('other'), membership_id='M2',
+                                      phone_number='1', address='x')
+        now = timezone.now()
+        cls.books = [Book.objects.create(title=f"Book {i}", author="Author", isbn=f"97800000011{i:02}", genre="Misc",
+                                         total_copies=2, available_copies=2) for i in range(5)]
+        cls.loans = []
+        for i, (issued_days_ago, returned_days_ago) in enumerate([(800, 790), (60, 50), (20, None), (3, None)]):
+            loan = Transaction.objects.create(book=cls.books[i], member=cls.member,
+                                              expected_return_date=now - timedelta(days=issued_days_ago - 14))
+            Transaction.objects.filter(pk=loan.pk).update(
+                issue_date=now - timedelta(days=issued_days_ago),
+                status='Issued' if returned_days_ago is None else 'Returned',
+                actual_return_date=None if returned_days_ago is None else now - timedelta(days=returned_days_ago),
+            )
+            cls.loans.append(loan)
+        Transaction.objects.create(book=cls.books[0], member=other, expected_return_date=now)
+        archive.archive_loans(days=365)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def get(self, headers=None, **params):
+        return self.client.get(reverse('member_loans_api'), params, headers=headers)
+
+    def test_pages_through_live_and_archived_loans(self):
+        data = self.get(size=3).json()
+        self.assertEqual([loan['title'] for loan in data['loans']], ["Book 3", "Book 2", "Book 1"])
+        self.assertEqual(set(data['loans'][0]), {'id', 'title', 'isbn', 'issued', 'due', 'returned', 'status', 'fine'})
+        self.assertEqual((data['loans'][0]['status'], data['loans'][0]['returned']), ('Issued', None))
+
+        rest = self.client.get(data['next']).json()
+        self.assertEqual([(loan['title'], loan['status']) for loan in rest['loans']], [("Book 0", 'Returned')])
+        self.assertEqual(rest['loans'][0]['id'], self.loans[0].pk)
+        self.assertIsNone(rest['next'])
+        # Archived rows send due/returned as datetimes, like live ones.
+        archived, live = rest['loans'][0], data['loans'][2]
+        for loan in (archived, live):
+            for key in ('issued', 'due', 'returned'):
+                self.assertIsNotNone(datetime.fromisoformat(loan[key]).tzinfo, (loan['title'], key))
+
+        self.assertEqual([loan['title'] for loan in self.get(status='active').json()['loans']], ["Book 3", "Book 2"])
+        self.assertEqual([loan['title'] for loan in self.get(status='returned').json()['loans']], ["Book 1", "Book 0"])
+        self.assertEqual(self.get(status='lost').status_code, 400)
+
+        self.client.force_login(self.staff)
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_revalidation_until_loans_change(self):
+        response = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        # member validators only: no loan is read for a 304
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get({'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.get({'If-Modified-Since': last_modified}).status_code, 304)
+        self.assertNotEqual(self.get(size=1)['ETag'], etag)
+
+        for change in (
+            lambda: loans.issue_book(self.books[4], self.member),
+            lambda: loans.return_book(Transaction.objects.get(pk=self.loans[3].pk)),
+            lambda: fines.accrue_fines(),
+        ):
+            change()
+            response = self.get({'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+        self.assertEqual([(loan['title'], loan['fine']) for loan in response.json()['loans'][:3]],
+                         [("Book 4", '0.00'), ("Book 3", '0.00'), ("Book 2", '6.00')])
+
+
+class IdentityCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='pw', is_staff=True)
+        cls.reader = User.objects.create_user('reader', password='pw')
+        cls.member = Member.objects.create(user=cls.reader, membership_id='M1', phone_number='1', address='x')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_identity_costs_no_queries(self):
+        self.client.force_login(self.staff)
+        self.client.get(reverse('metrics'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+        self.client.force_login(self.reader)
+        self.client.get(reverse('dashboard'))
+        # holds, loans, archived loans: no session, user or member lookup
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+
+    def test_changes_evict_identity(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        self.staff.is_staff = False
+        self.staff.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+        self.assertEqual(identity.get_identity(self.reader.pk).member_profile.membership_id, 'M1')
+        Member.objects.filter(pk=self.member.pk).update(membership_id='M9')
+        Member.objects.get(pk=self.member.pk).save()
+        cached = identity.get_identity(self.reader.pk)
+        self.assertEqual(cached.member_profile.membership_id, 'M9')
+        # Fields outside the identity are read fresh.
+        with self.assertNumQueries(1):
+            self.assertEqual(cached.member_profile.address, 'x')
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.reader.set_password('new password')
+        self.reader.save()
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+    def test_password_hash_is_not_cached(self):
+        identity.get_identity(self.reader.pk)
+        entry = cache.get(identity.IDENTITY_KEY.format(self.reader.pk))
+        self.assertNotIn(self.reader.password, repr(entry))
+        self.assertNotIn('password', entry['user'])
+        cached = identity.get_identity(self.reader.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(cached.get_session_auth_hash(), self.reader.get_session_auth_hash())
+            self.assertTrue(cached.has_usable_password())
+        # A password set on the instance (a password change view) hashes the new one.
+        cached.set_password('new password')
+        self.assertNotEqual(cached.get_session_auth_hash(), self.reader.get_session_auth_hash())
+
+    def test_sessions_from_model_backend_still_work(self):
+        self.client.force_login(self.reader, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertFalse(self.client.login(username='reader', password='wrong'))
+        self.assertTrue(self.client.login(username='reader', password='pw'))
+
+    def test_async_member_profile(self):
+        cached = identity.get_identity(self.reader.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(identity.amember_profile)(cached).pk, self.member.pk)
+        self.assertIsNone(async_to_sync(identity.amember_profile)(User.objects.get(pk=self.staff.pk)))
+
+    def test_purge_expired_sessions(self):
+        model = identity.session_model()
+        now = timezone.now()
+        for i in range(5):
+            model.objects.create(session_key=f"expired{i}", session_data='', expire_date=now - timedelta(days=1))
+        model.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+        out = StringIO()
+        call_command('purge_sessions', batch_size=2, pause=0, stdout=out, stderr=StringIO())
+        self.assertIn("Deleted 5 expired session(s)", out.getvalue())
+        self.assertEqual(list(model.objects.values_list('session_key', flat=True)), ['live'])
+
+        with self.settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies'):
+            self.assertIsNone(identity.session_model())
+            self.assertEqual(identity.purge_expired_sessions(), 0)
+
+
+@override_settings(LIBMGS_REPLICAS={'ALIASES': ['replica1'], 'PIN_SECONDS': 5})
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions only; no queries run, so no replica database is needed."""
+
+    def call(self, view, method='get', cookies=None):
+        middleware = None
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = replicas.ReplicaMiddleware(get_response)
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return middleware(request)
+
+    @staticmethod
+    def reader(marked=True):
+        def view(request):
+            return HttpResponse(f"{Book.objects.all().db},{User.objects.all().db}")
+        return replicas.replica_reads(view) if marked else view
+
+    @staticmethod
+    def writer():
+        def view(request):
+            before = Book.objects.all().db
+            router.db_for_write(Book)
+            return HttpResponse(f"{before},{Book.objects.all().db}")
+        return replicas.replica_reads(view)
+
+    def test_only_marked_views_read_from_replicas(self):
+        self.assertEqual(self.call(self.reader()).content, b"replica1,default")
+        self.assertEqual(self.call(self.reader(marked=False)).content, b"default,default")
+        self.assertEqual(self.call(self.reader(), method='post').content, b"default,default")
+        self.assertEqual(Book.objects.all().db, 'default')
+        with override_settings(LIBMGS_REPLICAS={}):
+            self.assertEqual(self.call(self.reader()).content, b"default,default")
+
+    def test_writes_pin_reads_to_the_primary(self):
+        response = self.call(self.writer())
+        self.assertEqual(response.content, b"replica1,default")
+        cookie = response.cookies[replicas.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+
+        pinned = self.call(self.reader(), cookies={replicas.PIN_COOKIE: cookie.value})
+        self.assertEqual(pinned.content, b"default,default")
+        self.assertNotIn(replicas.PIN_COOKIE, pinned.cookies)
+        for stale in (str(time.time() - 1), 'garbage'):
+            self.assertEqual(self.call(self.reader(), cookies={replicas.PIN_COOKIE: stale}).content, b"replica1,default")
+
+
+@skipUnless(covers.Image, "building thumbnails needs Pillow")
+class CoverTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.source = os.path.join(tmp.name, 'source')
+        os.mkdir(self.source)
+        from PIL import Image
+        Image.effect_noise((900, 1400), 60).convert('RGB').save(os.path.join(self.source, 'dune.jpg'), quality=95)
+        Image.new('RGB', (300, 200), 'red').save(os.path.join(self.source, 'wide.png'))
+        with open(os.path.join(self.source, 'broken.jpg'), 'wb') as fh:
+            fh.write(b"not an image")
+        settings = override_settings(LIBMGS_COVERS={'ROOT': os.path.join(tmp.name, 'store'), 'SIZE': (120, 180)})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.fetched = []
+        fetcher = covers.LocalFetcher(self.source)
+        self.fetcher = lambda url: self.fetched.append(url) or fetcher(url)
+        url = 'https://covers.example.com/{}'.format
+        self.dune = Book.objects.create(title="Dune", author="Herbert", isbn="9780441172719", genre="SF",
+                                        cover_image_url=url('dune.jpg'))
+        self.dune_again = Book.objects.create(title="Dune (2nd ed.)", author="Herbert", isbn="9780441013593",
+                                              genre="SF", cover_image_url=url('dune.jpg'))
+        self.wide = Book.objects.create(title="Wide", author="W", isbn="9780306406157", genre="G",
+                                        cover_image_url=url('wide.png'))
+        Book.objects.create(title="Broken", author="B", isbn="9780547928227", genre="G", cover_image_url=url('broken.jpg'))
+        Book.objects.create(title="Missing", author="M", isbn="9780131103627", genre="G", cover_image_url=url('gone.jpg'))
+        Book.objects.create(title="Plain", author="P", isbn="9780262033848", genre="G")
+
+    def test_build_fetches_each_url_once(self):
+        result = covers.build_thumbnails(workers=3, fetcher=self.fetcher)
+        self.assertEqual((result.books, result.fetched, len(result.failed)), (3, 4, 2))
+        self.assertEqual(sorted(self.fetched), sorted(CoverImage.objects.values_list('source_url', flat=True)))
+        self.assertEqual(sorted(error.split(':')[0] for _, error in result.failed), ["no local file for https", "not a usable image"])
+
+        self.dune.refresh_from_db()
+        self.dune_again.refresh_from_db()
+        self.assertEqual(self.dune.cover_thumbnail, self.dune_again.cover_thumbnail)
+        from PIL import Image
+        with Image.open(covers.thumbnail_path(self.dune.cover_thumbnail)) as thumb:
+            self.assertEqual(thumb.size, (120, 180))
+        saved = CoverImage.objects.get(source_url=self.dune.cover_image_url)
+        self.assertLess(saved.thumbnail_bytes, saved.source_bytes)
+
+        # Failures aren't retried unless asked, and built covers are never fetched again.
+        self.fetched.clear()
+        self.assertEqual(covers.build_thumbnails(fetcher=self.fetcher).fetched, 0)
+        self.assertEqual(covers.build_thumbnails(fetcher=self.fetcher, retry_failed=True).fetched, 2)
+        self.assertEqual(len(self.fetched), 2)
+
+    def test_catalog_serves_lazy_thumbnails(self):
+        covers.build_thumbnails(fetcher=self.fetcher)
+        self.dune.refresh_from_db()
+        html = self.client.get(reverse('index')).content.decode()
+        self.assertIn(f'src="{self.dune.cover_thumbnail_url}"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertNotIn('covers.example.com', html)
+
+        response = self.client.get(self.dune.cover_thumbnail_url)
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(b''.join(response.streaming_content),
+                         covers.thumbnail_path(self.dune.cover_thumbnail).read_bytes())
+        response.close()
+        revalidated = self.client.get(self.dune.cover_thumbnail_url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.client.get(reverse('cover_thumbnail', args=['0' * 64])).status_code, 404)
+        self.assertEqual(self.client.get('/covers/..%2Fsecret.jpg').status_code, 404)
+
+    def test_thumbnail_changes_only_with_the_url(self):
+        covers.build_thumbnails(fetcher=self.fetcher)
+        self.dune.refresh_from_db()
+        digest = self.dune.cover_thumbnail
+
+        def edit(book, **changes):
+            data = {field: getattr(book, field) for field in BookForm.Meta.fields}
+            data.update(changes)
+            form = BookForm({k: v or '' for k, v in data.items()}, instance=book)
+            self.assertTrue(form.is_valid(), form.errors)
+            return form.save()
+
+        self.assertEqual(edit(self.dune, title="Dune (reissue)").cover_thumbnail, digest)
+        self.assertEqual(edit(self.dune, cover_image_url=self.wide.cover_image_url).cover_thumbnail,
+                         Book.objects.get(pk=self.wide.pk).cover_thumbnail)
+        self.assertEqual(edit(self.dune, cover_image_url='https://covers.example.com/new.jpg').cover_thumbnail, '')
+
+        imports.import_catalog(StringIO(
+            "isbn,title,author,genre,copies,cover_image_url\n"
+            f"9780441013593,Dune (2nd ed.),Herbert,SF,1,{self.dune_again.cover_image_url}\n"
+            "9780306406157,Wide,W,G,1,https://covers.example.com/other.png\n"
+        ), 'csv')
+        self.assertEqual(Book.objects.get(pk=self.dune_again.pk).cover_thumbnail, digest)
+        self.assertEqual(Book.objects.get(pk=self.wide.pk).cover_thumbnail, '')
+
+    def test_report_bytes_saved_per_page(self):
+        out = StringIO()
+        call_command('build_covers', '--from-dir', self.source, stdout=out, stderr=StringIO())
+        self.assertIn("Thumbnails for 3 book(s) (0 reusing an earlier fetch), 4 URL(s) fetched, 2 failed", out.getvalue())
+
+        rows = list(covers.page_savings(page_size=4))
+        sizes = CoverImage.objects.exclude(digest='')
+        self.assertEqual([(page, n) for page, n, _, _ in rows], [(1, 2), (2, 1)])
+        self.assertEqual(sum(full for _, _, full, _ in rows), sum(2 * row.source_bytes if 'dune' in row.source_url
+                                                                  else row.source_bytes for row in sizes))
+        out = StringIO()
+        call_command('build_covers', '--report', stdout=out)
+        self.assertIn("1 page(s):", out.getvalue())
+        self.assertIn("per page on average", out.getvalue())
@@ -9,6 +9,17 @@ urlpatterns = [
     path('issue/', views.issue_book, name='issue_book'),
     path('transactions/', views.all_transactions, name='all_transactions'),
     path('return/<int:transaction_id>/', views.return_book, name='return_book'),
+    path('issue/batch/', views.issue_batch, name='issue_batch'),
+    path('return/batch/', views.return_batch, name='return_batch'),
+    path('books/<int:pk>/', views.book_detail, name='book_detail'),
+    path('covers/<str:digest>.jpg', views.cover_thumbnail, name='cover_thumbnail'),
+    path('holds/place/<int:book_id>/', views.place_hold, name='place_hold'),
+    path('holds/<int:hold_id>/cancel/', views.cancel_hold, name='cancel_hold'),
+    path('export/<str:kind>/', views.export_data, name='export_data'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('api/loans/', views.member_loans_api, name='member_loans_api'),
+    path('api/availability/', views.availability_batch, name='availability_batch'),
+    path('api/availability/<str:isbn>/', views.availability_view, name='availability'),
     
     # CRUD URLs
     path('books/manage/', views.manage_books, name='manage_books'),
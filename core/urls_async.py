@@ -0,0 +1,11 @@
+from django.urls import path
+from . import async_views
+
+# Async versions of the read-heavy pages. libmgs/urls_async.py routes these
+# ahead of core.urls, so the paths and names must match the sync ones.
+urlpatterns = [
+    path('', async_views.index, name='index'),
+    path('dashboard/', async_views.member_dashboard, name='dashboard'),
+    path('admin-dashboard/', async_views.admin_dashboard, name='admin_dashboard'),
+    path('transactions/', async_views.all_transactions, name='all_transactions'),
+]
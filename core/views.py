@@ -1,33 +1,135 @@
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import login
 from django.contrib import messages
+from django.views.decorators.http import require_GET, require_POST
 from django.utils import timezone
-from django.db.models import Q, Count, Sum
-from .models import Book, Transaction, Member
-from .forms import IssueBookForm, MemberSignUpForm, BookForm
+from django.utils.cache import get_conditional_response
+from django.db.models import Value
+from django.utils.http import http_date, quote_etag
+from .models import ArchivedTransaction, Book, Hold, Transaction, Member
+from .forms import IssueBookForm, MemberSignUpForm, BookForm, PlaceHoldForm
+from . import (
+    analytics, archive, availability, catalog_cache, covers, exports, holds, loans, metrics, replicas, search, stats,
+)
+from .pagination import keyset_paginate, keyset_paginate_many
+from .replicas import replica_reads
+
+# Column projections for list pages: fetch only what the templates render.
+CATALOG_FIELDS = catalog_cache.CARD_FIELDS
+MANAGE_BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'available_copies', 'total_copies')
+MEMBER_LOAN_FIELDS = (
+    'id', 'issue_date', 'expected_return_date', 'actual_return_date', 'status', 'fine_amount', 'book__title',
+)
+# Thumbnails never change under a given name.
+COVER_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+ACTIVE_LOAN_FIELDS = (
+    'id', 'issue_date', 'expected_return_date', 'book__title', 'member__membership_id', 'member__user__username',
+)
+ARCHIVED_LOAN_FIELDS = (
+    'id', 'issue_date', 'expected_return_date', 'actual_return_date', 'fine_amount', 'book__title',
+)
+MEMBER_HOLD_FIELDS = ('id', 'status', 'created_at', 'ready_until', 'book__title')
+# Loan API rows: (payload key, column), read with values() in one joined query per table.
+LOAN_API_COLUMNS = (
+    ('id', 'id'), ('title', 'book__title'), ('isbn', 'book__isbn'), ('issued', 'issue_date'),
+    ('due', 'expected_return_date'), ('returned', 'actual_return_date'), ('status', 'status'), ('fine', 'fine_amount'),
+)
+LOAN_API_STATUSES = ('all', 'active', 'returned')
+
+def member_loans(member):
+    """A member's loans and archived loans, as two newest-first querysets for archive.merge_history()."""
+    return (
+        Transaction.objects.for_member(member).select_related('book').only(*MEMBER_LOAN_FIELDS).order_by('-issue_date'),
+        ArchivedTransaction.objects.for_member(member).select_related('book')
+        .only(*ARCHIVED_LOAN_FIELDS).order_by('-issue_date'),
+    )
+
+def member_holds(member):
+    """A member's open holds, oldest first, with their queue positions."""
+    return (
+        Hold.objects.open().filter(member=member)
+        .select_related('book').only(*MEMBER_HOLD_FIELDS)
+        .with_positions().order_by('created_at', 'id')
+    )
 
+@replica_reads
 def index(request):
     """Homepage: Display a list of all available books with search."""
     query = request.GET.get('q')
-    if query:
-        books = Book.objects.filter(
-            Q(title__icontains=query) | 
-            Q(author__icontains=query) |
-            Q(genre__icontains=query)
-        )
+    key = catalog_cache.page_key(request)
+    entry = catalog_cache.get_page(key)
+    if entry is not None:
+        page, books = entry
     else:
-        books = Book.objects.all().order_by('title')
-    
-    return render(request, 'index.html', {'books': books, 'search_query': query})
+        if query:
+            # Ranked lookup through the inverted index (prefix + typo tolerant)
+            page = keyset_paginate(request, search.ranked_queryset(query), ('-score', 'book_id'))
+            books = search.books_for_ids([row['book_id'] for row in page], fields=CATALOG_FIELDS)
+        else:
+            page = keyset_paginate(request, Book.objects.only(*CATALOG_FIELDS), ('title', 'id'))
+            books = page.object_list
+        catalog_cache.set_page(key, page, books)
+    return render_catalog(request, query, key, page, books, fresh=entry is None)
+
+def render_catalog(request, query, key, page, books, fresh):
+    """Render a catalog/search page from cached cards (shared with the async index view)."""
+    versions = catalog_cache.card_versions([book.pk for book in books]) if key else None
+    html_key = catalog_cache.html_key(request, key, versions)
+    html = catalog_cache.get_html(html_key)
+    if html is not None:
+        return HttpResponse(html)
+
+    cards = catalog_cache.render_cards(books, versions, fresh=fresh)
+    # The first page of the plain catalog leads with this month's most borrowed books.
+    popular = analytics.popular_this_month() if not query and not page.has_previous else []
+    response = render(request, 'index.html', {
+        'books': books, 'cards': cards, 'page': page, 'search_query': query, 'popular': popular,
+    })
+    catalog_cache.set_html(html_key, response, versions)
+    return response
+
+@replica_reads
+def book_detail(request, pk):
+    """A book's page, with what its borrowers also borrowed and what's trending in its genre."""
+    book = get_object_or_404(Book.objects.only(*CATALOG_FIELDS, 'isbn', 'total_copies'), pk=pk)
+    trending = [row for row in analytics.trending_in_genre(book.genre, 6) if row.book_id != book.pk]
+    return render(request, 'catalog/book_detail.html', {
+        'book': book,
+        'also_borrowed': analytics.also_borrowed(book.pk),
+        'trending': trending[:5],
+    })
 
+@require_GET
+def cover_thumbnail(request, digest):
+    """A cover thumbnail from core.covers' store. Named by its content, so browsers may keep it for a year."""
+    try:
+        path = covers.thumbnail_path(digest)
+        response = get_conditional_response(request, etag=quote_etag(digest)) or FileResponse(
+            open(path, 'rb'), content_type='image/jpeg')
+    except (ValueError, FileNotFoundError):
+        raise Http404("No such cover.")
+    response['ETag'] = quote_etag(digest)
+    response['Cache-Control'] = COVER_CACHE_CONTROL
+    return response
+
+@replica_reads
 @login_required
 def member_dashboard(request):
     """User dashboard showing their borrowed books."""
     try:
         member = request.user.member_profile
-        transactions = Transaction.objects.filter(member=member).order_by('-issue_date')
-        return render(request, 'member_dashboard.html', {'transactions': transactions})
+        transactions = archive.merge_history(*member_loans(member))
+        return render(request, 'member_dashboard.html', {
+            'transactions': transactions,
+            'holds': member_holds(member),
+        })
     except Member.DoesNotExist:
         # Redirect staff to admin dashboard if they accidentally go here
         if request.user.is_staff:
@@ -36,54 +138,49 @@ def member_dashboard(request):
         return redirect('index')
 
 # --- NEW ADMIN DASHBOARD VIEW ---
+@replica_reads
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def admin_dashboard(request):
     """Central hub for Librarians to manage the system."""
     
-    # 1. Calculate Stats
-    total_books = Book.objects.aggregate(total=Sum('total_copies'))['total'] or 0
-    books_issued = Transaction.objects.filter(status='Issued').count()
-    books_available = total_books - books_issued
-    total_members = Member.objects.count()
+    # 1. Stats come from the incrementally maintained summary (cached), not table scans
+    context = dict(stats.get_dashboard_stats())
     
     # 2. Get Recent Activity
-    recent_transactions = Transaction.objects.select_related('book', 'member__user').order_by('-issue_date')[:5]
-    
-    # 3. Check for Overdue Books
-    overdue_transactions = Transaction.objects.filter(
-        status='Issued', 
-        expected_return_date__lt=timezone.now()
-    ).count()
-
-    context = {
-        'total_books': total_books,
-        'books_issued': books_issued,
-        'books_available': books_available,
-        'total_members': total_members,
-        'recent_transactions': recent_transactions,
-        'overdue_count': overdue_transactions,
-    }
+    context['recent_transactions'] = Transaction.objects.with_related().order_by('-issue_date')[:5]
     return render(request, 'admin_dashboard.html', context)
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def issue_book(request):
-    """Admin view to issue a book."""
+    """Admin view to issue a book (or, with action=hold, queue the member for it)."""
     if request.method == 'POST':
-        form = IssueBookForm(request.POST)
-        if form.is_valid():
+        placing_hold = request.POST.get('action') == 'hold'
+        form = (PlaceHoldForm if placing_hold else IssueBookForm)(request.POST)
+        if form.is_valid() and placing_hold:
+            book = form.cleaned_data['book_obj']
+            member = form.cleaned_data['member_obj']
+            try:
+                hold = holds.place_hold(book, member)
+            except holds.HoldError as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, f"{member.user.username} is number {holds.queue_position(hold)} "
+                                          f"in the queue for '{book.title}'.")
+                return redirect('issue_book')
+        elif form.is_valid():
             book = form.cleaned_data['book_obj']
             member = form.cleaned_data['member_obj']
             
-            Transaction.objects.create(book=book, member=member)
-            
-            # Decrease available copies
-            book.available_copies -= 1
-            book.save()
-            
-            messages.success(request, f"Book '{book.title}' issued to {member.user.username}.")
-            return redirect('issue_book')
+            # Availability is re-checked atomically; another desk may have taken the last copy
+            try:
+                loans.issue_book(book, member)
+            except loans.LoanError as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, f"Book '{book.title}' issued to {member.user.username}.")
+                return redirect('issue_book')
     else:
         form = IssueBookForm()
     
@@ -93,35 +190,224 @@ def issue_book(request):
 @user_passes_test(lambda u: u.is_staff)
 def return_book(request, transaction_id):
     """Admin action to return a book."""
-    transaction = get_object_or_404(Transaction, id=transaction_id)
+    transaction = get_object_or_404(Transaction.objects.only('id', 'book_id', 'member_id', 'status', 'expected_return_date', 'fine_amount'), id=transaction_id)
     
-    if transaction.status == 'Returned':
-        messages.warning(request, "This book is already returned.")
+    try:
+        # Fine logic ($1 per day overdue) lives in the loan service
+        loans.return_book(transaction)
+    except loans.AlreadyReturned as e:
+        messages.warning(request, str(e))
         return redirect('all_transactions')
 
-    transaction.status = 'Returned'
-    transaction.actual_return_date = timezone.now()
-    
-    # Calculate fine logic ($1 per day overdue)
-    if transaction.actual_return_date > transaction.expected_return_date:
-        overdue_days = (transaction.actual_return_date - transaction.expected_return_date).days
-        transaction.fine_amount = overdue_days * 1.00
-        
-    transaction.save()
-    
-    # Increase available copies
-    transaction.book.available_copies += 1
-    transaction.book.save()
-    
     messages.success(request, f"Book returned. Fine: ${transaction.fine_amount}")
     return redirect('all_transactions')
 
+# --- HOLDS ---
+
+@login_required
+def place_hold(request, book_id):
+    """Join a book's waitlist: GET shows the queue length, POST places the hold."""
+    book = get_object_or_404(Book.objects.only('id', 'title', 'author', 'available_copies'), pk=book_id)
+    try:
+        member = request.user.member_profile
+    except Member.DoesNotExist:
+        messages.error(request, "You do not have a member profile linked.")
+        return redirect('index')
+
+    if request.method == 'POST':
+        try:
+            hold = holds.place_hold(book, member)
+        except holds.HoldError as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Hold placed on '{book.title}'. You are number {holds.queue_position(hold)} in the queue.")
+        return redirect('dashboard')
+    return render(request, 'holds/confirm_hold.html', {'book': book, 'waiting': Hold.objects.queue(book.pk).count()})
+
+@login_required
+@require_POST
+def cancel_hold(request, hold_id):
+    """Withdraw a hold; members can only cancel their own, staff any."""
+    queryset = Hold.objects.only('id', 'book_id', 'status')
+    if not request.user.is_staff:
+        queryset = queryset.filter(member__user=request.user)
+    hold = get_object_or_404(queryset, pk=hold_id)
+    try:
+        holds.cancel_hold(hold)
+    except holds.HoldError as e:
+        messages.warning(request, str(e))
+    else:
+        messages.success(request, "Hold cancelled.")
+    return redirect('dashboard')
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def issue_batch(request):
+    """Bulk issue: {"items": [{"isbn": "...", "membership_id": "..."}, ...]}"""
+    data = _json_body(request)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not all(
+        isinstance(i, dict) and isinstance(i.get('isbn'), str) and isinstance(i.get('membership_id'), str)
+        for i in items
+    ):
+        return JsonResponse({'error': "Expected {'items': [{'isbn', 'membership_id'}, ...]}."}, status=400)
+    try:
+        results = loans.issue_batch(items)
+    except loans.LoanError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'issued': sum(r['ok'] for r in results), 'results': results})
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def return_batch(request):
+    """Bulk return: {"transaction_ids": [1, 2, ...]}"""
+    data = _json_body(request)
+    ids = data.get('transaction_ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return JsonResponse({'error': "Expected {'transaction_ids': [int, ...]}."}, status=400)
+    try:
+        results = loans.return_batch(ids)
+    except loans.LoanError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'returned': sum(r['ok'] for r in results), 'results': results})
+
+@replica_reads
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def all_transactions(request):
     """Admin view to see active loans."""
-    transactions = Transaction.objects.filter(status='Issued').order_by('expected_return_date')
-    return render(request, 'all_transactions.html', {'transactions': transactions})
+    transactions = Transaction.objects.active().with_related().only(*ACTIVE_LOAN_FIELDS)
+    page = keyset_paginate(request, transactions, ('expected_return_date', 'id'), default_size=50)
+    return render(request, 'transactions/all_transactions.html', {
+        'transactions': page.object_list,
+        'page': page,
+        'now': timezone.now(),
+    })
+
+@replica_reads
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def export_data(request, kind):
+    """Stream the loan history or catalog as CSV/JSON (optionally gzipped)."""
+    if kind not in exports.KINDS:
+        raise Http404("Unknown export.")
+    fmt = request.GET.get('format', 'csv')
+    compress = request.GET.get('gzip') in ('1', 'true', 'yes')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest(f"format must be one of {', '.join(exports.FORMATS)}")
+    try:
+        filters = exports.parse_filters(request.GET.get('from'), request.GET.get('to'), request.GET.get('status'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(
+        exports.stream(kind, fmt, filters, compress, using=replicas.read_alias()),
+        content_type='application/gzip' if compress else ('text/csv' if fmt == 'csv' else 'application/json'),
+    )
+    response['Content-Disposition'] = f'attachment; filename="{exports.filename(kind, fmt, compress)}"'
+    return response
+
+def _conditional_json(request, payload):
+    """JSON response tagged with a hash of its body; a matching If-None-Match gets a bodiless 304."""
+    body = json.dumps(payload, separators=(',', ':'))
+    etag = quote_etag(hashlib.md5(body.encode(), usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag) or HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+def _loan_api_row(row):
+    loan = {key: row[column] for key, column in LOAN_API_COLUMNS}
+    for key in ('issued', 'due', 'returned'):
+        value = loan[key]
+        if value is not None:
+            if not isinstance(value, datetime.datetime):
+                # Archived loans keep plain dates; send the start of that day like a live loan's datetime
+                value = timezone.make_aware(datetime.datetime.combine(value, datetime.time.min))
+            loan[key] = value.isoformat()
+    loan['fine'] = str(loan['fine'])
+    return loan
+
+@replica_reads
+@login_required
+@require_GET
+def member_loans_api(request):
+    """
+    The signed-in member's loans, newest first: {"loans": [...], "next": url or null}.
+    ?status=active|returned filters, ?size= and the `next` link page through them.
+
+    ETag and Last-Modified come from Member.loans_changed_at, so a client
+    revalidating an unchanged list gets a 304 before any loan is read.
+    """
+    status = request.GET.get('status', 'all')
+    if status not in LOAN_API_STATUSES:
+        return JsonResponse({'error': f"status must be one of {', '.join(LOAN_API_STATUSES)}"}, status=400)
+    try:
+        member = Member.objects.only('id', 'joined_at', 'loans_changed_at').get(user=request.user)
+    except Member.DoesNotExist:
+        return JsonResponse({'error': "You do not have a member profile linked."}, status=404)
+
+    changed = member.loans_changed_at or member.joined_at
+    raw = f"{member.pk}:{changed.isoformat()}:{request.GET.urlencode()}"
+    etag = quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest())
+    last_modified = int(changed.timestamp())
+    # If-None-Match wins over If-Modified-Since, so clients sending the ETag
+    # never miss two changes within the same second.
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        columns = [column for _, column in LOAN_API_COLUMNS]
+        live = Transaction.objects.for_member(member)
+        if status != 'all':
+            live = live.filter(status='Issued' if status == 'active' else 'Returned')
+        querysets = [live.values(*columns)]
+        if status != 'active':
+            querysets.append(ArchivedTransaction.objects.for_member(member)
+                             .annotate(status=Value('Returned')).values(*columns))
+        page = keyset_paginate_many(request, querysets, ('-issue_date', '-id'))
+        response = JsonResponse({
+            'loans': [_loan_api_row(row) for row in page],
+            'next': f"{request.path}?{page.next_query}" if page.has_next else None,
+        }, json_dumps_params={'separators': (',', ':')})
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@replica_reads
+@require_GET
+def availability_view(request, isbn):
+    """Copies of one ISBN, for kiosks and the desk: {"isbn", "available_copies", "total_copies"}."""
+    isbn = isbn.strip()
+    result = availability.lookup([isbn])[isbn]
+    if result is None:
+        return JsonResponse({'error': "Book with this ISBN not found."}, status=404)
+    return _conditional_json(request, {'isbn': isbn, **result})
+
+@replica_reads
+@require_GET
+def availability_batch(request):
+    """Availability of many ISBNs (?isbn=A&isbn=B or ?isbns=A,B): {"results": {isbn: {...} or null}}."""
+    raw = request.GET.getlist('isbn') + [isbn for value in request.GET.getlist('isbns') for isbn in value.split(',')]
+    isbns = list(dict.fromkeys(isbn.strip() for isbn in raw if isbn.strip()))
+    if not isbns:
+        return JsonResponse({'error': "Pass one or more ISBNs as ?isbn=... or ?isbns=a,b."}, status=400)
+    if len(isbns) > availability.MAX_BATCH_SIZE:
+        return JsonResponse({'error': f"At most {availability.MAX_BATCH_SIZE} ISBNs per request."}, status=400)
+    return _conditional_json(request, {'results': availability.lookup(isbns)})
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def metrics_view(request):
+    """Per-view request metrics in the Prometheus text format."""
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 def signup(request):
     """Handle user registration."""
@@ -132,7 +418,7 @@ def signup(request):
         form = MemberSignUpForm(request.POST)
         if form.is_valid():
             user = form.save()
-            login(request, user) # Log them in immediately after signup
+            login(request, user, backend=settings.AUTHENTICATION_BACKENDS[0]) # Log them in immediately after signup
             messages.success(request, "Registration successful! Welcome to LibMGS.")
             return redirect('dashboard')
     else:
@@ -142,12 +428,13 @@ def signup(request):
 
 # --- NEW DBMS CRUD OPERATIONS ---
 
+@replica_reads
 @login_required
 @user_passes_test(lambda u: u.is_staff)
 def manage_books(request):
     """READ: View all books with edit/delete options."""
-    books = Book.objects.all()
-    return render(request, 'manage_books.html', {'books': books})
+    page = keyset_paginate(request, Book.objects.only(*MANAGE_BOOK_FIELDS), ('title', 'id'), default_size=50)
+    return render(request, 'manage_books.html', {'books': page.object_list, 'page': page})
 
 @login_required
 @user_passes_test(lambda u: u.is_staff)
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'libmgs.settings')
+# Serve the native async views (see ROOT_URLCONF in settings).
+os.environ.setdefault('LIBMGS_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,20 +42,27 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'libmgs.urls'
+# libmgs/asgi.py sets LIBMGS_ASYNC_VIEWS=1 so ASGI servers route the read-heavy
+# pages to the native async views (core/async_views.py); WSGI keeps the sync ones.
+LIBMGS_ASYNC_VIEWS = os.environ.get('LIBMGS_ASYNC_VIEWS') == '1'
+
+ROOT_URLCONF = 'libmgs.urls_async' if LIBMGS_ASYNC_VIEWS else 'libmgs.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for the request metrics
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -81,9 +89,157 @@ DATABASES = {
        'PASSWORD': '',
        'HOST': 'localhost', # Or your database server's IP
        'PORT': '3306', # Default MySQL port
+       # Keep connections open between requests (seconds), checking they're alive before reuse
+       'CONN_MAX_AGE': int(os.environ.get('LIBMGS_CONN_MAX_AGE', 60)),
+       'CONN_HEALTH_CHECKS': True,
    }
 }
 
+# Local stand-in for a primary/replica deployment: LIBMGS_SQLITE=/path/primary.sqlite3
+# runs on SQLite, and LIBMGS_DB_REPLICAS then lists SQLite files (copies of the
+# primary) instead of MySQL hosts.
+if os.environ.get('LIBMGS_SQLITE'):
+    DATABASES['default'].update(ENGINE='django.db.backends.sqlite3', NAME=os.environ['LIBMGS_SQLITE'])
+
+# Read replicas (core/replicas.py): LIBMGS_DB_REPLICAS="host1,host2" adds aliases
+# replica1, replica2, ... with the primary's credentials. PIN_SECONDS keeps a
+# browser's reads on the primary after it writes; it should exceed replica lag.
+_replica_key = 'NAME' if os.environ.get('LIBMGS_SQLITE') else 'HOST'
+for _i, _location in enumerate(filter(None, os.environ.get('LIBMGS_DB_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{_i}'] = {**DATABASES['default'], _replica_key: _location.strip(), 'TEST': {'MIRROR': 'default'}}
+
+LIBMGS_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'PIN_SECONDS': 5,
+}
+DATABASE_ROUTERS = ['core.replicas.PrimaryReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# LocMemCache is per-process. To share the dashboard counters between workers,
+# switch to one of the commented backends (the database cache needs
+# `python manage.py createcachetable`).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'libmgs',
+    }
+    # 'default': {
+    #     'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    #     'LOCATION': BASE_DIR / 'cache',
+    # }
+    # 'default': {
+    #     'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    #     'LOCATION': 'libmgs_cache',
+    # }
+}
+
+# Seconds the assembled admin dashboard stats may be served from cache.
+LIBMGS_STATS_CACHE_TTL = 30
+
+# Public catalog cache (see core/catalog_cache.py): pages and per-book cards,
+# invalidated through versioned keys. TTL (seconds) only bounds how long
+# unreachable entries linger.
+LIBMGS_CATALOG_CACHE = {
+    'ENABLED': True,
+    'TTL': 600,
+}
+
+# In-process ISBN -> copies cache behind /api/availability/ (see core/availability.py).
+# TTL (seconds) bounds how long another worker process's writes can go unseen.
+LIBMGS_AVAILABILITY = {
+    'MAX_ENTRIES': 50000,
+    'TTL': 10,
+}
+
+# Overdue fine policy used by returns and the accrue_fines command.
+# RATE per full day overdue, GRACE_DAYS before charging starts, optional CAP per loan.
+LIBMGS_FINES = {
+    'RATE': '1.00',
+    'GRACE_DAYS': 0,
+    'CAP': None,
+}
+
+# Borrowing limits (core/borrowing.py), checked against per-member counters:
+# at most MAX_LOANS open loans, MAX_OVERDUE overdue loans and MAX_FINES owed
+# to borrow another book. None turns a limit off.
+LIBMGS_BORROWING = {
+    'MAX_LOANS': 10,
+    'MAX_OVERDUE': 0,
+    'MAX_FINES': '10.00',
+}
+
+# Holds (core/holds.py): how long a returned copy stays set aside for the
+# member at the head of the queue before `manage.py expire_holds` passes it on.
+LIBMGS_HOLDS = {
+    'PICKUP_DAYS': 3,
+}
+
+# Loan archival (core/archive.py, `manage.py archive_loans`): returned loans
+# older than AFTER_DAYS move to the archive table, BATCH_SIZE rows per transaction.
+LIBMGS_ARCHIVE = {
+    'AFTER_DAYS': 365,
+    'BATCH_SIZE': 1000,
+}
+
+# Popularity and "also borrowed" tables (core/analytics.py, `manage.py refresh_analytics`).
+# BATCH_SIZE loans per transaction; NEIGHBOURS books kept per book; a loan pairs with the
+# member's last HISTORY_LIMIT books. CACHE_TTL (seconds) for the front-page list.
+LIBMGS_ANALYTICS = {
+    'BATCH_SIZE': 50000,
+    'NEIGHBOURS': 20,
+    'HISTORY_LIMIT': 20,
+    'WEEKS_KEPT': 12,
+    'SETTLE_SECONDS': 60,
+    'CACHE_TTL': 300,
+}
+
+# Cover thumbnails (core/covers.py, `manage.py build_covers`): each cover URL is
+# fetched once and shrunk to SIZE into ROOT, WORKERS fetches at a time.
+LIBMGS_COVERS = {
+    'ROOT': BASE_DIR / 'covers',
+    'SIZE': (240, 360),
+    'QUALITY': 80,
+    'WORKERS': 8,
+    'TIMEOUT': 10,
+    'MAX_BYTES': 5 * 1024 * 1024,
+    'FETCHER': 'core.covers.fetch_url',
+}
+
+# Logged-in identity (core/identity.py): each user's identity fields and member
+# ID are cached for TTL seconds and evicted when they change. ModelBackend stays
+# listed so sessions logged in through it before the cache keep working.
+AUTHENTICATION_BACKENDS = [
+    'core.identity.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+LIBMGS_IDENTITY_CACHE = {
+    'TTL': 300,
+}
+
+# Sessions are read from the cache and written through to the database
+# (`manage.py purge_sessions` deletes expired rows). Like the identity cache this
+# needs a shared CACHES backend once there is more than one worker process, or a
+# logout in one process isn't seen by the others. LIBMGS_SESSION_ENGINE=
+# django.contrib.sessions.backends.signed_cookies keeps sessions in the cookie
+# instead, with no session table at all, but they can't be revoked server-side.
+SESSION_ENGINE = os.environ.get('LIBMGS_SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Per-view request metrics (served at /metrics/ to staff). SLOW_REQUEST_MS logs
+# any slower request, with its SQL, to the 'core.slow_requests' logger; None disables it.
+LIBMGS_METRICS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': None,
+}
+
+# core_txn_active_due is a partial index and core_hold_one_open_per_member a
+# conditional unique constraint. MySQL supports neither and Django skips them
+# there by design: core_txn_status_due covers the same loan queries and
+# core.holds checks for duplicate holds itself, so the warnings are noise.
+SILENCED_SYSTEM_CHECKS = ['models.W036', 'models.W037']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
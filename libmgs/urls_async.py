@@ -0,0 +1,13 @@
+"""
+Root URLconf for ASGI deployments (selected by LIBMGS_ASYNC_VIEWS in settings).
+
+Same URLs as libmgs/urls.py, with the read-heavy pages served by the native
+async views in core/async_views.py.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('', include('core.urls_async')),
+] + sync_urlpatterns